@@ -1,15 +1,21 @@
+import hashlib
 import html
+import json
 import re
+import secrets
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import PureWindowsPath
 
+import flask
 import pandas as pd
 from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from sqlalchemy import bindparam, text
 
 from archives_application import db, utils
+from archives_application.archiver.project_membership import current_membership_project_ids
 from archives_application.models import (
     ArchiveSearchRunModel,
     CAANModel,
@@ -21,6 +27,7 @@ from archives_application.models import (
 SEARCH_MODE_LABELS = {
     "filename_only": "Filename only",
     "filepath": "Filename/path",
+    "filename_fragment": "Filename fragment/fuzzy",
     "content": "Document text",
     "combined": "Filename/path + document text",
 }
@@ -34,6 +41,7 @@ SCOPE_LABELS = {
 
 THIN_TEXT_THRESHOLD = 50
 LOW_CONTEXT_TEXT_THRESHOLD = 200
+TRIGRAM_MIN_FRAGMENT_LENGTH = 3
 IMAGE_EXTENSIONS = {"jpg", "jpeg", "tif", "tiff", "png", "gif", "bmp"}
 UNSUPPORTED_OR_LOW_VALUE_EXTENSIONS = {
     "zip", "lnk", "mov", "mp4", "avi", "dwg", "dxf", "pl", "tfw", "plt",
@@ -125,6 +133,7 @@ class ArchiveSearchRequest:
             "scope_value",
             "extensions",
             "limit",
+            "async",
         }
         unknown_fields = sorted(set(payload) - allowed_fields)
         if unknown_fields:
@@ -143,7 +152,7 @@ class ArchiveSearchRequest:
         search_mode = payload.get("search_mode", "combined")
         if not isinstance(search_mode, str) or search_mode.strip().lower() not in API_SEARCH_MODES:
             raise ArchiveSearchAPIValidationError(
-                "search_mode must be one of: combined, filename_only, filepath, content."
+                "search_mode must be one of: combined, filename_only, filepath, filename_fragment, content."
             )
 
         scope_type = payload.get("scope_type", "all")
@@ -200,6 +209,8 @@ class ScopeResolution:
     roots_with_no_indexed_files: list[str] = field(default_factory=list)
     caan_found: bool | None = None
     linked_project_count: int = 0
+    project_ids: list[int] = field(default_factory=list)
+    unmembered_prefixes: list[str] = field(default_factory=list)
 
     @property
     def has_scope(self) -> bool:
@@ -254,36 +265,58 @@ def _location_input_to_prefix(location_value: str, app) -> str:
     return _clean_archive_prefix(location_value)
 
 
-def _like_pattern(prefix: str) -> str:
-    """Build an escaped LIKE pattern for descendants of a directory prefix."""
-    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
-    return f"{escaped}/%"
-
-
 def _scope_clause(column_expr: str, prefixes: list[str], params: dict) -> str:
-    """Build a directory-boundary SQL predicate for the supplied prefixes."""
+    """Build a directory-boundary SQL predicate on a directory_path column for the supplied prefixes."""
     if not prefixes:
         return "TRUE"
-    clauses = []
-    for idx, prefix in enumerate(prefixes):
-        exact_key = f"scope_prefix_{idx}"
-        like_key = f"scope_like_{idx}"
-        params[exact_key] = prefix
-        params[like_key] = _like_pattern(prefix)
-        clauses.append(
-            f"({column_expr} = :{exact_key} OR {column_expr} LIKE :{like_key} ESCAPE '\\')"
-        )
+    clauses = [
+        utils.FileServerUtils.db_subtree_sql(column_expr, prefix, params, key=f"scope_{idx}")
+        for idx, prefix in enumerate(prefixes)
+    ]
     return "(" + " OR ".join(clauses) + ")"
 
 
-def _scope_paths_values(prefixes: list[str], params: dict) -> str:
-    """Build a parameterized VALUES list for scope-prefix SQL CTEs."""
-    values = []
-    for idx, prefix in enumerate(prefixes):
-        key = f"scope_value_{idx}"
-        params[key] = prefix
-        values.append(f"(:{key})")
-    return ", ".join(values)
+def _use_project_membership(scope: ScopeResolution) -> bool:
+    """
+    Return True when some of the scope's roots are resolved through the precomputed project_file_hashes membership
+    (scope.project_ids); its other roots (scope.unmembered_prefixes) are matched by path prefix.
+    """
+    return bool(scope.project_ids)
+
+
+def _resolve_project_membership(resolution: ScopeResolution, projects_by_root: dict[str, list[int]]):
+    """
+    Split the roots of a project or CAAN scope between the project_file_hashes membership and path prefix matching,
+    and find the roots with no indexed files. A root uses the membership only when all of its projects have
+    membership built from their current file_server_location; the roots of projects that the project sync added or
+    relocated since their membership was last refreshed fall back to prefix matching.
+    """
+    current_ids = set()
+    if flask.current_app.config.get("ARCHIVE_SEARCH_PROJECT_MEMBERSHIP", True):
+        current_ids = set(current_membership_project_ids(db=db, project_ids=resolution.project_ids))
+    membership_roots = {root: ids for root, ids in projects_by_root.items() if current_ids.issuperset(ids)}
+    resolution.project_ids = sorted({project_id for ids in membership_roots.values() for project_id in ids})
+    resolution.unmembered_prefixes = sorted(set(projects_by_root) - set(membership_roots))
+    resolution.roots_with_no_indexed_files = sorted(
+        _project_roots_with_no_indexed_files(membership_roots)
+        + _root_indexed_file_status(resolution.unmembered_prefixes)
+    )
+
+
+def _project_roots_with_no_indexed_files(projects_by_root: dict[str, list[int]]) -> list[str]:
+    """Return project scope roots none of whose projects has a file in project_file_hashes."""
+    if not projects_by_root:
+        return []
+    project_ids = sorted({project_id for ids in projects_by_root.values() for project_id in ids})
+    indexed_ids = set(db.session.execute(
+        text("""
+            SELECT p.project_id
+            FROM unnest(CAST(:project_ids AS integer[])) AS p(project_id)
+            WHERE EXISTS (SELECT 1 FROM project_file_hashes pfh WHERE pfh.project_id = p.project_id)
+        """),
+        {"project_ids": project_ids},
+    ).scalars().all())
+    return [root for root, ids in sorted(projects_by_root.items()) if not indexed_ids.intersection(ids)]
 
 
 def _root_indexed_file_status(prefixes: list[str]) -> list[str]:
@@ -291,22 +324,14 @@ def _root_indexed_file_status(prefixes: list[str]) -> list[str]:
     if not prefixes:
         return []
     params = {}
-    values_sql = _scope_paths_values(prefixes, params)
-    sql = f"""
-        WITH scope_paths(path_prefix) AS (VALUES {values_sql})
-        SELECT
-            sp.path_prefix,
-            EXISTS (
-                SELECT 1
-                FROM file_locations fl
-                WHERE fl.file_server_directories = sp.path_prefix
-                   OR fl.file_server_directories LIKE
-                        replace(replace(replace(sp.path_prefix, '\\', '\\\\'), '%', '\\%'), '_', '\\_') || '/%' ESCAPE '\\'
-            ) AS has_indexed_files
-        FROM scope_paths sp
-    """
-    rows = db.session.execute(text(sql), params).mappings().all()
-    return [row["path_prefix"] for row in rows if not row["has_indexed_files"]]
+    exists_sql = ",\n".join(
+        f"EXISTS (SELECT 1 FROM file_locations fl WHERE "
+        f"{utils.FileServerUtils.db_subtree_sql('fl.directory_path', prefix, params, key=f'scope_{idx}')}) "
+        f"AS scope_{idx}"
+        for idx, prefix in enumerate(prefixes)
+    )
+    row = db.session.execute(text(f"SELECT {exists_sql}"), params).mappings().one()
+    return [prefix for idx, prefix in enumerate(prefixes) if not row[f"scope_{idx}"]]
 
 
 def resolve_scope(search_request: ArchiveSearchRequest, app) -> ScopeResolution:
@@ -339,14 +364,15 @@ def resolve_scope(search_request: ArchiveSearchRequest, app) -> ScopeResolution:
             resolution.messages.append(f"No project rows found for project number {project_number}.")
             return resolution
 
-        prefixes = []
+        projects_by_root = {}
         for project in projects:
             root = _clean_archive_prefix(project.file_server_location)
             if root:
-                prefixes.append(root)
+                projects_by_root.setdefault(root, []).append(project.id)
             else:
                 resolution.missing_project_location_count += 1
-        resolution.prefixes = sorted(set(prefixes))
+        resolution.prefixes = sorted(projects_by_root)
+        resolution.project_ids = sorted({project_id for ids in projects_by_root.values() for project_id in ids})
         resolution.usable_project_count = len(resolution.prefixes)
         if resolution.missing_project_location_count:
             resolution.messages.append(
@@ -357,7 +383,7 @@ def resolve_scope(search_request: ArchiveSearchRequest, app) -> ScopeResolution:
                 "Matching project rows exist, but none has a recorded file server location."
             )
             return resolution
-        resolution.roots_with_no_indexed_files = _root_indexed_file_status(resolution.prefixes)
+        _resolve_project_membership(resolution, projects_by_root)
         return resolution
 
     if scope_type == "caan":
@@ -386,14 +412,15 @@ def resolve_scope(search_request: ArchiveSearchRequest, app) -> ScopeResolution:
             )
             return resolution
 
-        prefixes = []
+        projects_by_root = {}
         for project in linked_projects:
             root = _clean_archive_prefix(project.file_server_location)
             if root:
-                prefixes.append(root)
+                projects_by_root.setdefault(root, []).append(project.id)
             else:
                 resolution.missing_project_location_count += 1
-        resolution.prefixes = sorted(set(prefixes))
+        resolution.prefixes = sorted(projects_by_root)
+        resolution.project_ids = sorted({project_id for ids in projects_by_root.values() for project_id in ids})
         resolution.usable_project_count = len(resolution.prefixes)
         if resolution.missing_project_location_count:
             resolution.messages.append(
@@ -404,7 +431,7 @@ def resolve_scope(search_request: ArchiveSearchRequest, app) -> ScopeResolution:
                 "Linked projects exist, but none has a recorded file server location."
             )
             return resolution
-        resolution.roots_with_no_indexed_files = _root_indexed_file_status(resolution.prefixes)
+        _resolve_project_membership(resolution, projects_by_root)
         return resolution
 
     resolution.messages.append(f"Unknown scope type: {scope_type}")
@@ -412,10 +439,32 @@ def resolve_scope(search_request: ArchiveSearchRequest, app) -> ScopeResolution:
 
 
 def _file_hash_scope_cte(scope: ScopeResolution, params: dict) -> str:
-    """Build the scoped file-hash CTE used by search and coverage queries."""
+    """
+    Build the scoped file-hash CTE used by search and coverage queries. Project and CAAN scopes read the
+    precomputed project_file_hashes membership; location scopes match locations by path prefix.
+    """
     if not scope.has_scope:
         return "scoped_file_hashes AS (SELECT f.hash AS file_hash FROM files f)"
-    scope_filter = _scope_clause("fl.file_server_directories", scope.prefixes, params)
+    if _use_project_membership(scope):
+        params["scope_project_ids"] = list(scope.project_ids)
+        prefix_select = ""
+        if scope.unmembered_prefixes:
+            prefix_select = f"""
+            UNION
+            SELECT f.hash
+            FROM file_locations fl
+            JOIN files f ON f.id = fl.file_id
+            WHERE {_scope_clause("fl.directory_path", scope.unmembered_prefixes, params)}
+            """
+        return f"""
+        scoped_file_hashes AS (
+            SELECT DISTINCT pfh.file_hash
+            FROM project_file_hashes pfh
+            WHERE pfh.project_id = ANY(CAST(:scope_project_ids AS integer[]))
+            {prefix_select}
+        )
+    """
+    scope_filter = _scope_clause("fl.directory_path", scope.prefixes, params)
     return f"""
         scoped_file_hashes AS (
             SELECT DISTINCT f.hash AS file_hash
@@ -460,69 +509,81 @@ def _scope_allows_search(scope: ScopeResolution) -> bool:
     return scope.scope_type == "all" or bool(scope.prefixes)
 
 
-def _execute_content_search(query_text: str, scope: ScopeResolution, extensions: list[str], file_limit: int, app) -> list[dict]:
-    """Run scoped PostgreSQL FTS over chunk search vectors."""
-    params = {
-        "query_text": query_text,
-        "file_limit": file_limit,
-        "chunk_candidate_limit": min(
-            int(app.config.get("ARCHIVE_SEARCH_CHUNK_CANDIDATE_LIMIT", 50000)),
-            max(1000, file_limit * int(app.config.get("ARCHIVE_SEARCH_CHUNK_CANDIDATE_MULTIPLIER", 20))),
-        ),
-    }
-    scoped_cte = _file_hash_scope_cte(scope, params)
-    extension_filter = _extension_clause("f", extensions, params)
-    sql = f"""
+def _content_search_sql(scoped_cte: str, scope_join: str, extension_filter: str) -> str:
+    """
+    Two-phase content retrieval. Phase one reads only the GIN index on the current chunks to find the matching files,
+    which needs no ranking and so no detoasting of chunk vectors. Phase two computes ts_rank_cd for every matching
+    chunk of those files and ranks each file by its best chunk. The ranking is exact unless more than
+    :candidate_file_limit files match; that cap, for terms common to much of the archive, keeps the files with the
+    most matching chunks.
+    """
+    return f"""
         WITH q AS (
             SELECT websearch_to_tsquery('simple', :query_text) AS query
         ),
         {scoped_cte},
-        latest_chunk_sets AS (
-            SELECT c.file_hash, max(c.chunked_at) AS chunked_at
+        candidate_files AS (
+            SELECT c.file_hash, count(*) AS matching_chunks
             FROM file_content_fts_chunks c
-            JOIN scoped_file_hashes sfh ON sfh.file_hash = c.file_hash
+            {scope_join}
+            JOIN files f ON f.hash = c.file_hash
+            CROSS JOIN q
+            WHERE c.search_vector @@ q.query
+              AND c.is_current
+              AND {extension_filter}
             GROUP BY c.file_hash
+            ORDER BY matching_chunks DESC, c.file_hash ASC
+            LIMIT :candidate_file_limit
         ),
-        matching_chunks AS (
+        ranked_chunks AS (
             SELECT
                 c.file_hash,
                 c.id AS chunk_id,
                 c.chunk_index,
                 ts_rank_cd(c.search_vector, q.query) AS chunk_rank
-            FROM file_content_fts_chunks c
-            JOIN latest_chunk_sets lcs
-              ON lcs.file_hash = c.file_hash
-             AND lcs.chunked_at = c.chunked_at
-            JOIN scoped_file_hashes sfh ON sfh.file_hash = c.file_hash
-            JOIN files f ON f.hash = c.file_hash
+            FROM candidate_files cf
+            JOIN file_content_fts_chunks c ON c.file_hash = cf.file_hash AND c.is_current
             CROSS JOIN q
             WHERE c.search_vector @@ q.query
-              AND {extension_filter}
-            ORDER BY chunk_rank DESC
-            LIMIT :chunk_candidate_limit
         ),
         file_scores AS (
             SELECT
-                file_hash,
-                max(chunk_rank) AS content_rank,
-                count(*) AS matching_chunks,
-                (array_agg(chunk_id ORDER BY chunk_rank DESC, chunk_index ASC))[1] AS best_chunk_id
-            FROM matching_chunks
-            GROUP BY file_hash
+                rc.file_hash,
+                max(rc.chunk_rank) AS content_rank,
+                cf.matching_chunks,
+                (array_agg(rc.chunk_id ORDER BY rc.chunk_rank DESC, rc.chunk_index ASC))[1] AS best_chunk_id
+            FROM ranked_chunks rc
+            JOIN candidate_files cf ON cf.file_hash = rc.file_hash
+            GROUP BY rc.file_hash, cf.matching_chunks
         )
         SELECT *
         FROM file_scores
         ORDER BY content_rank DESC, matching_chunks DESC, file_hash ASC
         LIMIT :file_limit
     """
+
+
+def _execute_content_search(query_text: str, scope: ScopeResolution, extensions: list[str], file_limit: int, app) -> list[dict]:
+    """Run scoped PostgreSQL FTS over the current chunk search vectors (see _content_search_sql)."""
+    params = {
+        "query_text": query_text,
+        "file_limit": file_limit,
+        "candidate_file_limit": max(file_limit, int(app.config.get("ARCHIVE_SEARCH_CANDIDATE_FILE_LIMIT", 20000))),
+    }
+    scoped_cte = _file_hash_scope_cte(scope, params)
+    # unscoped searches match every file, so the scope join is left out
+    scope_join = "JOIN scoped_file_hashes sfh ON sfh.file_hash = c.file_hash" if scope.has_scope else ""
+    extension_filter = _extension_clause("f", extensions, params)
+    sql = _content_search_sql(scoped_cte, scope_join, extension_filter)
     return [dict(row) for row in db.session.execute(text(sql), params).mappings().all()]
 
 
 def _execute_filename_search(query_text: str, scope: ScopeResolution, extensions: list[str], file_limit: int, filename_only: bool) -> list[dict]:
     """Run grouped filename or filename/path FTS at file-hash level."""
     params = {"query_text": query_text, "file_limit": file_limit}
-    path_vector = "" if filename_only else " || to_tsvector('english', coalesce(fl.file_server_directories, ''))"
-    scope_filter = _scope_clause("fl.file_server_directories", scope.prefixes, params)
+    # stored, GIN-indexed vectors (see FileLocationModel.filename_tsv and filepath_tsv)
+    location_vector = "fl.filename_tsv" if filename_only else "fl.filepath_tsv"
+    scope_filter = _scope_clause("fl.directory_path", scope.prefixes, params)
     extension_filter = _extension_clause("f", extensions, params)
     sql = f"""
         WITH q AS (
@@ -532,16 +593,11 @@ def _execute_filename_search(query_text: str, scope: ScopeResolution, extensions
             SELECT
                 f.hash AS file_hash,
                 fl.id AS location_id,
-                ts_rank_cd(
-                    to_tsvector('english', regexp_replace(coalesce(fl.filename, ''), '\\.', ' ', 'gi')){path_vector},
-                    q.query
-                ) AS filepath_rank
+                ts_rank_cd({location_vector}, q.query) AS filepath_rank
             FROM file_locations fl
             JOIN files f ON f.id = fl.file_id
             CROSS JOIN q
-            WHERE (
-                    to_tsvector('english', regexp_replace(coalesce(fl.filename, ''), '\\.', ' ', 'gi')){path_vector}
-                  ) @@ q.query
+            WHERE {location_vector} @@ q.query
               AND {scope_filter}
               AND {extension_filter}
         ),
@@ -562,8 +618,67 @@ def _execute_filename_search(query_text: str, scope: ScopeResolution, extensions
     return [dict(row) for row in db.session.execute(text(sql), params).mappings().all()]
 
 
-def _merge_results(content_rows: list[dict], filepath_rows: list[dict], file_limit: int) -> list[dict]:
-    """Merge content and filename/path matches into ranked file results."""
+def _like_escape(value: str) -> str:
+    """Escape LIKE wildcards so that a user fragment matches literally."""
+    return re.sub(r"([\\%_])", r"\\\1", value)
+
+
+def _execute_fragment_search(query_text: str, scope: ScopeResolution, extensions: list[str], file_limit: int, app) -> list[dict]:
+    """
+    Run grouped substring and fuzzy filename matching at file-hash level. Filenames containing the fragment
+    (ILIKE '%fragment%') and filenames holding a word similar to it (pg_trgm word similarity, for misspellings) both
+    match, and both conditions are answered by the trigram GIN index on file_locations.filename. Substring matches
+    rank above fuzzy-only matches.
+    """
+    fragment = query_text.strip()
+    params = {
+        "fragment": fragment,
+        "fragment_pattern": f"%{_like_escape(fragment)}%",
+        "similarity_threshold": str(app.config.get("ARCHIVE_SEARCH_TRIGRAM_SIMILARITY_THRESHOLD", 0.5)),
+        "file_limit": file_limit,
+    }
+    scope_filter = _scope_clause("fl.directory_path", scope.prefixes, params)
+    extension_filter = _extension_clause("f", extensions, params)
+    # the <% operator uses the session threshold; set it for this transaction only
+    db.session.execute(
+        text("SELECT set_config('pg_trgm.word_similarity_threshold', :similarity_threshold, true)"),
+        {"similarity_threshold": params["similarity_threshold"]},
+    )
+    sql = f"""
+        WITH matching_locations AS (
+            SELECT
+                f.hash AS file_hash,
+                fl.id AS location_id,
+                (fl.filename ILIKE :fragment_pattern)::int + word_similarity(:fragment, fl.filename) AS filepath_rank
+            FROM file_locations fl
+            JOIN files f ON f.id = fl.file_id
+            WHERE (fl.filename ILIKE :fragment_pattern OR :fragment <% fl.filename)
+              AND {scope_filter}
+              AND {extension_filter}
+        ),
+        file_scores AS (
+            SELECT
+                file_hash,
+                max(filepath_rank) AS filepath_rank,
+                (array_agg(location_id ORDER BY filepath_rank DESC, location_id ASC))[1] AS best_location_id,
+                array_agg(location_id ORDER BY filepath_rank DESC, location_id ASC) AS matching_location_ids
+            FROM matching_locations
+            GROUP BY file_hash
+        )
+        SELECT *
+        FROM file_scores
+        ORDER BY filepath_rank DESC, file_hash ASC
+        LIMIT :file_limit
+    """
+    return [dict(row) for row in db.session.execute(text(sql), params).mappings().all()]
+
+
+def _merge_results(content_rows: list[dict], filepath_rows: list[dict], file_limit: int,
+                   fragment_rows: list[dict] | None = None) -> list[dict]:
+    """
+    Merge content, filename/path and filename fragment matches into ranked file results. Fragment ranks are reported
+    as filepath_rank.
+    """
     merged: dict[str, dict] = {}
     for row in content_rows:
         merged[row["file_hash"]] = {
@@ -576,26 +691,30 @@ def _merge_results(content_rows: list[dict], filepath_rows: list[dict], file_lim
             "best_location_id": None,
             "matching_location_ids": set(),
         }
-    for row in filepath_rows:
-        existing = merged.get(row["file_hash"])
-        if existing:
-            existing["match_source"] = "both"
-            existing["filepath_rank"] = row.get("filepath_rank")
-            existing["best_location_id"] = row.get("best_location_id")
-            existing["matching_location_ids"] = set(row.get("matching_location_ids") or [])
-        else:
-            merged[row["file_hash"]] = {
-                "file_hash": row["file_hash"],
-                "match_source": "filename/path",
-                "content_rank": None,
-                "filepath_rank": row.get("filepath_rank"),
-                "matching_chunks": 0,
-                "best_chunk_id": None,
-                "best_location_id": row.get("best_location_id"),
-                "matching_location_ids": set(row.get("matching_location_ids") or []),
-            }
-
-    source_priority = {"both": 0, "content": 1, "filename/path": 2}
+    for source, rows in (("filename/path", filepath_rows), ("filename fragment", fragment_rows or [])):
+        for row in rows:
+            existing = merged.get(row["file_hash"])
+            if existing and existing["match_source"] == "content":
+                existing["match_source"] = "both"
+            if existing:
+                if existing["filepath_rank"] is None \
+                        or float(row.get("filepath_rank") or 0) > float(existing["filepath_rank"]):
+                    existing["filepath_rank"] = row.get("filepath_rank")
+                    existing["best_location_id"] = row.get("best_location_id")
+                existing["matching_location_ids"] |= set(row.get("matching_location_ids") or [])
+            else:
+                merged[row["file_hash"]] = {
+                    "file_hash": row["file_hash"],
+                    "match_source": source,
+                    "content_rank": None,
+                    "filepath_rank": row.get("filepath_rank"),
+                    "matching_chunks": 0,
+                    "best_chunk_id": None,
+                    "best_location_id": row.get("best_location_id"),
+                    "matching_location_ids": set(row.get("matching_location_ids") or []),
+                }
+
+    source_priority = {"both": 0, "content": 1, "filename/path": 2, "filename fragment": 3}
     sorted_rows = sorted(
         merged.values(),
         key=lambda row: (
@@ -803,35 +922,31 @@ def _sanitize_excel_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def _coverage_summary(scope: ScopeResolution, extensions: list[str], app) -> dict:
-    """Compute scope-level content coverage and status counts."""
-    if not _scope_allows_search(scope):
-        return {
-            "files_in_scope": 0,
-            "files_with_nonempty_text": 0,
-            "files_with_fts_chunks": 0,
-            "files_with_extraction_failures": 0,
-            "files_with_empty_or_thin_text": 0,
-            "files_with_low_context_text": 0,
-            "files_with_text_not_chunked": 0,
-            "files_not_attempted": 0,
-            "unsupported_or_low_value_format_files": 0,
-            "content_searchable_files": 0,
-            "filename_only_or_not_content_searchable_files": 0,
-            "filename_path_searchable_files": 0,
-            "roots_with_no_indexed_files": len(scope.roots_with_no_indexed_files),
-        }
+COVERAGE_COUNT_FIELDS = (
+    "files_in_scope",
+    "files_with_nonempty_text",
+    "files_with_fts_chunks",
+    "files_with_extraction_failures",
+    "files_with_empty_or_thin_text",
+    "files_with_low_context_text",
+    "files_with_text_not_chunked",
+    "files_not_attempted",
+    "unsupported_or_low_value_format_files",
+    "content_searchable_files",
+    "filename_only_or_not_content_searchable_files",
+)
 
-    params = {
-        "thin_threshold": THIN_TEXT_THRESHOLD,
-        "low_context_threshold": LOW_CONTEXT_TEXT_THRESHOLD,
-    }
-    scoped_cte = _file_hash_scope_cte(scope, params)
-    extension_filter = _extension_clause("f", extensions, params)
-    sql = f"""
-        WITH {scoped_cte},
+
+def _coverage_counts_sql(keyed_hashes_cte: str, extension_filter: str) -> str:
+    """
+    Build the coverage classification query. keyed_hashes_cte defines keyed_file_hashes(scope_key, file_hash), with
+    each file at most once per key; one row of counts is returned per scope_key.
+    """
+    return f"""
+        WITH {keyed_hashes_cte},
         status_rows AS (
             SELECT
+                kfh.scope_key,
                 f.hash AS file_hash,
                 f.extension,
                 fc.text_length,
@@ -840,8 +955,8 @@ def _coverage_summary(scope: ScopeResolution, extensions: list[str], app) -> dic
                     SELECT 1 FROM file_content_fts_chunks c
                     WHERE c.file_hash = f.hash
                 ) AS has_chunks
-            FROM scoped_file_hashes sfh
-            JOIN files f ON f.hash = sfh.file_hash
+            FROM keyed_file_hashes kfh
+            JOIN files f ON f.hash = kfh.file_hash
             LEFT JOIN file_contents fc ON fc.file_hash = f.hash
             LEFT JOIN file_content_failures fcf ON fcf.file_hash = f.hash
             WHERE {extension_filter}
@@ -873,6 +988,7 @@ def _coverage_summary(scope: ScopeResolution, extensions: list[str], app) -> dic
             FROM status_rows
         )
         SELECT
+            scope_key,
             count(*) AS files_in_scope,
             count(*) FILTER (WHERE text_length IS NOT NULL AND text_length > 0) AS files_with_nonempty_text,
             count(*) FILTER (WHERE has_chunks) AS files_with_fts_chunks,
@@ -885,9 +1001,184 @@ def _coverage_summary(scope: ScopeResolution, extensions: list[str], app) -> dic
             count(*) FILTER (WHERE text_status IN ('content_searchable', 'image_ocr_searchable')) AS content_searchable_files,
             count(*) FILTER (WHERE text_status NOT IN ('content_searchable', 'image_ocr_searchable')) AS filename_only_or_not_content_searchable_files
         FROM classified
+        GROUP BY scope_key
+    """
+
+
+def _coverage_threshold_params() -> dict:
+    """Query parameters shared by every coverage classification query."""
+    return {
+        "thin_threshold": THIN_TEXT_THRESHOLD,
+        "low_context_threshold": LOW_CONTEXT_TEXT_THRESHOLD,
+    }
+
+
+def compute_prefix_coverage(prefixes: list[str] | None = None, max_depth: int | None = None) -> dict[str, dict]:
+    """
+    Compute unfiltered coverage counts for a set of scope roots in one grouped query.
+    :param prefixes: Records-relative scope roots, as in ScopeResolution.prefixes
+    :param max_depth: also compute every directory down to this depth below the archive root (0 is the root
+    itself, keyed ''). None computes only the given prefixes.
+    :return: dictionary of scope root to its coverage counts
+    """
+    params = _coverage_threshold_params()
+    sources = []
+    if max_depth is not None:
+        params["max_depth"] = max_depth
+        sources.append("""
+            SELECT
+                CASE WHEN d.depth = 0 THEN ''
+                     ELSE array_to_string((string_to_array(rtrim(fl.directory_path, '/'), '/'))[1:d.depth], '/')
+                END AS scope_key,
+                f.hash AS file_hash
+            FROM file_locations fl
+            JOIN files f ON f.id = fl.file_id
+            CROSS JOIN LATERAL generate_series(
+                0, least(:max_depth, cardinality(string_to_array(rtrim(fl.directory_path, '/'), '/')))
+            ) AS d(depth)
+        """)
+    prefix_bounds = []
+    for prefix in sorted(set(_clean_archive_prefix(prefix) for prefix in prefixes or [])):
+        bounds = utils.FileServerUtils.db_subtree_bounds(prefix)
+        if bounds:
+            prefix_bounds.append((prefix, *bounds))
+    if prefix_bounds:
+        params["scope_keys"] = [bounds[0] for bounds in prefix_bounds]
+        params["scope_lowers"] = [bounds[1] for bounds in prefix_bounds]
+        params["scope_uppers"] = [bounds[2] for bounds in prefix_bounds]
+        sources.append("""
+            SELECT sp.scope_key, f.hash AS file_hash
+            FROM unnest(CAST(:scope_keys AS text[]), CAST(:scope_lowers AS text[]), CAST(:scope_uppers AS text[]))
+                AS sp(scope_key, lower_bound, upper_bound)
+            JOIN file_locations fl
+              ON fl.directory_path ~>=~ sp.lower_bound AND fl.directory_path ~<~ sp.upper_bound
+            JOIN files f ON f.id = fl.file_id
+        """)
+    if not sources:
+        return {}
+
+    keyed_hashes_cte = f"keyed_file_hashes AS ({' UNION '.join(sources)})"
+    rows = db.session.execute(text(_coverage_counts_sql(keyed_hashes_cte, "TRUE")), params).mappings().all()
+    coverage = {row["scope_key"]: {field: row[field] for field in COVERAGE_COUNT_FIELDS} for row in rows}
+    for prefix, _, _ in prefix_bounds:
+        coverage.setdefault(prefix, {field: 0 for field in COVERAGE_COUNT_FIELDS})
+    return coverage
+
+
+def store_prefix_coverage(coverage: dict[str, dict], computed_at: datetime | None = None, replace_all: bool = False) -> int:
+    """
+    Upsert precomputed coverage rows into search_coverage_summaries. Does not commit.
+    :param coverage: dictionary of scope root to coverage counts, as returned by compute_prefix_coverage
+    :param computed_at: time the counts were computed. Defaults to now.
+    :param replace_all: delete the rows of scope roots that are not in coverage, for full refreshes
+    :return: number of rows written
+    """
+    computed_at = computed_at or datetime.now().astimezone()
+    if replace_all:
+        db.session.execute(
+            text("DELETE FROM search_coverage_summaries WHERE NOT (scope_prefix IN :scope_prefixes)")
+            .bindparams(bindparam("scope_prefixes", expanding=True)),
+            {"scope_prefixes": list(coverage)},
+        )
+    if not coverage:
+        return 0
+    db.session.execute(
+        text("""
+            INSERT INTO search_coverage_summaries (scope_prefix, coverage, computed_at)
+            SELECT scope_prefix, coverage, :computed_at
+            FROM unnest(CAST(:scope_prefixes AS text[]), CAST(:coverages AS jsonb[])) AS v(scope_prefix, coverage)
+            ON CONFLICT (scope_prefix) DO UPDATE SET
+                coverage = EXCLUDED.coverage,
+                computed_at = EXCLUDED.computed_at
+        """),
+        {
+            "computed_at": computed_at,
+            "scope_prefixes": list(coverage),
+            "coverages": [json.dumps(counts) for counts in coverage.values()],
+        },
+    )
+    return len(coverage)
+
+
+def refresh_coverage_summaries(max_depth: int | None = None) -> int:
+    """
+    Recompute the precomputed coverage of the archive root, every directory down to max_depth and every project
+    root, replacing the previous summaries. Run on a schedule by the maintenance tasks. Does not commit.
+    :param max_depth: directory depth to precompute. Defaults to the ARCHIVE_SEARCH_COVERAGE_DEPTH config value (2).
+    :return: number of summary rows written
+    """
+    if max_depth is None:
+        max_depth = int(flask.current_app.config.get("ARCHIVE_SEARCH_COVERAGE_DEPTH", 2))
+    project_prefixes = [
+        location for (location,) in db.session.query(ProjectModel.file_server_location)
+        .filter(ProjectModel.file_server_location.isnot(None))
+        .distinct()
+    ]
+    computed_at = datetime.now().astimezone()
+    coverage = compute_prefix_coverage(prefixes=[prefix for prefix in map(_clean_archive_prefix, project_prefixes) if prefix],
+                                       max_depth=max_depth)
+    return store_prefix_coverage(coverage, computed_at=computed_at, replace_all=True)
+
+
+def _precomputed_coverage(scope: ScopeResolution) -> dict | None:
+    """
+    Look up the precomputed coverage of a single-root scope. A root without a summary row is computed now and stored,
+    so the next search over it is a lookup too. Multi-root scopes are not rolled up from their roots' rows, since a
+    file stored under several roots would be counted once per root.
+    :return: coverage counts with computed_at, or None if precomputed coverage is disabled or the scope has several
+    roots
     """
-    row = db.session.execute(text(sql), params).mappings().first()
-    coverage = dict(row or {})
+    if not flask.current_app.config.get("ARCHIVE_SEARCH_PRECOMPUTED_COVERAGE", True):
+        return None
+    prefixes = sorted(set(scope.prefixes)) if scope.has_scope else [""]
+    if len(prefixes) != 1:
+        return None
+    prefix = prefixes[0]
+    row = db.session.execute(
+        text("SELECT coverage, computed_at FROM search_coverage_summaries WHERE scope_prefix = :scope_prefix"),
+        {"scope_prefix": prefix},
+    ).mappings().first()
+    if row:
+        counts, computed_at = row["coverage"], row["computed_at"]
+    else:
+        computed_at = datetime.now().astimezone()
+        computed = compute_prefix_coverage(max_depth=0) if prefix == "" else compute_prefix_coverage(prefixes=[prefix])
+        counts = computed.setdefault(prefix, {field: 0 for field in COVERAGE_COUNT_FIELDS})
+        try:
+            store_prefix_coverage(computed, computed_at=computed_at)
+            db.session.commit()
+        except Exception:
+            utils.FlaskAppUtils.attempt_db_rollback(db)
+
+    coverage = {field: int(counts.get(field, 0)) for field in COVERAGE_COUNT_FIELDS}
+    coverage["computed_at"] = computed_at.isoformat(timespec="seconds")
+    return coverage
+
+
+def _coverage_summary(scope: ScopeResolution, extensions: list[str], app) -> dict:
+    """
+    Scope-level content coverage and status counts. Unfiltered searches of the whole archive or of a single root use
+    the precomputed summaries; multi-root scopes, which count each file hash once, and searches filtered by extension
+    are computed live (project and CAAN scopes through project_file_hashes).
+    """
+    if not _scope_allows_search(scope):
+        coverage = {field: 0 for field in COVERAGE_COUNT_FIELDS}
+        coverage["filename_path_searchable_files"] = 0
+        coverage["roots_with_no_indexed_files"] = len(scope.roots_with_no_indexed_files)
+        coverage["computed_at"] = datetime.now().astimezone().isoformat(timespec="seconds")
+        return coverage
+
+    coverage = None if extensions else _precomputed_coverage(scope)
+    if coverage is None:
+        params = _coverage_threshold_params()
+        scoped_cte = _file_hash_scope_cte(scope, params)
+        keyed_hashes_cte = f"""{scoped_cte},
+            keyed_file_hashes AS (SELECT CAST('' AS text) AS scope_key, file_hash FROM scoped_file_hashes)"""
+        extension_filter = _extension_clause("f", extensions, params)
+        row = db.session.execute(text(_coverage_counts_sql(keyed_hashes_cte, extension_filter)), params).mappings().first()
+        coverage = {field: (row[field] if row else 0) for field in COVERAGE_COUNT_FIELDS}
+        coverage["computed_at"] = datetime.now().astimezone().isoformat(timespec="seconds")
+
     coverage["filename_path_searchable_files"] = coverage.get("files_in_scope", 0)
     coverage["roots_with_no_indexed_files"] = len(scope.roots_with_no_indexed_files)
     return coverage
@@ -922,19 +1213,44 @@ class ArchiveSearchRun:
         self.record_id: int | None = None
         self.duration_ms: int | None = None
         self.search_data: dict | None = None
+        self.stage_timings: dict[str, int] = {}
+        self.access_token: str | None = None
         self._executed = False
 
-    def execute(self) -> dict:
-        """Create an incomplete run, execute the search, and persist its outcome."""
+    def create_queued_record(self) -> int | None:
+        """
+        Create the incomplete run row of a search that an RQ worker will execute (archiver_tasks.archive_search_task).
+        A random access token for the run is generated into self.access_token; only its hash is stored with the row.
+        :return: the archive_search_runs id, or None if the row could not be created
+        """
+        self.access_token = secrets.token_urlsafe(32)
+        self._create_incomplete_record()
+        return self.record_id
+
+    @staticmethod
+    def hash_access_token(access_token: str) -> str:
+        """Digest of an async run access token as stored in archive_search_runs.access_token_hash."""
+        return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+    def execute(self, record_id: int | None = None, stage_callback=None) -> dict:
+        """
+        Create an incomplete run, execute the search, and persist its outcome.
+        :param record_id: id of the run row created by create_queued_record, for searches executed by a worker
+        :param stage_callback: called as stage_callback(stage, search_data) with the partial result data after the
+        filename, content, and coverage stages
+        """
         if self._executed:
             raise RuntimeError("An ArchiveSearchRun instance can only be executed once.")
         self._executed = True
 
-        self._create_incomplete_record()
+        if record_id is None:
+            self._create_incomplete_record()
+        else:
+            self.record_id = record_id
         started_at = time.perf_counter()
 
         try:
-            self.search_data = self._execute_search()
+            self.search_data = self._execute_search(stage_callback)
         except Exception:
             self.duration_ms = self._elapsed_ms(started_at)
             self.status = self.STATUS_FAILED
@@ -958,6 +1274,7 @@ class ArchiveSearchRun:
                 extension_filters=list(self.request.extensions),
                 status=self.STATUS_INCOMPLETE,
                 request_source=self.request_source,
+                access_token_hash=self.hash_access_token(self.access_token) if self.access_token else None,
                 application_version=str(self.app.config["VERSION"]),
             )
             db.session.add(record)
@@ -994,6 +1311,8 @@ class ArchiveSearchRun:
             if self.status == self.STATUS_SUCCESSFUL and self.search_data is not None:
                 record.returned_result_count = len(self.search_data["results"])
                 record.coverage_summary = dict(self.search_data["coverage"])
+            if self.stage_timings:
+                record.stage_timings = dict(self.stage_timings)
 
             db.session.commit()
         except Exception:
@@ -1019,12 +1338,23 @@ class ArchiveSearchRun:
         """Return non-negative monotonic elapsed time rounded to milliseconds."""
         return max(0, round((time.perf_counter() - started_at) * 1000))
 
-    def _execute_search(self) -> dict:
-        """Run the archive search workflow and return its result data."""
+    def _execute_search(self, stage_callback=None) -> dict:
+        """
+        Run the archive search workflow and return its result data. After the scope is resolved, the filename,
+        content, and coverage queries run concurrently (see _run_stage), and the merged results are then completed
+        by concurrent metadata, location, and snippet queries. stage_callback, if given, receives the partial result
+        data as the filename, content, and coverage stages finish, in that order. The wall-clock time of every stage
+        is recorded in stage_timings.
+        """
+        search_started_at = time.perf_counter()
         query_text = self.request.query_text
         mode = self.request.search_mode
         extensions = list(self.request.extensions)
+        self.stage_timings = {}
+
+        started_at = time.perf_counter()
         scope = resolve_scope(self.request, self.app)
+        self.stage_timings["scope_resolution"] = self._elapsed_ms(started_at)
         warnings = list(scope.warnings)
         messages = list(scope.messages)
         if scope.roots_with_no_indexed_files:
@@ -1032,47 +1362,117 @@ class ArchiveSearchRun:
                 f"{len(scope.roots_with_no_indexed_files)} scope root(s) did not match any indexed file locations."
             )
 
-        content_rows = []
-        filepath_rows = []
-
-        if mode in ["content", "combined"] and _scope_allows_search(scope):
-            content_rows = _execute_content_search(
-                query_text,
-                scope,
-                extensions,
-                self.file_limit,
-                self.app,
-            )
-        elif mode in ["content", "combined"] and scope.scope_type != "all" and not scope.prefixes:
+        run_filename = mode in ["filename_only", "filepath", "combined"]
+        run_fragment = mode == "filename_fragment"
+        run_content = mode in ["content", "combined"]
+        if run_fragment and len(query_text) < TRIGRAM_MIN_FRAGMENT_LENGTH:
             messages.append(
-                "Document-content search was skipped because the selected scope resolved to no usable root paths."
-            )
-
-        if mode in ["filename_only", "filepath", "combined"] and _scope_allows_search(scope):
-            filepath_rows = _execute_filename_search(
-                query_text,
-                scope,
-                extensions,
-                self.file_limit,
-                mode == "filename_only",
-            )
-        elif mode in ["filename_only", "filepath", "combined"] and scope.scope_type != "all" and not scope.prefixes:
-            messages.append(
-                "Filename/path search was skipped because the selected scope resolved to no usable root paths."
+                f"Filename fragment search needs at least {TRIGRAM_MIN_FRAGMENT_LENGTH} characters."
             )
+            run_fragment = False
+        if not _scope_allows_search(scope):
+            for source_run, label in ((run_filename, "Filename/path"), (run_fragment, "Filename fragment"),
+                                      (run_content, "Document-content")):
+                if source_run:
+                    messages.append(
+                        f"{label} search was skipped because the selected scope resolved to no usable root paths."
+                    )
+
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, int(self.app.config.get("ARCHIVE_SEARCH_PARALLEL_WORKERS", 4)))
+        )
+        try:
+            filepath_future = fragment_future = content_future = None
+            if _scope_allows_search(scope):
+                if run_filename:
+                    filepath_future = self._run_stage(executor, "filename_search", _execute_filename_search,
+                                                      query_text, scope, extensions, self.file_limit,
+                                                      mode == "filename_only")
+                if run_fragment:
+                    fragment_future = self._run_stage(executor, "fragment_search", _execute_fragment_search,
+                                                      query_text, scope, extensions, self.file_limit,
+                                                      self._app_object())
+                if run_content:
+                    content_future = self._run_stage(executor, "content_search", _execute_content_search,
+                                                     query_text, scope, extensions, self.file_limit,
+                                                     self._app_object())
+            coverage_future = self._run_stage(executor, "coverage", _coverage_summary,
+                                              scope, extensions, self._app_object())
+
+            filepath_rows = filepath_future.result() if filepath_future else []
+            fragment_rows = fragment_future.result() if fragment_future else []
+            if stage_callback and mode != "content":
+                results = self._ranked_results(executor, query_text, scope, [], filepath_rows, fragment_rows,
+                                               timing_prefix="filename_stage_")
+                stage_callback("filename", self._search_data(scope, results, None, messages, warnings))
+
+            content_rows = content_future.result() if content_future else []
+            results = self._ranked_results(executor, query_text, scope, content_rows, filepath_rows, fragment_rows)
+            if stage_callback and run_content:
+                stage_callback("content", self._search_data(scope, results, None, messages, warnings))
+
+            coverage = coverage_future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        self.stage_timings["total"] = self._elapsed_ms(search_started_at)
+        search_data = self._search_data(scope, results, coverage, messages, warnings)
+        if stage_callback:
+            stage_callback("coverage", search_data)
+        return search_data
+
+    def _app_object(self):
+        """The Flask application itself, for use outside the request thread (self.app may be current_app)."""
+        return self.app._get_current_object() if hasattr(self.app, "_get_current_object") else self.app
+
+    def _run_stage(self, executor: ThreadPoolExecutor, stage: str, function, *args) -> Future:
+        """
+        Run one search query on the executor. The worker thread pushes its own application context, so the query
+        runs on its own scoped session and pooled connection, and the stage's wall-clock time goes to stage_timings.
+        """
+        app = self._app_object()
+
+        def run_stage():
+            started_at = time.perf_counter()
+            try:
+                with app.app_context():
+                    return function(*args)
+            finally:
+                self.stage_timings[stage] = self._elapsed_ms(started_at)
+
+        return executor.submit(run_stage)
+
+    def _ranked_results(self, executor: ThreadPoolExecutor, query_text: str, scope: ScopeResolution,
+                        content_rows: list[dict], filepath_rows: list[dict], fragment_rows: list[dict],
+                        timing_prefix: str = "") -> list[dict]:
+        """
+        Merge the source rows into ranked file results and add their metadata, locations, and snippets, which are
+        fetched concurrently.
+        """
+        started_at = time.perf_counter()
+        results = _merge_results(content_rows, filepath_rows, self.file_limit, fragment_rows)
+        self.stage_timings[f"{timing_prefix}merge"] = self._elapsed_ms(started_at)
 
-        results = _merge_results(content_rows, filepath_rows, self.file_limit)
         file_hashes = [row["file_hash"] for row in results]
-        metadata = _fetch_file_metadata(file_hashes)
-        locations = _fetch_locations(
+        metadata_future = self._run_stage(executor, f"{timing_prefix}metadata", _fetch_file_metadata, file_hashes)
+        locations_future = self._run_stage(
+            executor,
+            f"{timing_prefix}locations",
+            _fetch_locations,
             file_hashes,
             self.app.config.get("USER_ARCHIVES_LOCATION"),
             scope,
         )
-        snippets = _fetch_snippets(
+        snippets_future = self._run_stage(
+            executor,
+            f"{timing_prefix}snippets",
+            _fetch_snippets,
             query_text,
             [row["best_chunk_id"] for row in results if row.get("best_chunk_id")],
         )
+        metadata = metadata_future.result()
+        locations = locations_future.result()
+        snippets = snippets_future.result()
 
         for row in results:
             meta = metadata.get(row["file_hash"], {})
@@ -1096,24 +1496,70 @@ class ArchiveSearchRun:
                 "failure_summary": meta.get("failure_summary") or "",
                 "matching_location_ids": row.get("matching_location_ids") or set(),
             })
+        return results
 
-        coverage = _coverage_summary(scope, extensions, self.app)
+    def _search_data(self, scope: ScopeResolution, results: list[dict], coverage: dict | None, messages: list[str],
+                     warnings: list[str]) -> dict:
+        """Assemble the result data of a search, or of a search stage when coverage is still None."""
+        extensions = list(self.request.extensions)
         return {
-            "query_text": query_text,
-            "search_mode": mode,
-            "search_mode_label": SEARCH_MODE_LABELS.get(mode, mode),
+            "query_text": self.request.query_text,
+            "search_mode": self.request.search_mode,
+            "search_mode_label": SEARCH_MODE_LABELS.get(self.request.search_mode, self.request.search_mode),
             "scope": scope,
             "scope_label": scope.label,
             "extension": ", ".join(extensions),
             "extensions": extensions,
             "results": results,
             "coverage": coverage,
-            "messages": messages,
-            "warnings": warnings,
+            "messages": list(messages),
+            "warnings": list(warnings),
             "limit_hit": len(results) >= self.file_limit,
+            "stage_timings": dict(self.stage_timings),
         }
 
 
+class ArchiveSearchStageCache:
+    """
+    Staged results of an async archive search, kept in a Redis list (archive_search_stages:<search run id>) that
+    expires after ttl seconds. Each entry is a JSON event with a stage name ('filename', 'content', 'coverage', then
+    'complete' or 'failed') and, for result stages, the API response built from the partial result data.
+    """
+
+    TERMINAL_STAGES = ("complete", "failed")
+
+    def __init__(self, search_run_id: int, redis_conn=None, ttl: int | None = None):
+        """
+        :param search_run_id: archive_search_runs id of the search
+        :param redis_conn: Redis connection. Defaults to the connection of the app's rq queue.
+        :param ttl: lifetime in seconds of the cached stages. Defaults to the ARCHIVE_SEARCH_ASYNC_RESULT_TTL app config
+        value (1 hour).
+        """
+        self.search_run_id = search_run_id
+        self.redis = redis_conn or flask.current_app.q.connection
+        self.ttl = int(ttl if ttl is not None else flask.current_app.config.get("ARCHIVE_SEARCH_ASYNC_RESULT_TTL", 3600))
+        self.key = f"archive_search_stages:{search_run_id}"
+
+    def publish(self, stage: str, response: dict | None = None, **fields):
+        """Append a stage event and refresh the expiry of the list."""
+        event = {"stage": stage, "search_run_id": self.search_run_id, **fields}
+        if response is not None:
+            event["response"] = response
+        pipeline = self.redis.pipeline()
+        pipeline.rpush(self.key, json.dumps(event, default=str))
+        pipeline.expire(self.key, self.ttl)
+        pipeline.execute()
+
+    def events(self, start: int = 0) -> list[dict]:
+        """Return the stage events from position start on."""
+        return [json.loads(event) for event in self.redis.lrange(self.key, start, -1)]
+
+    def latest(self) -> dict | None:
+        """Return the most recent stage event, or None if no stage has been published."""
+        event = self.redis.lindex(self.key, -1)
+        return json.loads(event) if event else None
+
+
 def build_archive_search_api_response(
     search_data: dict,
     search_run_id: int | None,
@@ -1156,6 +1602,7 @@ def build_archive_search_api_response(
         "result_limit": result_limit,
         "limit_hit": search_data["limit_hit"],
         "coverage": search_data["coverage"],
+        "stage_timings": search_data.get("stage_timings", {}),
         "messages": search_data["messages"],
         "warnings": search_data["warnings"],
     }
@@ -3,14 +3,22 @@
 from archives_application import create_app, utils
 from archives_application.models import ArchivedFileModel, FileLocationModel, FileModel, WorkerTaskModel, ServerChangeModel
 from archives_application.archiver.routes import exclude_extensions, exclude_filenames
+from archives_application.archiver.archive_search import (ArchiveSearchRequest, ArchiveSearchRun, ArchiveSearchStageCache,
+                                                          build_archive_search_api_response)
+from archives_application.archiver.directory_tree import adjust_for_locations
+from archives_application.archiver.project_membership import add_location_memberships, remove_location_memberships
+from archives_application.archiver.location_reconciler import (PendingLocation, check_existence, confirm_locations,
+                                                                default_existence_workers, directory_location_ids,
+                                                                remove_locations, stale_locations)
+from archives_application.archiver.scrape_pipeline import ScrapeBatchWriter, ScrapePipeline, default_hashing_workers
 import flask
 import os
 import random
 import time
 import traceback
 from datetime import timedelta, datetime
-from itertools import cycle
-from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
 
 
 # Create the app context so that tasks can access app extensions even though
@@ -32,7 +40,7 @@ def add_file_to_db_task(filepath: str,  queue_id: str, archiving: bool = False):
             utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id,
                                                        sql_db=db)
             
-            file_hash = utils.FilesUtils.get_hash(filepath)
+            file_hash = utils.FilesUtils.get_hash(filepath, cache=utils.FileHashCache.from_app())
             file_id = None
             filename = utils.FileServerUtils.split_path(filepath)[-1]
             
@@ -63,6 +71,8 @@ def add_file_to_db_task(filepath: str,  queue_id: str, archiving: bool = False):
             # if there is already already a file location that is the same as this loction,
             # but the files are different, we remove the old file location and add the new one.
             if db_file_location_entry and (db_file_location_entry.file_id != file_id):
+                adjust_for_locations(db=db, location_ids=[db_file_location_entry.id], sign=-1)
+                remove_location_memberships(db=db, location_ids=[db_file_location_entry.id])
                 db.session.delete(db_file_location_entry)
                 db.session.commit()
                 db_file_location_entry = None
@@ -74,6 +84,9 @@ def add_file_to_db_task(filepath: str,  queue_id: str, archiving: bool = False):
                                                     existence_confirmed = datetime.now(),
                                                     hash_confirmed = datetime.now())
                 db.session.add(new_file_location)
+                db.session.flush()
+                adjust_for_locations(db=db, location_ids=[new_file_location.id])
+                add_location_memberships(db=db, location_ids=[new_file_location.id])
                 db.session.commit()
 
             # if the file is already in the database, update the existence_confirmed and hash_confirmed fields
@@ -107,11 +120,96 @@ def add_file_to_db_task(filepath: str,  queue_id: str, archiving: bool = False):
             utils.RQTaskUtils.failed_task_subroutine(q_id=queue_id, sql_db=db, task_result=task_results)
 
 
+def add_files_to_db_task(queue_id: str, filepaths: List[str] = None, manifest_path: str = None,
+                         hashing_workers: int = None):
+    """
+    Adds a batch of files to the database. The files are hashed concurrently and written with the bulk upserts used
+    by the file scraper, so a batch costs a handful of statements instead of one task, and several commits, per file.
+    Empty files are skipped, as they are by the scraper.
+    :param queue_id: The id of task in the worker queue.
+    :param filepaths: Paths of the files to add.
+    :param manifest_path: Path of a text file listing additional paths to add, one per line.
+    :param hashing_workers: The number of threads hashing files concurrently. Defaults to the SCRAPE_HASHING_WORKERS
+    app config value or, if that is not set, a value derived from the number of cpu cores.
+    :return: dict: A log of the files added and any errors.
+    """
+    with app.app_context():
+        db = flask.current_app.extensions['sqlalchemy']
+        add_files_log = {"queue_id": queue_id,
+                         "Manifest": manifest_path,
+                         "Files Submitted": 0,
+                         "Empty Files Skipped": 0,
+                         "Errors": []}
+        try:
+            utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db)
+            filepaths = list(filepaths or [])
+            if manifest_path:
+                with open(manifest_path, encoding="utf-8") as manifest:
+                    filepaths.extend(line.strip() for line in manifest if line.strip())
+            add_files_log["Files Submitted"] = len(filepaths)
+            
+            if not hashing_workers:
+                hashing_workers = flask.current_app.config.get("SCRAPE_HASHING_WORKERS", default_hashing_workers())
+            file_server_root_index = len(utils.FileServerUtils.split_path(flask.current_app.config.get('ARCHIVES_LOCATION')))
+            hash_cache = utils.FileHashCache.from_app(app)
+            writer = ScrapeBatchWriter(db=db,
+                                       file_server_root_index=file_server_root_index,
+                                       batch_size=flask.current_app.config.get("SCRAPE_DB_BATCH_SIZE", 500),
+                                       flush_seconds=flask.current_app.config.get("SCRAPE_DB_FLUSH_SECONDS", 10))
+            
+            def hash_file(filepath):
+                return ScrapePipeline.hash_file(filepath=filepath, root=os.path.dirname(filepath), hash_cache=hash_cache)
+
+            with ThreadPoolExecutor(max_workers=hashing_workers) as executor:
+                for scraped_file in executor.map(hash_file, filepaths):
+                    if scraped_file.error is not None:
+                        add_files_log["Errors"].append({"filepath": scraped_file.filepath,
+                                                        "Exception": str(scraped_file.error),
+                                                        "Traceback": scraped_file.traceback})
+                        continue
+                    if scraped_file.skipped:
+                        add_files_log["Empty Files Skipped"] += 1
+                        continue
+                    writer.add(scraped_file)
+            writer.close()
+            
+            add_files_log.update(writer.counts)
+            if hash_cache:
+                add_files_log.update({f"Hash Cache {stat}": value for stat, value in hash_cache.stats().items()})
+            add_files_log["Errors"].extend(writer.errors)
+            utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=add_files_log)
+            return add_files_log
+
+        except Exception as e:
+            utils.FlaskAppUtils.attempt_db_rollback(db)
+            add_files_log["Errors"].append({"Exception": str(e), "Traceback": traceback.format_exc()})
+            utils.RQTaskUtils.failed_task_subroutine(q_id=queue_id, sql_db=db, task_result=add_files_log)
+            return add_files_log
+
+
+def enqueue_add_files_tasks(db, filepaths: List[str], batch_size: int = None):
+    """
+    Enqueues add_files_to_db_task for a list of files, split into batches.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param filepaths: Paths of the files to add.
+    :param batch_size: Number of files per task. Defaults to the ADD_FILES_BATCH_SIZE app config value (500).
+    :return: list of the enqueued tasks' info dictionaries
+    """
+    batch_size = int(batch_size or flask.current_app.config.get("ADD_FILES_BATCH_SIZE", 500))
+    tasks = [(add_files_to_db_task, {"filepaths": list(filepaths[batch_start:batch_start + batch_size])})
+             for batch_start in range(0, len(filepaths), batch_size)]
+    return utils.RQTaskUtils.enqueue_many(db=db, tasks=tasks)
+
+
 def scrape_file_data_task(archives_location: str, start_location: str, file_server_root_index: int,
                           exclusion_functions: list[Callable[[str], bool]], scrape_time: timedelta,
-                          queue_id: str):
+                          queue_id: str, hashing_workers: int = None, incremental: bool = None,
+                          rehash_age: timedelta = None):
     """
     This function scrapes file data from the archives file server and adds it to the database.
+    Walking the file server, hashing files and writing to the database run as separate pipeline stages
+    (see ScrapePipeline) so that many files can be read from the file server at once. Database writes are
+    batched by ScrapeBatchWriter.
     
     :param archives_location: The location of the archives file server.
     :param start_location: The location from which to start scraping file data.
@@ -120,215 +218,184 @@ def scrape_file_data_task(archives_location: str, start_location: str, file_serv
     should be excluded from the scraping process.
     :param scrape_time: The amount of time to spend scraping file data measured in seconds.
     :param queue_id: The id of task in the worker queue.
+    :param hashing_workers: The number of threads hashing files concurrently. Defaults to the SCRAPE_HASHING_WORKERS
+    app config value or, if that is not set, a value derived from the number of cpu cores.
+    :param incremental: If True, files whose size and mtime match the values observed when their hash was last
+    confirmed are only confirmed with a stat call instead of being re-hashed. Defaults to the SCRAPE_INCREMENTAL
+    app config value (True if not set).
+    :param rehash_age: In incremental mode, files whose hash was confirmed longer ago than this are re-hashed anyway.
+    Defaults to the SCRAPE_REHASH_AGE_DAYS app config value (90 days if not set).
     """
     
     with app.app_context():
         db = flask.current_app.extensions['sqlalchemy']
-        utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db)
+        progress = utils.TaskProgressReporter(q_id=queue_id, sql_db=db)
+        progress.initiate()
+        if not hashing_workers:
+            hashing_workers = flask.current_app.config.get("SCRAPE_HASHING_WORKERS", default_hashing_workers())
+        if incremental is None:
+            incremental = bool(flask.current_app.config.get("SCRAPE_INCREMENTAL", True))
+        if rehash_age is None:
+            rehash_age = timedelta(days=int(flask.current_app.config.get("SCRAPE_REHASH_AGE_DAYS", 90)))
 
         # create a log of the scraping process
         scrape_log = {"Scrape Date": datetime.now().strftime(r"%m/%d/%Y, %H:%M:%S"),
                       "This Start Location": start_location,
+                      "Hashing Workers": int(hashing_workers),
+                      "Incremental": incremental,
                       "Files Added":0,
                       "File Locations Added":0,
+                      "File Locations Updated":0,
                       "Files Confirmed":0,
+                      "Files Confirmed By Stat":0,
                       "Errors":[],
                       "Time Elapsed":0,
                       "Next Start Location": start_location}
         start_time = time.time()
-        start_location_found = False
-        scrape_time_expired = False
-        start_location_root_found = False
-        root_dirs_paths = [os.path.join(archives_location, d) for d in os.listdir(archives_location) if os.path.isdir(os.path.join(archives_location, d))]
         
         # if no start location is provided, we will start from a random root directory
         if not start_location:
+            root_dirs_paths = [os.path.join(archives_location, d) for d in os.listdir(archives_location) if os.path.isdir(os.path.join(archives_location, d))]
             start_location = random.choice(root_dirs_paths)
 
-        # iterate through the root of the file share to find the root directory to start scrape from
-        for root_dir in cycle(root_dirs_paths):
-            if scrape_time_expired:
-                break
+        hash_cache = utils.FileHashCache.from_app(app)
+        pipeline = ScrapePipeline(archives_location=archives_location,
+                                  start_location=start_location,
+                                  exclusion_functions=exclusion_functions,
+                                  hashing_workers=hashing_workers,
+                                  incremental=incremental,
+                                  rehash_before=datetime.now() - rehash_age,
+                                  file_server_root_index=file_server_root_index,
+                                  app=app,
+                                  hash_cache=hash_cache).start()
+        writer = ScrapeBatchWriter(db=db,
+                                   file_server_root_index=file_server_root_index,
+                                   batch_size=flask.current_app.config.get("SCRAPE_DB_BATCH_SIZE", 500),
+                                   flush_seconds=flask.current_app.config.get("SCRAPE_DB_FLUSH_SECONDS", 10))
+        try:
+            for files_seen, scraped_file in enumerate(pipeline.results(deadline=start_time + scrape_time.total_seconds()), 1):
+                if files_seen % 500 == 0:
+                    progress.update({**scrape_log, **writer.counts, "Files Seen": files_seen})
+
+                if scraped_file.error:
+                    scrape_log["Errors"].append({"Filepath": scraped_file.filepath,
+                                                 "Exception": str(scraped_file.error),
+                                                 "Traceback": scraped_file.traceback})
+                    continue
 
-            if not start_location_root_found:
-                if start_location.startswith(root_dir):
-                    start_location_root_found = True
-                else:
+                # if the file is empty, move to next file
+                if scraped_file.skipped:
                     continue
-            
-            for root, _, files in os.walk(root_dir):
-
-                # if the time limit for scraping has passed, we end the scraping loop
-                if timedelta(seconds=(time.time() - start_time)) >= scrape_time:
-                    # process root to be agnostic to where the archives location is mounted
-                    scrape_time_expired = True
-                    next_start                                                                                                                                                                                                                                                                                                                                                     = utils.FileServerUtils.split_path(root)[file_server_root_index:]
-                    scrape_log["Next Start Location"] = os.path.join(*next_start)
-                    break
 
-                # We iterate through the archives folder structure until we find the location from which we want to start
-                # scraping file data.
-                if root == start_location:
-                    start_location_found = True
+                writer.add(scraped_file)
 
-                if not start_location_found:
-                    continue
+            # process root to be agnostic to where the archives location is mounted
+            if pipeline.expired:
+                next_start = utils.FileServerUtils.split_path(pipeline.next_unprocessed_root())[file_server_root_index:]
+                scrape_log["Next Start Location"] = os.path.join(*next_start) if next_start else ""
 
-                filepaths = [os.path.join(root, f) for f in files]
-                for file in filepaths:
-                    try:
-                        # if the file is excluded by one of the exclusion functions, move to next file
-                        if any([fun(file) for fun in exclusion_functions]):
-                            continue
-                        
-                        # if the file is empty, move to next file
-                        file_size = os.path.getsize(file)
-                        if file_size == 0:
-                            continue
-
-                        # if there is not an equivalent entry in database, we add it.
-                        file_is_new = False # flag to indicate if the file is new to the database
-                        file_hash = utils.FilesUtils.get_hash(filepath=file)
-                        db_file_entry = db.session.query(FileModel).filter(FileModel.hash == file_hash).first()
-                        if not db_file_entry:
-                            file_is_new = True
-                            path_list = utils.FileServerUtils.split_path(file)
-                            extension = path_list[-1].split(".")[-1].lower()
-                            model = FileModel(hash=file_hash,
-                                            size=file_size,
-                                            extension=extension)
-                            db.session.add(model)
-                            db.session.commit()
-                            db_file_entry = db.session.query(FileModel).filter(FileModel.hash == file_hash).first()
-                            scrape_log["Files Added"] += 1
-
-                        path_list = utils.FileServerUtils.split_path(file)
-                        # This is for if there is a file in the root directory of the share
-                        # (eg R:\some_file.pdf or N:\PPDORecords\some_file.pdf)
-                        file_server_dirs = ""
-                        if path_list[file_server_root_index:-1] != []:
-                            file_server_dirs = os.path.join(*path_list[file_server_root_index:-1])
-                        filename = path_list[-1]
-                        confirmed_exists_dt = datetime.now()
-                        confirmed_hash_dt = datetime.now()
-                        
-                        # If the file is not new, we check if the path is already represented in the database
-                        # and update the file database entry to reflect that the file has been checked.
-                        if not file_is_new:
-
-                            # query to see if the current path is already represented in the database
-                            db_path_entry = db.session.query(FileLocationModel).filter(
-                                FileLocationModel.file_server_directories == file_server_dirs,
-                                FileLocationModel.filename == filename).first()
-
-                            # If there is an entry for this path in the database update the dates now we have confirmed location and
-                            # that the file has not changed (hash is same.)
-                            if db_path_entry:
-                                entry_updates = {"existence_confirmed": confirmed_exists_dt,
-                                                "hash_confirmed": confirmed_hash_dt}
-                                db.session.query(FileLocationModel).filter(
-                                    FileLocationModel.file_server_directories == file_server_dirs,
-                                    FileLocationModel.filename == filename).update(entry_updates)
-                                db.session.commit()
-                                scrape_log["Files Confirmed"] += 1
-                                continue
-
-                        new_location = FileLocationModel(file_id=db_file_entry.id,
-                                                        file_server_directories=file_server_dirs,
-                                                        filename=filename, existence_confirmed=confirmed_exists_dt,
-                                                        hash_confirmed=confirmed_hash_dt)
-                        db.session.add(new_location)
-                        db.session.commit()
-                        scrape_log["File Locations Added"] += 1
+        finally:
+            pipeline.stop()
+            writer.close()
 
-                    except Exception as e:
-                        utils.FlaskAppUtils.attempt_db_rollback(db)
-                        e_dict = {"Filepath": file,
-                                  "Exception": str(e),
-                                  "Traceback": traceback.format_exc()}
-                        scrape_log["Errors"].append(e_dict)
+        scrape_log.update(writer.counts)
+        if hash_cache:
+            scrape_log.update({f"Hash Cache {stat}": value for stat, value in hash_cache.stats().items()})
+        scrape_log["Errors"].extend(writer.errors)
+        for walk_error in pipeline.walk_errors:
+            scrape_log["Errors"].append({"Filepath": None,
+                                         "Exception": str(walk_error),
+                                         "Traceback": None})
 
         # update the task entry in the database
         scrape_log["Time Elapsed"] = str(time.time() - start_time) + "s"
-        utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id,
-                                                   sql_db=db,
-                                                   task_result=scrape_log)
+        progress.complete(scrape_log)
         return scrape_log
 
 
-def confirm_file_locations_task(archive_location: str, confirming_time: timedelta, queue_id: str):
+def confirm_file_locations_task(archive_location: str, confirming_time: timedelta, queue_id: str,
+                                batch_size: int = None, existence_workers: int = None):
     """
     Reconciles file location entries in the database with the actual filesystem.
+    Locations are processed in batches, oldest confirmation first. The locations of a batch are grouped by directory
+    and each directory is listed once (concurrently) to check which files still exist, then the batch is applied
+    with one bulk UPDATE for the confirmed locations and set-based deletes for the missing locations and the files
+    left without any location.
 
     :param archive_location: str: The root archives directory to check file existence.
     :param confirming_time: timedelta: Time duration to run the confirmation process.
     :param queue_id: str: The id of this task in the worker queue.
+    :param batch_size: int: Number of locations per batch. Defaults to the CONFIRM_BATCH_SIZE app config value (5000).
+    :param existence_workers: int: Number of threads listing directories. Defaults to the CONFIRM_EXISTENCE_WORKERS
+    app config value or, if that is not set, a value derived from the number of cpu cores.
     :return: dict: A log summarizing missing, removed, and confirmed file locations and any errors.
     """
     with app.app_context():
         db = flask.current_app.extensions['sqlalchemy']
-        utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db)
+        progress = utils.TaskProgressReporter(q_id=queue_id, sql_db=db)
+        progress.initiate()
+        batch_size = int(batch_size or flask.current_app.config.get("CONFIRM_BATCH_SIZE", 5000))
+        existence_workers = existence_workers or flask.current_app.config.get("CONFIRM_EXISTENCE_WORKERS",
+                                                                              default_existence_workers())
 
         start_time = time.time()
         confirm_locations_log = {"Confirm Date": datetime.now().strftime(r"%m/%d/%Y, %H:%M:%S"),
                                  "Errors": [],
+                                 "Batches": 0,
+                                 "Directories Missing": 0,
                                  "Locations Missing": 0,
                                  "Files Removed": 0,
                                  "Files Confirmed": 0}
         
-        # We iterate through the file locations in the database, 1000 at a time, and check if the file still exists.
+        # locations whose existence check failed are left out of later batches, otherwise they would stay the
+        # oldest rows and be fetched again and again.
+        errored_ids = []
         while timedelta(seconds=(time.time() - start_time)) < confirming_time:
-            file_location_entries = db.session.query(FileLocationModel).order_by(db.asc(FileLocationModel.existence_confirmed)).limit(1000)
-            for file_location in file_location_entries:
-                try:
-                    if timedelta(seconds=(time.time() - start_time)) >= confirming_time:
-                        break
-                    
-                    file_location_path = os.path.join(archive_location, file_location.file_server_directories, file_location.filename)
-                    
-                    # if the file no longer exists, we delete the entry in the database
-                    if not os.path.exists(file_location_path):
-                        confirm_locations_log["Locations Missing"] += 1
-                        file_id = file_location.file_id
-                        db.session.delete(file_location)
-                        db.session.commit()
-                        
-                        # if there are no other locations for this file, we delete entry in the files table
-                        other_locations = db.session.query(FileLocationModel).filter(FileLocationModel.file_id == file_id).all()
-                        if other_locations == []:
-                            
-                            # check for any archive events associated with this file. Update those events to remove their file_id.
-                            archive_events = db.session.query(ArchivedFileModel).filter(ArchivedFileModel.file_id == file_id).all()
-                            if archive_events != []:
-                                for event in archive_events:
-                                    event.file_id = None
-                                db.session.commit()
-                            
-                            # delete the file entry in the database
-                            db.session.query(FileModel).filter(FileModel.id == file_id).delete()
-                            db.session.commit()
-                            confirm_locations_log["Files Removed"] += 1
-                    
-                    else:
-                        # if the file exists, we update the existence_confirmed date of this file_locations entry
-                        db.session.query(FileLocationModel).filter(FileLocationModel.id == file_location.id)\
-                            .update({"existence_confirmed": datetime.now()})
-                        db.session.commit()
-                        confirm_locations_log["Files Confirmed"] += 1
+            # if the file server is not reachable every file would look missing, so stop rather than delete everything
+            if not os.path.isdir(archive_location):
+                confirm_locations_log["Errors"].append({"Location": archive_location,
+                                                        "Exception": "Archives location is not accessible."})
+                break
+
+            try:
+                batch = stale_locations(db=db, limit=batch_size, skip_ids=errored_ids)
+                if not batch:
+                    break
                 
-                except Exception as e:
-                    utils.FlaskAppUtils.attempt_db_rollback(db)
-                    e_dict = {"Location": file_location.file_server_directories,
-                              "filename": file_location.filename,
-                              "Exception": str(e),
-                              "Traceback": traceback.format_exc()}
-                    confirm_locations_log["Errors"].append(e_dict)
+                missing_directories = check_existence(archive_location=archive_location,
+                                                      locations=batch,
+                                                      workers=existence_workers)
+                for location in batch:
+                    if location.error is not None:
+                        errored_ids.append(location.id)
+                        confirm_locations_log["Errors"].append({"Location": location.file_server_directories,
+                                                                "filename": location.filename,
+                                                                "Exception": str(location.error)})
+
+                confirmed_ids = [location.id for location in batch if location.exists]
+                missing_ids = [location.id for location in batch if location.exists is False]
+                # a directory that no longer exists takes all of its recorded locations with it, not just the
+                # ones in this batch
+                missing_ids = list(set(missing_ids) | set(directory_location_ids(db=db,
+                                                                                 directories=missing_directories)))
+                confirm_locations_log["Directories Missing"] += len(missing_directories)
+                confirm_locations_log["Files Confirmed"] += confirm_locations(db=db, location_ids=confirmed_ids)
+                locations_removed, files_removed = remove_locations(db=db, location_ids=missing_ids)
+                db.session.commit()
+                confirm_locations_log["Locations Missing"] += locations_removed
+                confirm_locations_log["Files Removed"] += files_removed
+                confirm_locations_log["Batches"] += 1
+                progress.update(confirm_locations_log)
+                
+            except Exception as e:
+                utils.FlaskAppUtils.attempt_db_rollback(db)
+                confirm_locations_log["Errors"].append({"Exception": str(e),
+                                                        "Traceback": traceback.format_exc()})
+                break
                 
         # update the task entry in the database
         confirm_locations_log["Time Elapsed"] = str(time.time() - start_time) + "s"
-        utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id,
-                                                   sql_db=db,
-                                                   task_result=confirm_locations_log)
+        progress.complete(confirm_locations_log)
         return confirm_locations_log
 
 
@@ -336,8 +403,8 @@ def scrape_location_files_task(scrape_location: str, queue_id: str, recursively:
     """
     Reconcialiates the files in the database with the files in the scrape location. First, if confirm_data is True,
     it checks if the files in the database are still in the scrape location. If they are not, it removes the relevant 
-    records. Then, it adds any files in the scrape location that are not in the database by enqueuing a task to add
-    the file to the database.
+    records. Then, it adds any files in the scrape location that are not in the database by enqueuing tasks that add
+    the files to the database in batches.
     """
     
     with app.app_context():
@@ -351,57 +418,59 @@ def scrape_location_files_task(scrape_location: str, queue_id: str, recursively:
                                "Files Records Removed": 0,
                                "Files Confirmed": 0,
                                "Files Enqueued to Add": 0,
+                               "Add Files Tasks Enqueued": 0,
                                "Errors": []}
         utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db, task_result=location_scrape_log)
-        relevant_file_data_list = []
+        # filenames already recorded in the database, keyed by file_server_directories
+        known_files = {}
         if confirm_data:
             try:
                 location_db_dirs_list = utils.FileServerUtils.split_path(scrape_location)[file_server_root_index:]
                 query_dirs = os.path.join(*location_db_dirs_list)
                 archive_location = flask.current_app.config.get('ARCHIVES_LOCATION')
-                relevant_locations = db.session.query(FileLocationModel).filter(FileLocationModel.file_server_directories.startswith(query_dirs)).all()
-                for idx, location_record in enumerate(relevant_locations):
-                    try:
-                        filepath = os.path.join(archive_location, location_record.file_server_directories, location_record.filename)
-                        
-                        # if the file no longer exists, we delete the entry in the database
-                        if not os.path.exists(filepath):
-                            location_scrape_log["Locations Missing"] += 1
-                            file_id = location_record.file_id
-                            db.session.delete(location_record)
-                            db.session.commit()
-                            
-                            # if there are no other locations for this file, we delete entry in the files table
-                            other_locations = db.session.query(FileLocationModel).filter(FileLocationModel.file_id == file_id).all()
-                            if other_locations == []:
-                                
-                                # check for any archive events associated with this file. Update those events to remove their file_id.
-                                archive_events = db.session.query(ArchivedFileModel).filter(ArchivedFileModel.file_id == file_id).all()
-                                if archive_events != []:
-                                    for event in archive_events:
-                                        event.file_id = None
-                                    db.session.commit()
-                                
-                                # delete the file entry in the database
-                                db.session.query(FileModel).filter(FileModel.id == file_id).delete()
-                                db.session.commit()
-                                location_scrape_log["Files Records Removed"] += 1
-                        
-                        else:
-                            db.session.query(FileLocationModel).filter(FileLocationModel.id == location_record.id)\
-                                .update({"existence_confirmed": datetime.now()})
+                
+                # stream the relevant locations in directory order and confirm or remove them a batch at a time as they
+                # arrive, one directory listing per directory. The stream has a connection of its own, so that the
+                # batch commits do not close its server-side cursor.
+                batch_size = int(flask.current_app.config.get("CONFIRM_BATCH_SIZE", 5000))
+                relevant_locations_query = db.select(FileLocationModel.id,
+                                                     FileLocationModel.file_id,
+                                                     FileLocationModel.file_server_directories,
+                                                     FileLocationModel.filename)\
+                    .where(utils.FileServerUtils.db_subtree_filter(FileLocationModel.directory_path, query_dirs))\
+                    .order_by(db.text("file_locations.directory_path USING ~<~"))\
+                    .execution_options(yield_per=batch_size)
+                with db.engine.connect() as stream_connection:
+                    for location_rows in stream_connection.execute(relevant_locations_query).partitions():
+                        batch = []
+                        for location_record in location_rows:
+                            known_files.setdefault(location_record.file_server_directories, set()).add(location_record.filename)
+                            batch.append(PendingLocation(id=location_record.id,
+                                                         file_id=location_record.file_id,
+                                                         file_server_directories=location_record.file_server_directories,
+                                                         filename=location_record.filename))
+                        try:
+                            check_existence(archive_location=archive_location, locations=batch)
+                            for location_record in batch:
+                                if location_record.error is not None:
+                                    location_scrape_log["Errors"].append({"Location": location_record.file_server_directories,
+                                                                          "filename": location_record.filename,
+                                                                          "Exception": str(location_record.error)})
+
+                            confirmed_ids = [location_record.id for location_record in batch if location_record.exists]
+                            missing_ids = [location_record.id for location_record in batch if location_record.exists is False]
+                            location_scrape_log["Files Confirmed"] += confirm_locations(db=db, location_ids=confirmed_ids)
+                            locations_removed, files_removed = remove_locations(db=db, location_ids=missing_ids)
                             db.session.commit()
-                            location_scrape_log["Files Confirmed"] += 1
-                    
-                    except Exception as e:
-                        utils.FlaskAppUtils.attempt_db_rollback(db)
-                        e_dict = {"Location": location_record.file_server_directories,
-                                "filename": location_record.filename,
-                                "Exception": str(e)}
-                        location_scrape_log["Errors"].append(e_dict)
+                            location_scrape_log["Locations Missing"] += locations_removed
+                            location_scrape_log["Files Records Removed"] += files_removed
 
-                # populate list of file data that is already in the database        
-                relevant_file_data_list = [(location_record.file_server_directories, location_record.filename) for location_record in relevant_locations]
+                        except Exception as e:
+                            utils.FlaskAppUtils.attempt_db_rollback(db)
+                            e_dict = {"Location": f"{batch[0].file_server_directories} to {batch[-1].file_server_directories}",
+                                      "Batch Size": len(batch),
+                                      "Exception": str(e)}
+                            location_scrape_log["Errors"].append(e_dict)
 
             except Exception as e:
                 utils.FlaskAppUtils.attempt_db_rollback(db)
@@ -411,7 +480,9 @@ def scrape_location_files_task(scrape_location: str, queue_id: str, recursively:
                 location_scrape_log["Errors"].append(e_dict)
      
         # Iterate through the files in the scrape location and add them to the database if they are not already there
-        # by enqueuing a task to add the file to the database.
+        # by enqueuing tasks that add the files to the database in batches.
+        files_to_add = []
+        add_files_batch_size = int(flask.current_app.config.get("ADD_FILES_BATCH_SIZE", 500))
         for root, _, files in os.walk(scrape_location):
             
             server_dirs_list = []
@@ -419,6 +490,7 @@ def scrape_location_files_task(scrape_location: str, queue_id: str, recursively:
             if files:
                 server_dirs_list = utils.FileServerUtils.split_path(root)[file_server_root_index:]
                 server_dirs = os.path.join(*server_dirs_list)
+            known_dir_files = known_files.get(server_dirs, set())
             
             for file in files:
                 try:
@@ -428,15 +500,11 @@ def scrape_location_files_task(scrape_location: str, queue_id: str, recursively:
                         continue
                     
                     # If the file is already in our previous query results, we move to the next file.
-                    if confirm_data:                        
-                        if (server_dirs, file) in relevant_file_data_list:
-                            continue
+                    if confirm_data and file in known_dir_files:
+                        continue
                     
                     location_scrape_log["Files Enqueued to Add"] += 1
-                    add_file_params = {"filepath": filepath}
-                    utils.RQTaskUtils.enqueue_new_task(db=db,
-                                                       enqueued_function=add_file_to_db_task, 
-                                                       task_kwargs=add_file_params)
+                    files_to_add.append(filepath)
                     
                 except Exception as e:
                     e_dict = {"Location": root,
@@ -444,10 +512,29 @@ def scrape_location_files_task(scrape_location: str, queue_id: str, recursively:
                               "Exception": str(e),
                               "Traceback": traceback.format_exc()}
                     location_scrape_log["Errors"].append(e_dict)
+
+                if len(files_to_add) >= add_files_batch_size:
+                    try:
+                        location_scrape_log["Add Files Tasks Enqueued"] += len(enqueue_add_files_tasks(db=db, filepaths=files_to_add))
+                    except Exception as e:
+                        location_scrape_log["Errors"].append({"Location": root,
+                                                              "filename": None,
+                                                              "Files In Batch": len(files_to_add),
+                                                              "Exception": str(e),
+                                                              "Traceback": traceback.format_exc()})
+                    finally:
+                        files_to_add = []
             
             if scrape_location == root and not recursively:
                 break
         
+        try:
+            location_scrape_log["Add Files Tasks Enqueued"] += len(enqueue_add_files_tasks(db=db, filepaths=files_to_add))
+        except Exception as e:
+            location_scrape_log["Errors"].append({"Location": scrape_location,
+                                                  "filename": None,
+                                                  "Exception": str(e),
+                                                  "Traceback": traceback.format_exc()})
         utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=location_scrape_log)
         return location_scrape_log
     
@@ -470,7 +557,7 @@ def consolidate_dirs_edit_task(user_target_path, user_destination_path, user_id,
         db = flask.current_app.extensions['sqlalchemy']
         utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db)
         try:
-            nqed_move_tasks = []
+            move_task_batch = []
             archive_location = flask.current_app.config.get('ARCHIVES_LOCATION')
             target_app_path = utils.FlaskAppUtils.user_path_to_app_path(path_from_user=user_target_path,
                                                                         app=flask.current_app)
@@ -484,8 +571,7 @@ def consolidate_dirs_edit_task(user_target_path, user_destination_path, user_id,
                                            new_path=user_destination_path,
                                            change_type='MOVE',
                                            exclusion_functions=[exclude_filenames, exclude_extensions])
-                    edit_nq_result = item_edit.execute()
-                    nqed_move_tasks.append(edit_nq_result.get('task_id')) if edit_nq_result else None
+                    item_edit.execute(task_batch=move_task_batch)
 
                     # record the move in the database
                     item_edit_model = ServerChangeModel(old_path = item_edit.old_path,
@@ -503,6 +589,7 @@ def consolidate_dirs_edit_task(user_target_path, user_destination_path, user_id,
                             "Exception": str(e)}
                     log["errors"].append(e_dict)
             db.session.commit()
+            nqed_move_tasks = [nq_result['task_id'] for nq_result in utils.RQTaskUtils.enqueue_many(db=db, tasks=move_task_batch)]
 
             # if the target directory is to be removed, wait until the contents are moved to remove the target directory.
             if remove_target:
@@ -590,7 +677,7 @@ def batch_move_edits_task(user_target_path, user_contents_to_move, user_destinat
         db = flask.current_app.extensions['sqlalchemy']
         utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db)
         try:
-            nqed_move_tasks = []
+            move_task_batch = []
             archive_location = flask.current_app.config.get('ARCHIVES_LOCATION')
             
             # test existence of target and destination directories
@@ -612,8 +699,7 @@ def batch_move_edits_task(user_target_path, user_contents_to_move, user_destinat
                                            new_path=user_destination_path,
                                            change_type='MOVE',
                                            exclusion_functions=[exclude_filenames, exclude_extensions])
-                    edit_nq_result = item_edit.execute()
-                    nqed_move_tasks.append(edit_nq_result.get('task_id')) if edit_nq_result else None
+                    item_edit.execute(task_batch=move_task_batch)
 
                     # record the move in the database
                     item_edit_model = ServerChangeModel(old_path = item_edit.old_path,
@@ -632,6 +718,7 @@ def batch_move_edits_task(user_target_path, user_contents_to_move, user_destinat
                               "Traceback": traceback.format_exc()}
                     log["errors"].append(e_dict)
             db.session.commit()
+            utils.RQTaskUtils.enqueue_many(db=db, tasks=move_task_batch)
             utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
             return log
 
@@ -667,6 +754,7 @@ def batch_process_inbox_task(user_id: str, inbox_path: str, notes: str, items_to
         log = {"task_id": queue_id, 'items_to_archived':items_to_archive, 'errors':[]}
         try:
             archives_location = flask.current_app.config.get('ARCHIVES_LOCATION')
+            add_file_tasks = []
             for some_item, _ in items_to_archive.items():
                 try:
                     app_destination_path = None
@@ -712,16 +800,15 @@ def batch_process_inbox_task(user_id: str, inbox_path: str, notes: str, items_to
                     db.session.add(archived_file)
                     db.session.commit()
 
-                    # enqueue a task to add the file to the database
+                    # queue up a task to add the file to the database
                     add_file_params = {"filepath": item_to_archive.get_destination_path(),
                                        "archiving": True}
-                    nq_results = utils.RQTaskUtils.enqueue_new_task(db=db,
-                                                                    enqueued_function=add_file_to_db_task,
-                                                                    task_kwargs=add_file_params)
+                    add_file_tasks.append((add_file_to_db_task, add_file_params))
                 except Exception as e:
                     log['errors'].append(f"Error archiving {item_path}:\nException: {str(e)}\nTraceback: {traceback.format_exc()}")
                     continue
             
+            utils.RQTaskUtils.enqueue_many(db=db, tasks=add_file_tasks)
             utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
             return log
         
@@ -738,4 +825,52 @@ def batch_process_inbox_task(user_id: str, inbox_path: str, notes: str, items_to
 
                                         
 
-                    
\ No newline at end of file
+                    
+
+def archive_search_task(search_run_id: int, query_text: str, search_mode: str, scope_type: str, scope_value: str,
+                        extensions: List[str], file_limit: int, user_id: int, queue_id: str):
+    """
+    Executes an archive search queued by the async mode of the archives search API. The archive_search_runs row was
+    created by the request and is finalized here; the partial results of each stage (filename, content, coverage)
+    are published to the ArchiveSearchStageCache of the run as they become available, followed by a 'complete' or
+    'failed' event.
+    :param search_run_id: id of the incomplete archive_search_runs row
+    :param file_limit: maximum number of returned canonical files
+    """
+    with app.app_context():
+        db = flask.current_app.extensions['sqlalchemy']
+        utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db)
+        log = {"task_id": queue_id, "search_run_id": search_run_id, "stages": [], "errors": []}
+        stage_cache = ArchiveSearchStageCache(search_run_id=search_run_id)
+
+        def publish_stage(stage: str, search_data: dict):
+            stage_cache.publish(stage,
+                                response=build_archive_search_api_response(search_data=search_data,
+                                                                           search_run_id=search_run_id,
+                                                                           result_limit=file_limit),
+                                status=ArchiveSearchRun.STATUS_INCOMPLETE)
+            log["stages"].append(stage)
+
+        search_request = ArchiveSearchRequest.from_values(query_text=query_text,
+                                                          search_mode=search_mode,
+                                                          requested_scope_type=scope_type,
+                                                          requested_scope_value=scope_value,
+                                                          extension_filters=extensions)
+        search_run = ArchiveSearchRun(search_request=search_request,
+                                      app=flask.current_app,
+                                      file_limit=file_limit,
+                                      user_id=user_id,
+                                      request_source="api")
+        try:
+            search_data = search_run.execute(record_id=search_run_id, stage_callback=publish_stage)
+        except Exception as e:
+            log["errors"].append({"error": str(e), "stack_trace": traceback.format_exc()})
+            stage_cache.publish("failed", status=ArchiveSearchRun.STATUS_FAILED, error="Unable to complete archive search.")
+            utils.RQTaskUtils.failed_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
+            return log
+
+        log["returned_result_count"] = len(search_data["results"])
+        log["duration_ms"] = search_run.duration_ms
+        stage_cache.publish("complete", status=ArchiveSearchRun.STATUS_SUCCESSFUL, duration_ms=search_run.duration_ms)
+        utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
+        return log
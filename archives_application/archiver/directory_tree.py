@@ -0,0 +1,266 @@
+# archives_application/archiver/directory_tree.py
+
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import bindparam, text
+
+from archives_application import utils
+
+DIRECTORY_COUNTERS = ("recursive_file_count", "recursive_bytes", "recursive_text_file_count",
+                      "recursive_text_failure_count")
+
+# Per-directory deltas of the locations matching {where}, as (directory_path, files, bytes, text_files, failed_files)
+_LOCATION_DELTAS_SQL = """
+    deltas AS (
+        SELECT fl.directory_path,
+               count(*) AS files,
+               coalesce(sum(f.size), 0) AS bytes,
+               count(fc.file_hash) AS text_files,
+               count(fcf.file_hash) AS failed_files
+        FROM file_locations fl
+        JOIN files f ON f.id = fl.file_id
+        LEFT JOIN file_contents fc ON fc.file_hash = f.hash
+        LEFT JOIN file_content_failures fcf ON fcf.file_hash = f.hash
+        WHERE {where}
+        GROUP BY fl.directory_path
+    )
+"""
+
+_SINGLE_DELTA_SQL = """
+    deltas AS (
+        SELECT CAST(:delta_path AS text) AS directory_path,
+               CAST(:delta_files AS bigint) AS files,
+               CAST(:delta_bytes AS bigint) AS bytes,
+               CAST(:delta_text_files AS bigint) AS text_files,
+               CAST(:delta_failed_files AS bigint) AS failed_files
+    )
+"""
+
+# Adds each delta to its own directory and every ancestor from depth :min_depth down to :skip_tail levels above it.
+# Rows are upserted in path order, so concurrent writers always lock the root row first and then queue behind it
+# instead of deadlocking on each other's ancestors.
+_UPSERT_SQL = """
+    WITH {deltas},
+    expanded AS (
+        SELECT CASE WHEN a.depth = 0 THEN ''
+                    ELSE array_to_string(p.parts[1:a.depth], '/') || '/' END AS path,
+               CASE WHEN a.depth = 0 THEN NULL
+                    WHEN a.depth = 1 THEN ''
+                    ELSE array_to_string(p.parts[1:a.depth - 1], '/') || '/' END AS parent_path,
+               a.depth,
+               CASE WHEN a.depth = cardinality(p.parts) THEN d.files ELSE 0 END AS direct_files,
+               d.files, d.bytes, d.text_files, d.failed_files
+        FROM deltas d
+        CROSS JOIN LATERAL (SELECT string_to_array(rtrim(d.directory_path, '/'), '/') AS parts) p
+        CROSS JOIN LATERAL generate_series(:min_depth, cardinality(p.parts) - :skip_tail) AS a(depth)
+    )
+    INSERT INTO directories AS dir (path, parent_path, depth, direct_file_count, recursive_file_count,
+                                    recursive_bytes, recursive_text_file_count, recursive_text_failure_count,
+                                    updated_at)
+    SELECT path, parent_path, depth,
+           :sign * sum(direct_files), :sign * sum(files), :sign * sum(bytes),
+           :sign * sum(text_files), :sign * sum(failed_files), :updated_at
+    FROM expanded
+    GROUP BY path, parent_path, depth
+    ORDER BY path
+    ON CONFLICT (path) DO UPDATE SET
+        direct_file_count = dir.direct_file_count + EXCLUDED.direct_file_count,
+        recursive_file_count = dir.recursive_file_count + EXCLUDED.recursive_file_count,
+        recursive_bytes = dir.recursive_bytes + EXCLUDED.recursive_bytes,
+        recursive_text_file_count = dir.recursive_text_file_count + EXCLUDED.recursive_text_file_count,
+        recursive_text_failure_count = dir.recursive_text_failure_count + EXCLUDED.recursive_text_failure_count,
+        updated_at = EXCLUDED.updated_at
+    RETURNING dir.path, dir.recursive_file_count
+"""
+
+
+def _upsert(db, deltas_sql: str, params: dict, sign: int = 1, min_depth: int = 0, skip_tail: int = 0) -> int:
+    """
+    Run _UPSERT_SQL and delete the directories left without any file. Does not commit.
+    :return: number of directories rows written
+    """
+    sql = text(_UPSERT_SQL.format(deltas=deltas_sql))
+    for key, value in params.items():
+        if isinstance(value, list):
+            sql = sql.bindparams(bindparam(key, expanding=True))
+    rows = db.session.execute(sql, {**params,
+                                    "sign": sign,
+                                    "min_depth": min_depth,
+                                    "skip_tail": skip_tail,
+                                    "updated_at": datetime.now()}).mappings().all()
+    emptied = [row["path"] for row in rows if row["recursive_file_count"] <= 0]
+    if emptied:
+        db.session.execute(text("DELETE FROM directories WHERE path IN :paths AND recursive_file_count <= 0")
+                           .bindparams(bindparam("paths", expanding=True)), {"paths": emptied})
+    return len(rows)
+
+
+def adjust_for_locations(db, location_ids: List[int], sign: int = 1) -> int:
+    """
+    Add (sign=1) or subtract (sign=-1) a set of file_locations rows from the counts of their directory and all of
+    its ancestors. The rows must exist when this is called: call it after inserting locations and before deleting
+    them. Moving a location to another directory, or pointing it at another file, is a subtraction before the
+    change and an addition after it. Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param location_ids: ids of the file_locations rows
+    :param sign: 1 to add the locations, -1 to subtract them
+    :return: number of directories rows written
+    """
+    if not location_ids:
+        return 0
+    deltas_sql = _LOCATION_DELTAS_SQL.format(where="fl.id IN :location_ids")
+    return _upsert(db, deltas_sql, {"location_ids": list(location_ids)}, sign=sign)
+
+
+def refresh_subtree(db, directory: str) -> int:
+    """
+    Recompute the directories rows of a directory subtree from file_locations (one index range scan thanks to the
+    directory_path index) and carry the change in the subtree totals up to its ancestors. Used after set-based
+    changes to a whole subtree (directory renames, moves and deletions), where the per-location deltas of
+    adjust_for_locations would cost more than recounting. Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param directory: file_server_directories value of the subtree root ('' for the whole archive)
+    :return: number of directories rows written in the subtree
+    """
+    directory_path = utils.FileServerUtils.db_directory_path(directory)
+    parts = [part for part in directory_path.split('/') if part]
+    depth = len(parts)
+
+    # lock the ancestor chain in path order (root first) before touching the subtree rows, the same order the
+    # upserts lock in, so that refreshes and location adjustments cannot deadlock
+    chain = [''] + ['/'.join(parts[:i]) + '/' for i in range(1, depth + 1)]
+    chain_rows = db.session.execute(
+        text(f"""
+            SELECT path, {', '.join(DIRECTORY_COUNTERS)}
+            FROM directories
+            WHERE path IN :chain
+            ORDER BY path
+            FOR UPDATE
+        """).bindparams(bindparam("chain", expanding=True)),
+        {"chain": chain}
+    ).mappings().all()
+    old_root = next((row for row in chain_rows if row["path"] == directory_path), None)
+
+    params = {}
+    subtree_dirs = utils.FileServerUtils.db_subtree_sql("path", directory, params)
+    db.session.execute(text(f"DELETE FROM directories WHERE {subtree_dirs}"), params)
+    params = {}
+    subtree_locations = utils.FileServerUtils.db_subtree_sql("fl.directory_path", directory, params)
+    written = _upsert(db, _LOCATION_DELTAS_SQL.format(where=subtree_locations), params, min_depth=depth)
+
+    if depth == 0:
+        return written
+
+    new_root = db.session.execute(
+        text(f"SELECT {', '.join(DIRECTORY_COUNTERS)} FROM directories WHERE path = :path"),
+        {"path": directory_path}
+    ).mappings().first()
+    change = {counter: (new_root[counter] if new_root else 0) - (old_root[counter] if old_root else 0)
+              for counter in DIRECTORY_COUNTERS}
+    if any(change.values()):
+        _upsert(db, _SINGLE_DELTA_SQL, {"delta_path": directory_path,
+                                        "delta_files": change["recursive_file_count"],
+                                        "delta_bytes": change["recursive_bytes"],
+                                        "delta_text_files": change["recursive_text_file_count"],
+                                        "delta_failed_files": change["recursive_text_failure_count"]},
+                skip_tail=1)
+    return written
+
+
+def rebuild_directory_tree(db) -> int:
+    """
+    Rebuild the whole directories table from file_locations. Text coverage counts are only refreshed by this
+    rebuild (and by subtree refreshes), since content extraction does not adjust them. Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :return: number of directories rows written
+    """
+    return refresh_subtree(db, '')
+
+
+def directory_row(db, directory: str):
+    """
+    Single-row lookup of the rolled-up counts of a directory.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param directory: file_server_directories value of the directory, using either separator
+    :return: mapping of the directories row, or None if no indexed file is in the directory subtree (or the
+    directories table has not been built)
+    """
+    return db.session.execute(text("SELECT * FROM directories WHERE path = :path"),
+                              {"path": utils.FileServerUtils.db_directory_path(directory)}).mappings().first()
+
+
+def child_directory_rows(db, directory: str):
+    """
+    Rows of the immediate child directories of a directory, each with the number of folders below it and the depth
+    of its deepest descendant relative to it.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param directory: file_server_directories value of the directory, using either separator
+    :return: list of mappings with the directories columns plus folder_count and max_depth
+    """
+    sql = text("""
+        SELECT c.*, sub.folder_count, sub.max_depth
+        FROM directories c
+        CROSS JOIN LATERAL (
+            SELECT count(*) - 1 AS folder_count, max(d.depth) - c.depth AS max_depth
+            FROM directories d
+            WHERE d.path ~>=~ c.path AND d.path ~<~ left(c.path, -1) || '0'
+        ) sub
+        WHERE c.parent_path = :path
+    """)
+    return db.session.execute(sql, {"path": utils.FileServerUtils.db_directory_path(directory)}).mappings().all()
+
+
+def summarize_directory(db, directory: str) -> dict:
+    """
+    Totals of a directory and of each of its immediate children. Read from the directories rollup rows when the
+    directory has one; otherwise the locations below the directory are aggregated in SQL, grouped by the first
+    segment of their path relative to the directory, so no location rows are loaded into Python either way.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param directory: file_server_directories value of the directory, using either separator
+    :return: dictionary with recursive_file_count, recursive_bytes and direct_file_count of the directory, and
+    children, a list of dictionaries with name, recursive_file_count, recursive_bytes, folder_count and max_depth
+    """
+    entry = directory_row(db=db, directory=directory)
+    if entry:
+        children = [{"name": row["path"].rstrip('/').split('/')[-1],
+                     "recursive_file_count": row["recursive_file_count"],
+                     "recursive_bytes": row["recursive_bytes"],
+                     "folder_count": row["folder_count"],
+                     "max_depth": row["max_depth"]}
+                    for row in child_directory_rows(db=db, directory=directory)]
+        return {"recursive_file_count": entry["recursive_file_count"],
+                "recursive_bytes": entry["recursive_bytes"],
+                "direct_file_count": entry["direct_file_count"],
+                "children": children}
+
+    directory_path = utils.FileServerUtils.db_directory_path(directory)
+    params = {"directory_path": directory_path,
+              "prefix_len": len(directory_path),
+              "child_depth": directory_path.count('/') + 1}
+    subtree = utils.FileServerUtils.db_subtree_sql("fl.directory_path", directory, params)
+    # folder counts only see directories holding files, as the locations are the only source here
+    sql = text(f"""
+        SELECT split_part(substr(fl.directory_path, :prefix_len + 1), '/', 1) AS name,
+               count(*) AS recursive_file_count,
+               coalesce(sum(f.size), 0) AS recursive_bytes,
+               count(DISTINCT fl.directory_path)
+                 - max(CASE WHEN fl.directory_path = :directory_path
+                                  || split_part(substr(fl.directory_path, :prefix_len + 1), '/', 1) || '/'
+                            THEN 1 ELSE 0 END) AS folder_count,
+               max(length(fl.directory_path) - length(replace(fl.directory_path, '/', ''))) - :child_depth
+                 AS max_depth
+        FROM file_locations fl
+        JOIN files f ON f.id = fl.file_id
+        WHERE {subtree}
+        GROUP BY 1
+    """)
+    summary = {"recursive_file_count": 0, "recursive_bytes": 0, "direct_file_count": 0, "children": []}
+    for row in db.session.execute(sql, params).mappings():
+        summary["recursive_file_count"] += row["recursive_file_count"]
+        summary["recursive_bytes"] += int(row["recursive_bytes"])
+        if row["name"] == '':
+            summary["direct_file_count"] = row["recursive_file_count"]
+        else:
+            summary["children"].append({**row, "recursive_bytes": int(row["recursive_bytes"])})
+    return summary
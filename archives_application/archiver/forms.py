@@ -175,6 +175,7 @@ class ArchiveSearchForm(FlaskForm):
             ('combined', 'Filename/path + document text'),
             ('filename_only', 'Filename only'),
             ('filepath', 'Filename/path'),
+            ('filename_fragment', 'Filename fragment/fuzzy'),
             ('content', 'Document text'),
         ],
         default='combined'
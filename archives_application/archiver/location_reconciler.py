@@ -0,0 +1,207 @@
+# archives_application/archiver/location_reconciler.py
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Tuple
+
+from sqlalchemy import bindparam, text
+
+from archives_application.archiver.directory_tree import adjust_for_locations
+from archives_application.archiver.project_membership import remove_location_memberships
+
+
+def default_existence_workers() -> int:
+    """
+    Default number of threads listing directories. Each listing is a network round trip on the file server
+    mount, so more threads than cores are worthwhile.
+    """
+    return min(32, (os.cpu_count() or 1) * 4)
+
+
+@dataclass
+class PendingLocation:
+    """A file_locations row whose existence on the file server is being checked."""
+    id: int
+    file_id: int
+    file_server_directories: str
+    filename: str
+    exists: bool = None
+    error: Exception = None
+
+
+def stale_locations(db, limit: int, skip_ids: List[int] = None) -> List[PendingLocation]:
+    """
+    Fetch the file_locations rows whose existence was confirmed longest ago (never confirmed first). Rows confirmed
+    at the same time are ordered by directory so that a batch covers few directories.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param limit: maximum number of rows to fetch
+    :param skip_ids: ids of rows to leave out, eg rows whose check raised an error earlier in the run
+    :return: list of PendingLocation objects
+    """
+    sql = text("""
+        SELECT id, file_id, file_server_directories, filename
+        FROM file_locations
+        WHERE NOT (id IN :skip_ids)
+        ORDER BY existence_confirmed ASC NULLS FIRST, file_server_directories
+        LIMIT :limit
+    """).bindparams(bindparam("skip_ids", expanding=True))
+    rows = db.session.execute(sql, {"skip_ids": list(skip_ids or []), "limit": limit}).mappings()
+    return [PendingLocation(id=row["id"],
+                            file_id=row["file_id"],
+                            file_server_directories=row["file_server_directories"],
+                            filename=row["filename"]) for row in rows]
+
+
+def _directory_entry_names(directory: str):
+    """
+    List a directory with a single os.scandir call.
+    :return: set of entry names, or None if the directory does not exist
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries}
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def check_existence(archive_location: str, locations: List[PendingLocation], workers: int = None) -> List[str]:
+    """
+    Set the exists (or error) attribute of each location. Locations are grouped by directory and each directory is
+    listed once with os.scandir, so a directory holding thousands of pending locations costs one read on the file
+    server instead of thousands of stat calls. Directories are listed concurrently.
+
+    The file server mount is case-insensitive while the listing membership test is not, so a filename that only
+    matches an entry when case is ignored falls back to os.path.exists.
+    :param archive_location: root of the archives file server
+    :param locations: locations to check
+    :param workers: number of threads. Defaults to default_existence_workers().
+    :return: file_server_directories values of the directories that no longer exist
+    """
+    by_directory = {}
+    for location in locations:
+        by_directory.setdefault(location.file_server_directories or "", []).append(location)
+
+    def check(directory: str):
+        directory_locations = by_directory[directory]
+        directory_path = os.path.join(archive_location, directory)
+        try:
+            names = _directory_entry_names(directory_path)
+            if names is None:
+                for location in directory_locations:
+                    location.exists = False
+                return True
+
+            folded_names = None
+            for location in directory_locations:
+                if location.filename in names:
+                    location.exists = True
+                    continue
+                if folded_names is None:
+                    folded_names = {name.casefold() for name in names}
+                location.exists = location.filename.casefold() in folded_names \
+                    and os.path.exists(os.path.join(directory_path, location.filename))
+        except Exception as e:
+            for location in directory_locations:
+                location.error = e
+        return False
+
+    with ThreadPoolExecutor(max_workers=workers or default_existence_workers()) as executor:
+        directory_missing = executor.map(check, list(by_directory))
+        return [directory for directory, missing in zip(list(by_directory), directory_missing) if missing]
+
+
+def directory_location_ids(db, directories: List[str]) -> List[int]:
+    """
+    Ids of every file_locations row recorded in the given directories.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param directories: file_locations.file_server_directories values
+    :return: list of file_locations ids
+    """
+    if not directories:
+        return []
+    sql = text("SELECT id FROM file_locations WHERE file_server_directories IN :directories")\
+        .bindparams(bindparam("directories", expanding=True))
+    return db.session.execute(sql, {"directories": list(directories)}).scalars().all()
+
+
+def confirm_locations(db, location_ids: List[int], confirmed_dt: datetime = None) -> int:
+    """
+    Set existence_confirmed for a set of file_locations rows in one statement. Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param location_ids: ids of the confirmed rows
+    :param confirmed_dt: confirmation time. Defaults to now.
+    :return: number of rows updated
+    """
+    if not location_ids:
+        return 0
+    sql = text("UPDATE file_locations SET existence_confirmed = :confirmed_dt WHERE id IN :location_ids")\
+        .bindparams(bindparam("location_ids", expanding=True))
+    result = db.session.execute(sql, {"confirmed_dt": confirmed_dt or datetime.now(),
+                                      "location_ids": list(location_ids)})
+    return result.rowcount
+
+
+def remove_locations(db, location_ids: List[int]) -> Tuple[int, int]:
+    """
+    Delete a set of file_locations rows and then every files row left without any location, set-based (see
+    remove_orphaned_files). The directory rollups and project memberships are adjusted for the removed locations.
+    Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param location_ids: ids of the file_locations rows to delete
+    :return: tuple of (number of locations removed, number of files removed)
+    """
+    if not location_ids:
+        return 0, 0
+
+    adjust_for_locations(db=db, location_ids=location_ids, sign=-1)
+    remove_location_memberships(db=db, location_ids=location_ids)
+    delete_locations_sql = text("DELETE FROM file_locations WHERE id IN :location_ids RETURNING file_id")\
+        .bindparams(bindparam("location_ids", expanding=True))
+    removed_file_ids = db.session.execute(delete_locations_sql,
+                                          {"location_ids": list(location_ids)}).scalars().all()
+    return len(removed_file_ids), remove_orphaned_files(db=db, file_ids=removed_file_ids)
+
+
+def remove_orphaned_files(db, file_ids: List[int]) -> int:
+    """
+    Delete the files rows among file_ids that no longer have any location. Archive events pointing at a removed file
+    keep their record but lose their file_id, and rows keyed by the removed file hashes (date mentions, contents,
+    content failures, project memberships) are deleted first in case the ON DELETE CASCADE constraints are missing. Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param file_ids: ids of files that may have lost their last location
+    :return: number of files removed
+    """
+    if not file_ids:
+        return 0
+
+    # lock the orphaned files so that a concurrent insert of a new location for one of them waits for this
+    # transaction instead of racing the delete below
+    orphans_sql = text("""
+        SELECT f.id, f.hash
+        FROM files f
+        WHERE f.id IN :file_ids
+        AND NOT EXISTS (SELECT 1 FROM file_locations fl WHERE fl.file_id = f.id)
+        FOR UPDATE OF f
+    """).bindparams(bindparam("file_ids", expanding=True))
+    orphans = db.session.execute(orphans_sql, {"file_ids": list(set(file_ids))}).mappings().all()
+    if not orphans:
+        return 0
+
+    orphan_params = {"file_ids": [row["id"] for row in orphans],
+                     "file_hashes": [row["hash"] for row in orphans]}
+    statements = [
+        "UPDATE archived_files SET file_id = NULL WHERE file_id IN :file_ids",
+        "DELETE FROM file_date_mentions WHERE file_hash IN :file_hashes",
+        "DELETE FROM file_contents WHERE file_hash IN :file_hashes",
+        "DELETE FROM file_content_failures WHERE file_hash IN :file_hashes",
+        "DELETE FROM project_file_hashes WHERE file_hash IN :file_hashes",
+        "DELETE FROM files WHERE id IN :file_ids",
+    ]
+    for statement in statements:
+        params = {k: v for k, v in orphan_params.items() if f":{k}" in statement}
+        sql = text(statement).bindparams(*[bindparam(k, expanding=True) for k in params])
+        db.session.execute(sql, params)
+
+    return len(orphans)
@@ -0,0 +1,197 @@
+# archives_application/archiver/project_membership.py
+
+from typing import List
+
+from sqlalchemy import bindparam, text
+
+from archives_application import utils
+
+# A projects.file_server_location value normalized like the archive search scope roots: either separator, no
+# surrounding slashes and no leading 'Records/'
+_NORMALIZED_ROOT_SQL = r"""
+    regexp_replace(btrim(regexp_replace(btrim(coalesce({column}, '')), '[\\/]+', '/', 'g'), '/'), '^records/', '', 'i')
+"""
+
+# Subtree bounds, in the file_locations.directory_path range convention (see FileServerUtils.db_subtree_bounds), of
+# the project roots recorded in project_membership_roots. Projects without a recorded root get no memberships until
+# refresh_project_memberships or rebuild_project_memberships records one, and are searched by path prefix meanwhile.
+_PROJECT_ROOTS_SQL = """
+    project_roots AS (
+        SELECT project_id, root || '/' AS lower_bound, root || '0' AS upper_bound
+        FROM project_membership_roots
+        WHERE {where}
+    )
+"""
+
+# Records the current normalized root of the projects matching {where}, whose previous roots have been deleted
+_RECORD_ROOTS_SQL = f"""
+    INSERT INTO project_membership_roots (project_id, root, refreshed_at)
+    SELECT id, root, now()
+    FROM (
+        SELECT id, {_NORMALIZED_ROOT_SQL.format(column="file_server_location")} AS root
+        FROM projects
+        WHERE {{where}}
+    ) p
+    WHERE p.root <> ''
+"""
+
+# Inserts the (project, file hash) pairs of the file_locations rows matching {where} that lie under a project root
+_INSERT_SQL = """
+    WITH {project_roots}
+    INSERT INTO project_file_hashes (project_id, file_hash)
+    SELECT DISTINCT pr.project_id, f.hash
+    FROM project_roots pr
+    JOIN file_locations fl
+      ON fl.directory_path ~>=~ pr.lower_bound AND fl.directory_path ~<~ pr.upper_bound
+    JOIN files f ON f.id = fl.file_id
+    WHERE {where}
+    ORDER BY pr.project_id, f.hash
+    ON CONFLICT DO NOTHING
+"""
+
+
+def add_location_memberships(db, location_ids: List[int]) -> int:
+    """
+    Record the project membership of the files of newly inserted or repointed file_locations rows. Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param location_ids: ids of the file_locations rows
+    :return: number of project_file_hashes rows inserted
+    """
+    if not location_ids:
+        return 0
+    sql = text(_INSERT_SQL.format(project_roots=_PROJECT_ROOTS_SQL.format(where="TRUE"),
+                                  where="fl.id IN :location_ids"))\
+        .bindparams(bindparam("location_ids", expanding=True))
+    return db.session.execute(sql, {"location_ids": list(location_ids)}).rowcount
+
+
+def remove_location_memberships(db, location_ids: List[int]) -> int:
+    """
+    Remove the project membership that a set of file_locations rows gives their files, unless another location of
+    the same file keeps the file in the project. Called before the rows are deleted or repointed to another file.
+    Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param location_ids: ids of the file_locations rows that are about to go away
+    :return: number of project_file_hashes rows deleted
+    """
+    if not location_ids:
+        return 0
+    sql = text(f"""
+        WITH {_PROJECT_ROOTS_SQL.format(where="TRUE")},
+        leaving AS (
+            SELECT DISTINCT pr.project_id, pr.lower_bound, pr.upper_bound, fl.file_id, f.hash AS file_hash
+            FROM file_locations fl
+            JOIN files f ON f.id = fl.file_id
+            JOIN project_roots pr
+              ON fl.directory_path ~>=~ pr.lower_bound AND fl.directory_path ~<~ pr.upper_bound
+            WHERE fl.id IN :location_ids
+        )
+        DELETE FROM project_file_hashes pfh
+        USING leaving l
+        WHERE pfh.project_id = l.project_id
+        AND pfh.file_hash = l.file_hash
+        AND NOT EXISTS (
+            SELECT 1 FROM file_locations other
+            WHERE other.file_id = l.file_id
+            AND NOT (other.id IN :location_ids)
+            AND other.directory_path ~>=~ l.lower_bound AND other.directory_path ~<~ l.upper_bound
+        )
+    """).bindparams(bindparam("location_ids", expanding=True))
+    return db.session.execute(sql, {"location_ids": list(location_ids)}).rowcount
+
+
+def refresh_file_memberships(db, file_ids: List[int]) -> int:
+    """
+    Recompute the project membership of a set of files from their current locations, for changes that are not
+    tracked location by location (directory moves and deletions). Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param file_ids: ids of the files whose locations changed
+    :return: number of project_file_hashes rows inserted
+    """
+    if not file_ids:
+        return 0
+    params = {"file_ids": list(set(file_ids))}
+    delete_sql = text("""
+        DELETE FROM project_file_hashes
+        WHERE file_hash IN (SELECT hash FROM files WHERE id IN :file_ids)
+    """).bindparams(bindparam("file_ids", expanding=True))
+    db.session.execute(delete_sql, params)
+    insert_sql = text(_INSERT_SQL.format(project_roots=_PROJECT_ROOTS_SQL.format(where="TRUE"),
+                                         where="fl.file_id IN :file_ids"))\
+        .bindparams(bindparam("file_ids", expanding=True))
+    return db.session.execute(insert_sql, params).rowcount
+
+
+def refresh_subtree_memberships(db, directory: str) -> int:
+    """
+    Recompute the project membership of every file with a location in a directory subtree, eg after the subtree was
+    moved there. Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param directory: file_server_directories value of the directory, using either separator
+    :return: number of project_file_hashes rows inserted
+    """
+    params = {}
+    subtree_clause = utils.FileServerUtils.db_subtree_sql("directory_path", directory, params)
+    file_ids = db.session.execute(
+        text(f"SELECT DISTINCT file_id FROM file_locations WHERE {subtree_clause}"), params
+    ).scalars().all()
+    return refresh_file_memberships(db=db, file_ids=file_ids)
+
+
+def refresh_project_memberships(db, project_ids: List[int]) -> int:
+    """
+    Recompute the membership of a set of projects from their current file_server_location, eg after it changed, and
+    record the roots it was built from. Does not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param project_ids: ids of the projects
+    :return: number of project_file_hashes rows inserted
+    """
+    if not project_ids:
+        return 0
+    params = {"project_ids": list(set(project_ids))}
+    for table in ("project_file_hashes", "project_membership_roots"):
+        delete_sql = text(f"DELETE FROM {table} WHERE project_id IN :project_ids")\
+            .bindparams(bindparam("project_ids", expanding=True))
+        db.session.execute(delete_sql, params)
+    record_sql = text(_RECORD_ROOTS_SQL.format(where="id IN :project_ids"))\
+        .bindparams(bindparam("project_ids", expanding=True))
+    db.session.execute(record_sql, params)
+    insert_sql = text(_INSERT_SQL.format(project_roots=_PROJECT_ROOTS_SQL.format(where="project_id IN :project_ids"),
+                                         where="TRUE"))\
+        .bindparams(bindparam("project_ids", expanding=True))
+    return db.session.execute(insert_sql, params).rowcount
+
+
+def rebuild_project_memberships(db) -> int:
+    """
+    Rebuild the whole project_file_hashes and project_membership_roots tables from projects and file_locations. Does
+    not commit.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :return: number of project_file_hashes rows written
+    """
+    db.session.execute(text("DELETE FROM project_file_hashes"))
+    db.session.execute(text("DELETE FROM project_membership_roots"))
+    db.session.execute(text(_RECORD_ROOTS_SQL.format(where="TRUE")))
+    insert_sql = text(_INSERT_SQL.format(project_roots=_PROJECT_ROOTS_SQL.format(where="TRUE"), where="TRUE"))
+    return db.session.execute(insert_sql).rowcount
+
+
+def current_membership_project_ids(db, project_ids: List[int]) -> List[int]:
+    """
+    Return the projects whose project_file_hashes rows were built from their current file_server_location. The other
+    projects were added or relocated by the project sync since their membership was last refreshed, so their rows
+    are missing or stale.
+    :param db: flask_sqlalchemy.SQLAlchemy instance
+    :param project_ids: ids of the projects to check
+    :return: ids of the projects with current membership
+    """
+    if not project_ids:
+        return []
+    sql = text(f"""
+        SELECT pmr.project_id
+        FROM project_membership_roots pmr
+        JOIN projects p ON p.id = pmr.project_id
+        WHERE pmr.project_id IN :project_ids
+        AND pmr.root = {_NORMALIZED_ROOT_SQL.format(column="p.file_server_location")}
+    """).bindparams(bindparam("project_ids", expanding=True))
+    return db.session.execute(sql, {"project_ids": list(set(project_ids))}).scalars().all()
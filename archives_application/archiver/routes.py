@@ -1,24 +1,30 @@
 # archives_application/archiver/routes.py
 
+import csv
 import datetime
 import flask
 import flask_sqlalchemy
+import hmac
 import io
 import json
 import os
 import random
+import openpyxl
 import shutil
+import time
 import traceback
 import pandas as pd
 from pathlib import PureWindowsPath
 from datetime import timedelta, datetime
 from flask_login import login_required, current_user
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from sqlalchemy import func
 
 
 # imports from this application
 import archives_application.archiver.forms as archiver_forms
 from archives_application.archiver import archive_search as archive_search_service
+from archives_application.archiver import directory_tree
 from archives_application.archiver.archival_file import ArchivalFile
 from archives_application import utils
 from archives_application.models import *
@@ -173,10 +179,13 @@ def _format_bytes(byte_count: int) -> str:
         value /= 1024.0
     return f"{int(byte_count)} B"
 
-def _build_dir_contents_summary_df(user_path: str) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, dict]:
+DIR_CONTENTS_CSV_COLUMNS = ["Directory", "Filename", "File Path", "Size", "Size Bytes", "Extracted Text Length"]
+
+
+def _resolve_dir_contents_path(user_path: str) -> tuple[str, str]:
     """
-    Build a summary dataframe for immediate children of the provided user path.
-    Uses the database for aggregation and filesystem only for timestamps.
+    Validate a user path for the directory contents summary and convert it to its database directory.
+    :return: tuple of (db_dir, db_dir_norm) as returned by FileServerUtils.app_path_to_db_dir
     """
     archives_location = flask.current_app.config.get('ARCHIVES_LOCATION')
     user_archives_location = flask.current_app.config.get('USER_ARCHIVES_LOCATION')
@@ -195,123 +204,87 @@ def _build_dir_contents_summary_df(user_path: str) -> tuple[pd.DataFrame, pd.Dat
     if os.path.commonpath([archives_location_abs, resolved_abs]) != archives_location_abs:
         raise ValueError(f"Path is outside archives location: {resolved_path}")
 
-    db_dir, db_dir_norm = utils.FileServerUtils.app_path_to_db_dir(resolved_path, archives_location_abs)
+    return utils.FileServerUtils.app_path_to_db_dir(resolved_path, archives_location_abs)
 
-    locations_query = db.session.query(
-        FileLocationModel.file_server_directories,
+
+def _dir_contents_files_query(db_dir: str, recursive: bool, order_by_size: bool = False):
+    """
+    Select statement for the files directly in a directory, or in it and all of its subdirectories.
+    Ordered by filename (or largest first) so that it can be paginated or streamed.
+    """
+    query = db.select(
+        FileLocationModel.directory_path,
         FileLocationModel.filename,
         FileModel.size,
         FileContentModel.text_length
     ).join(FileModel, FileLocationModel.file_id == FileModel.id
     ).outerjoin(FileContentModel, FileModel.hash == FileContentModel.file_hash)
 
-    # Fetch all rows under the directory prefix (single query per view).
-    # Include both files directly in the target dir (exact match on db_dir) and files in subdirectories
-    # (LIKE db_dir_norm%). Without the OR, files whose file_server_directories == db_dir (no trailing slash)
-    # are silently excluded by the LIKE filter alone.
-    locations_query = locations_query.filter(FileLocationModel.file_server_directories.isnot(None))
-    if db_dir_norm:
-        from sqlalchemy import or_ as _or
-        locations_query = locations_query.filter(
-            _or(
-                FileLocationModel.file_server_directories == db_dir,
-                FileLocationModel.file_server_directories.like(f"{db_dir_norm}%")
-            )
-        )
+    if recursive:
+        query = query.where(utils.FileServerUtils.db_subtree_filter(FileLocationModel.directory_path, db_dir))
+    else:
+        query = query.where(FileLocationModel.directory_path == utils.FileServerUtils.db_directory_path(db_dir))
 
-    # Note: folder counts and presence are derived solely from file rows; empty folders are not represented.
-    aggregates = {}
-    current_path_file_rows = []
-    all_recursive_file_rows = []
-    unique_descendant_dirs = set()
-    total_files = 0
-    total_size_bytes = 0
-
-    for dir_path, filename, size, text_length in locations_query:
-        if not dir_path:
-            continue
-        dir_path = dir_path.replace('\\', '/')
-        if db_dir_norm:
-            if dir_path == db_dir:
-                # File is directly in the target directory (stored without trailing slash).
-                relative_tail = ''
-            elif dir_path.startswith(db_dir_norm):
-                relative_tail = dir_path[len(db_dir_norm):]
-            else:
-                continue
-        else:
-            relative_tail = dir_path
+    if order_by_size:
+        return query.order_by(FileModel.size.desc(), FileLocationModel.id)
+    return query.order_by(FileLocationModel.filename, FileLocationModel.directory_path, FileLocationModel.id)
 
-        file_size = int(size) if size else 0
-        total_files += 1
-        total_size_bytes += file_size
 
+def _dir_contents_file_records(rows, user_path: str, db_dir_norm: str):
+    """
+    Lazily convert rows of _dir_contents_files_query into the records of the recursive file listing.
+    """
+    for dir_path, filename, size, text_length in rows:
+        relative_tail = dir_path[len(db_dir_norm):].rstrip('/')
+        file_size = int(size) if size else 0
         file_directory_user_path = user_path if relative_tail == '' else str(PureWindowsPath(user_path) / relative_tail)
         file_full_user_path = str(PureWindowsPath(file_directory_user_path) / filename) if filename else file_directory_user_path
-        all_recursive_file_rows.append({
+        yield {
             "Directory": file_directory_user_path,
             "Filename": filename,
             "File Path": file_full_user_path,
             "Size": _format_bytes(file_size),
             "Size Bytes": file_size,
             "Extracted Text Length": text_length if text_length is not None else "",
-        })
+        }
 
-        if relative_tail == '':
-            if not filename:
-                continue
-            current_path_file_rows.append({
-                "Filename": filename,
-                "Size": _format_bytes(file_size),
-                "Extracted Text Length": text_length if text_length is not None else "",
-                "_size_bytes": file_size,
-            })
-            continue
 
-        child_dir = relative_tail.split('/')[0]
-        unique_descendant_dirs.add(relative_tail)
-        depth_segments = relative_tail.split('/')
-        internal_depth = max(len(depth_segments) - 1, 0)
-        # All descendants under the same immediate child directory are aggregated together.
-        key = child_dir
-        agg = aggregates.get(key)
-        if not agg:
-            agg = {
-                "name": child_dir,
-                "file_count": 0,
-                "total_size": 0,
-                "dir_set": {child_dir},
-                "max_depth": 0,
-            }
-            aggregates[key] = agg
-        agg["file_count"] += 1
-        agg["total_size"] += file_size
-        agg["dir_set"].add(relative_tail)
-        if internal_depth > agg["max_depth"]:
-            agg["max_depth"] = internal_depth
+def _build_dir_contents_summary(user_path: str) -> tuple[pd.DataFrame, dict]:
+    """
+    Build a summary dataframe for immediate children of the provided user path.
+    The aggregation happens in the database (see directory_tree.summarize_directory); file listings are
+    produced separately with _dir_contents_files_query.
+    :return: tuple of (child directories dataframe, template context)
+    """
+    user_archives_location = flask.current_app.config.get('USER_ARCHIVES_LOCATION')
+    db_dir, db_dir_norm = _resolve_dir_contents_path(user_path)
+
+    # Note: folder counts and presence are derived solely from file rows; empty folders are not represented.
+    directory_summary = directory_tree.summarize_directory(db=db, directory=db_dir)
+    total_files = directory_summary["recursive_file_count"]
+    total_size_bytes = directory_summary["recursive_bytes"]
+    children = directory_summary["children"]
 
     parent_total = total_size_bytes
     rows = []
-    for agg in aggregates.values():
-        file_count = agg["file_count"]
-        total_size = agg["total_size"]
+    for child in children:
+        total_size = child["recursive_bytes"]
         # Build drill-down URL using user-visible path conventions.
-        child_db_dir = f"{db_dir_norm}{agg['name']}" if db_dir_norm else agg['name']
+        child_db_dir = f"{db_dir_norm}{child['name']}" if db_dir_norm else child['name']
         child_user_path = utils.FileServerUtils.user_path_from_db_data(
             file_server_directories=child_db_dir,
             user_archives_location=user_archives_location,
             user_location_networked=False
         )
-        name_display = f"<a href=\"{flask.url_for('archiver.dir_contents_summary', path=child_user_path)}\">{agg['name']}</a>"
-        folder_count = max(len(agg["dir_set"]) - 1, 0)
+        name_display = f"<a href=\"{flask.url_for('archiver.dir_contents_summary', path=child_user_path)}\">{child['name']}</a>"
 
         percent_of_parent = 0.0 if parent_total == 0 else round((total_size / parent_total) * 100, 1)
 
         rows.append({
             "Name": name_display,
-            "# Files": file_count,
-            "# Folders": folder_count,
-            "Depth": agg.get("max_depth", 0),
+            "# Files": child["recursive_file_count"],
+            "# Folders": child["folder_count"],
+            "Depth": child["max_depth"],
             "Size": _format_bytes(total_size),
             "% of Current": f"{percent_of_parent:.1f}%",
             "_size_bytes": total_size,
@@ -322,26 +295,14 @@ def _build_dir_contents_summary_df(user_path: str) -> tuple[pd.DataFrame, pd.Dat
         summary_df.sort_values(by="_size_bytes", ascending=False, inplace=True)
         summary_df.drop(columns=["_size_bytes"], inplace=True)
 
-    current_files_df = pd.DataFrame(current_path_file_rows)
-    if not current_files_df.empty:
-        current_files_df.sort_values(by="_size_bytes", ascending=False, inplace=True)
-        current_files_df.drop(columns=["_size_bytes"], inplace=True)
-        current_files_df.sort_values(by="Filename", inplace=True)
-
-    all_recursive_files_df = pd.DataFrame(all_recursive_file_rows)
-    if not all_recursive_files_df.empty:
-        all_recursive_files_df.sort_values(by="Size Bytes", ascending=False, inplace=True)
-        all_recursive_files_df.sort_values(by="Filename", inplace=True)
-
-    current_path_size_bytes = sum(row["_size_bytes"] for row in current_path_file_rows)
-
+    current_path_size_bytes = total_size_bytes - sum(child["recursive_bytes"] for child in children)
     summary_stats = {
         "Total Files (Current Path + Subfolders)": f"{total_files:,}",
         "Total Size (Current Path + Subfolders)": _format_bytes(total_size_bytes),
         "Total Size (GB)": f"{round(total_size_bytes / (1024 ** 3), 3):,.3f}",
-        "Child Directories": f"{len(aggregates):,}",
-        "Subfolders (All Levels)": f"{len(unique_descendant_dirs):,}",
-        "Files in Current Path": f"{len(current_path_file_rows):,}",
+        "Child Directories": f"{len(children):,}",
+        "Subfolders (All Levels)": f"{sum(child['folder_count'] + 1 for child in children):,}",
+        "Files in Current Path": f"{directory_summary['direct_file_count']:,}",
         "Size in Current Directory": _format_bytes(current_path_size_bytes),
     }
 
@@ -359,8 +320,12 @@ def _build_dir_contents_summary_df(user_path: str) -> tuple[pd.DataFrame, pd.Dat
         "user_path": user_path,
         "parent_path": parent_path,
         "summary_stats": summary_stats,
+        "db_dir": db_dir,
+        "db_dir_norm": db_dir_norm,
+        "direct_file_count": directory_summary["direct_file_count"],
+        "recursive_file_count": total_files,
     }
-    return summary_df, current_files_df, all_recursive_files_df, context
+    return summary_df, context
 
 
 @archiver.route("/api/server_change", methods=['GET', 'POST'])
@@ -1968,7 +1933,35 @@ def retrieve_location_to_start_scraping():
         location = os.path.join(location, previous_scrape_location)
     return location
 
-    
+
+def retrieve_bool_request_param(param_name: str):
+    """
+    Retrieves an optional boolean request parameter. A JSON request body may send a boolean; string values from the
+    query string, headers, form data or JSON body may be 'true', '1', 'yes', 'false', '0' or 'no' (any case).
+
+    :param param_name: the name of the parameter to retrieve
+    :return: True, False, or None if the parameter was not sent
+    :raises ValueError: if the parameter has any other value
+    """
+    param_value = utils.FlaskAppUtils.retrieve_request_param(param_name, None)
+    if param_value is None and flask.request.is_json:
+        # retrieve_request_param treats a JSON false as missing
+        json_data = flask.request.get_json(silent=True)
+        if isinstance(json_data, dict):
+            param_value = json_data.get(param_name)
+    if param_value is None:
+        return None
+    if isinstance(param_value, bool):
+        return param_value
+    if isinstance(param_value, str):
+        normalized_value = param_value.strip().lower()
+        if normalized_value in ('true', '1', 'yes'):
+            return True
+        if normalized_value in ('false', '0', 'no'):
+            return False
+    raise ValueError(f"Invalid value for {param_name}: {param_value!r}. Expected true or false.")
+
+
 @archiver.route("/scrape_files", methods=['GET', 'POST'])
 @archiver.route("/api/scrape_files", methods=['GET', 'POST'])
 def scrape_files():
@@ -1984,6 +1977,10 @@ def scrape_files():
         start_path (str, optional): The server path from which to start scraping files. Defaults to the root archive path.
         scrape_time (int, optional): The duration in minutes for which the scraping task should run. Defaults to 60 minutes.
         recursive (bool, optional): Whether to recursively scrape subdirectories. Defaults to True.
+        hashing_workers (int, optional): Number of threads hashing files concurrently. Defaults to the
+            SCRAPE_HASHING_WORKERS config value, or a value based on the number of cpu cores.
+        incremental (bool, optional): Only re-hash files whose size or modification time changed since their
+            hash was last confirmed. Defaults to the SCRAPE_INCREMENTAL config value (True if not set).
 
     Headers:
         Content-Type (str): Should be 'application/x-www-form-urlencoded' or 'application/json'.
@@ -2070,6 +2067,12 @@ def scrape_files():
             if utils.FlaskAppUtils.retrieve_request_param('scrape_time', None):
                 scrape_time = int(utils.FlaskAppUtils.retrieve_request_param('scrape_time'))
             scrape_time = timedelta(minutes=scrape_time)
+            hashing_workers = utils.FlaskAppUtils.retrieve_request_param('hashing_workers', None)
+            hashing_workers = int(hashing_workers) if hashing_workers else None
+            try:
+                incremental = retrieve_bool_request_param('incremental')
+            except ValueError as e:
+                return flask.Response(str(e), status=400)
             # Create our own job id to pass to the task so it can manipulate and query its own representation 
             # in the database and Redis.
             scrape_job_id = f"{scrape_file_data_task.__name__}_{datetime.now().strftime(r'%Y%m%d%H%M%S')}" 
@@ -2078,7 +2081,9 @@ def scrape_files():
                              "file_server_root_index": file_server_root_index,
                              "exclusion_functions": [exclude_extensions, exclude_filenames],
                              "scrape_time": scrape_time,
-                             "queue_id": scrape_job_id}
+                             "queue_id": scrape_job_id,
+                             "hashing_workers": hashing_workers,
+                             "incremental": incremental}
             
             # set the result_ttl to 12 hours (43200 seconds) so that the results are not deleted from Redis
             nq_call_kwargs = {'result_ttl': 43200}
@@ -2346,7 +2351,8 @@ def test_confirm_files():
 @archiver.route("/dir_contents_summary", methods=['GET', 'POST'])
 def dir_contents_summary():
     """
-    Render a directory contents summary table for the requested path.
+    Render a directory contents summary table for the requested path, with one page of either the files directly in
+    the directory (listing=current, the default) or all files below it (listing=recursive).
     """
     form = archiver_forms.DirContentsSummaryForm()
     user_path = None
@@ -2361,33 +2367,55 @@ def dir_contents_summary():
         return flask.render_template('dir_contents_summary_form.html', title='Directory Contents Summary', form=form)
 
     try:
-        summary_df, current_files_df, _, context = _build_dir_contents_summary_df(user_path=user_path)
+        summary_df, context = _build_dir_contents_summary(user_path=user_path)
         summary_table_html = None if summary_df.empty else utils.html_table_from_df(
             df=summary_df,
             html_columns=['Name']
         )
-        
-        # Apply 300-file safety cap for HTML rendering
-        files_exceed_limit = len(current_files_df) > 300
-        current_files_table_html = None
-        if not current_files_df.empty:
-            if not files_exceed_limit:
-                current_files_table_html = utils.html_table_from_df(df=current_files_df)
-                current_files_table_html = current_files_table_html.replace(
-                    '<th>Extracted Text Length</th>',
-                    '<th>Extracted Text Length '
-                    '<span title="Length of extracted text stored in the database for this file.\nBlank if no text has been stored." '
-                    'style="cursor: help; font-weight: normal;">&#9432;</span></th>'
-                )
-        
-        context['files_exceed_limit'] = files_exceed_limit
-        context['current_files_count'] = len(current_files_df)
-        
+
+        listing = utils.FlaskAppUtils.retrieve_request_param('listing', 'current')
+        listing = 'recursive' if listing == 'recursive' else 'current'
+        page_size = int(flask.current_app.config.get("DIR_CONTENTS_PAGE_SIZE", 300))
+        file_count = context['recursive_file_count'] if listing == 'recursive' else context['direct_file_count']
+        page_count = max((file_count + page_size - 1) // page_size, 1)
+        try:
+            page = min(max(int(utils.FlaskAppUtils.retrieve_request_param('page', 1)), 1), page_count)
+        except ValueError:
+            page = 1
+
+        # only the requested page of files is fetched
+        files_query = _dir_contents_files_query(db_dir=context['db_dir'], recursive=listing == 'recursive')
+        page_rows = db.session.execute(files_query.limit(page_size).offset((page - 1) * page_size)).all()
+        if listing == 'recursive':
+            files_df = pd.DataFrame(list(_dir_contents_file_records(page_rows, user_path, context['db_dir_norm'])))
+            if not files_df.empty:
+                files_df.drop(columns=["File Path", "Size Bytes"], inplace=True)
+        else:
+            files_df = pd.DataFrame([{
+                "Filename": filename,
+                "Size": _format_bytes(int(size) if size else 0),
+                "Extracted Text Length": text_length if text_length is not None else "",
+            } for _, filename, size, text_length in page_rows if filename])
+
+        files_table_html = None
+        if not files_df.empty:
+            files_table_html = utils.html_table_from_df(df=files_df)
+            files_table_html = files_table_html.replace(
+                '<th>Extracted Text Length</th>',
+                '<th>Extracted Text Length '
+                '<span title="Length of extracted text stored in the database for this file.\nBlank if no text has been stored." '
+                'style="cursor: help; font-weight: normal;">&#9432;</span></th>'
+            )
+
         return flask.render_template(
             'dir_contents_summary.html',
             title='Directory Contents Summary',
             summary_table_html=summary_table_html,
-            current_files_table_html=current_files_table_html,
+            files_table_html=files_table_html,
+            listing=listing,
+            files_count=file_count,
+            page=page,
+            page_count=page_count,
             **context
         )
     except Exception as e:
@@ -2401,7 +2429,9 @@ def dir_contents_summary():
 @archiver.route("/dir_contents_summary/download", methods=['GET'])
 def dir_contents_summary_download():
     """
-    Download the current directory contents summary as a multi-sheet Excel file.
+    Download the current directory contents summary. format=xlsx (the default) gives a multi-sheet Excel file written
+    in openpyxl's write-only mode; format=csv streams the recursive file listing. Either way the file rows are read
+    from the database in batches rather than loaded all at once.
     """
     user_path = utils.FlaskAppUtils.retrieve_request_param('path')
     if not user_path:
@@ -2409,31 +2439,67 @@ def dir_contents_summary_download():
         return flask.redirect(flask.url_for('archiver.dir_contents_summary'))
 
     try:
-        summary_df, current_files_df, all_recursive_files_df, _ = _build_dir_contents_summary_df(user_path=user_path)
+        timestamp = datetime.now().strftime(r'%Y%m%d%H%M%S')
+        download_format = utils.FlaskAppUtils.retrieve_request_param('format', 'xlsx')
+
+        if download_format == 'csv':
+            db_dir, db_dir_norm = _resolve_dir_contents_path(user_path)
+            files_query = _dir_contents_files_query(db_dir=db_dir, recursive=True, order_by_size=True)
+
+            def generate_csv():
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=DIR_CONTENTS_CSV_COLUMNS)
+                writer.writeheader()
+                rows = db.session.execute(files_query.execution_options(yield_per=5000))
+                for record in _dir_contents_file_records(rows, user_path, db_dir_norm):
+                    writer.writerow(record)
+                    if buffer.tell() > 65536:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                yield buffer.getvalue()
+
+            return flask.Response(
+                flask.stream_with_context(generate_csv()),
+                mimetype='text/csv',
+                headers={"Content-Disposition": f"attachment; filename=dir_contents_summary_{timestamp}.csv"}
+            )
 
+        summary_df, context = _build_dir_contents_summary(user_path=user_path)
         child_directories_df = summary_df.copy()
         if not child_directories_df.empty and 'Name' in child_directories_df.columns:
             child_directories_df['Name'] = child_directories_df['Name'].replace(r'<a [^>]*>', '', regex=True)
             child_directories_df['Name'] = child_directories_df['Name'].replace('</a>', '', regex=False)
 
-        current_directory_files_df = current_files_df.copy()
-
-        recursive_files_df = all_recursive_files_df.copy()
-        if not recursive_files_df.empty and 'Size Bytes' in recursive_files_df.columns:
-            recursive_files_df.sort_values(by='Size Bytes', ascending=False, inplace=True)
+        def excel_value(value):
+            return ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value
+
+        workbook = openpyxl.Workbook(write_only=True)
+        child_directories_sheet = workbook.create_sheet('Child Directories')
+        child_directories_sheet.append(list(child_directories_df.columns))
+        for row in child_directories_df.itertuples(index=False):
+            child_directories_sheet.append([excel_value(value) for value in row])
+
+        current_files_sheet = workbook.create_sheet('Files in Current Dir')
+        current_files_sheet.append(["Filename", "Size", "Extracted Text Length"])
+        current_files_query = _dir_contents_files_query(db_dir=context['db_dir'], recursive=False)
+        for _, filename, size, text_length in db.session.execute(current_files_query.execution_options(yield_per=5000)):
+            current_files_sheet.append([excel_value(filename),
+                                        _format_bytes(int(size) if size else 0),
+                                        text_length if text_length is not None else ""])
+
+        recursive_files_sheet = workbook.create_sheet('All Files Recursive')
+        recursive_files_sheet.append(DIR_CONTENTS_CSV_COLUMNS)
+        recursive_files_query = _dir_contents_files_query(db_dir=context['db_dir'], recursive=True, order_by_size=True)
+        recursive_rows = db.session.execute(recursive_files_query.execution_options(yield_per=5000))
+        for record in _dir_contents_file_records(recursive_rows, user_path, context['db_dir_norm']):
+            recursive_files_sheet.append([excel_value(record[column]) for column in DIR_CONTENTS_CSV_COLUMNS])
 
-        timestamp = datetime.now().strftime(r'%Y%m%d%H%M%S')
         filename = f"dir_contents_summary_{timestamp}.xlsx"
-        output = io.BytesIO()
-
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            child_directories_df.to_excel(writer, index=False, sheet_name='Child Directories')
-            current_directory_files_df.to_excel(writer, index=False, sheet_name='Files in Current Dir')
-            recursive_files_df.to_excel(writer, index=False, sheet_name='All Files Recursive')
-
-        output.seek(0)
+        xlsx_filepath = utils.FlaskAppUtils.create_temp_filepath(filename)
+        workbook.save(xlsx_filepath)
         return flask.send_file(
-            output,
+            xlsx_filepath,
             download_name=filename,
             as_attachment=True,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
@@ -2501,7 +2567,10 @@ def archives_search_api():
           it with ``ARCHIVE_SEARCH_API_QUERY_MAX_LENGTH``.
         - ``search_mode`` (string, optional; default ``"combined"``):
           ``"filename_only"`` searches filenames, ``"filepath"`` searches file
-          names and indexed directory paths, ``"content"`` searches extracted
+          names and indexed directory paths, ``"filename_fragment"`` matches
+          filenames containing ``query_text`` as a substring or a word similar
+          to it (for partial drawing numbers and misspellings; at least 3
+          characters), ``"content"`` searches extracted
           document-text chunks, and ``"combined"`` searches filename/path and
           content, labelling a result's source as ``"filename/path"``,
           ``"content"``, or ``"both"``.
@@ -2523,6 +2592,9 @@ def archives_search_api():
           and that limit. The endpoint will never return more than 3,000 files;
           deployments may set a lower limit with
           ``ARCHIVE_SEARCH_API_RESULT_LIMIT``.
+        - ``async`` (boolean, optional; default ``false``): Queue the search on
+          the task queue and return ``202`` with ``search_run_id`` right away
+          instead of waiting for the results (see Async searches).
 
     Response schema:
         A completed search, including one with no matches, returns ``200`` and
@@ -2543,12 +2615,14 @@ def archives_search_api():
               "result_limit": 100,                 // integer
               "limit_hit": false,                  // boolean
               "coverage": {/* scope-level index/extraction counts */},
+              "stage_timings": {"total": 412, /* ... */},  // milliseconds
               "messages": [],                      // informational strings
               "warnings": []                       // caution strings
             }
 
         ``search_run_id`` is null only if telemetry persistence failed; it does
-        not mean that the search itself failed. ``limit_hit`` is true when the
+        not mean that the search itself failed. In the async responses below
+        ``coverage`` is null until the coverage stage has run. ``limit_hit`` is true when the
         returned count reaches ``result_limit``; callers should narrow the query
         or scope when they need a more complete result set.
 
@@ -2582,7 +2656,10 @@ def archives_search_api():
         user-facing paths.
 
         ``content_rank`` and ``filepath_rank`` are numbers when that retrieval
-        source matched and null otherwise. ``snippet`` is a plain-text excerpt
+        source matched and null otherwise. ``filename_fragment`` results report
+        their match as ``"filename fragment"``, with ``filepath_rank`` 1 plus
+        the trigram word similarity for substring matches and the similarity
+        alone for fuzzy matches. ``snippet`` is a plain-text excerpt
         for content matches and is empty for filename/path-only matches.
         ``text_status`` describes extraction coverage, such as
         ``content_searchable``, ``image_ocr_searchable``,
@@ -2591,6 +2668,27 @@ def archives_search_api():
         analogous scope-level counts, including files in scope, files with FTS
         chunks, extraction failures, thin text, and content-searchable files.
 
+        ``stage_timings`` maps each search stage that ran to its wall-clock
+        time in integer milliseconds. The filename, content, and coverage
+        queries run concurrently, so the stage times can add up to more than
+        ``total``. The keys are:
+
+        - ``scope_resolution``: resolving the requested scope.
+        - ``filename_search``, ``fragment_search``, ``content_search``: the
+          retrieval queries, present only for the sources the search mode
+          uses.
+        - ``coverage``: the scope coverage counts.
+        - ``merge``, ``metadata``, ``locations``, ``snippets``: merging the
+          ranked results and fetching their file metadata, locations, and
+          snippets.
+        - ``filename_stage_merge``, ``filename_stage_metadata``,
+          ``filename_stage_locations``, ``filename_stage_snippets``: the same
+          steps for the early filename-only results of async searches.
+        - ``total``: the whole search, from scope resolution to coverage.
+
+        In async stage responses, ``stage_timings`` holds only the stages
+        finished so far, and ``total`` appears in the final stage.
+
     Errors:
         - ``400``: Missing, malformed, unsupported, or over-limit JSON fields.
           Unknown request fields are rejected.
@@ -2634,10 +2732,33 @@ def archives_search_api():
               "limit": 25
             }
 
+    Async searches:
+        With ``"async": true`` the response is ``202`` with
+        ``{"search_run_id": 123, "access_token": "...", "status": "incomplete",
+        "results_url": ...}``.
+        The search then runs on a worker in stages: filename/path matches
+        first, then document-content matches merged with them, then coverage.
+        The partial response of each stage is cached for
+        ``ARCHIVE_SEARCH_ASYNC_RESULT_TTL`` seconds (default one hour). Poll
+        ``GET /api/archives_search/<search_run_id>`` (``results_url``) for the
+        run status and the latest staged response until ``status`` is no
+        longer ``"incomplete"``. Deployments that set
+        ``ARCHIVE_SEARCH_SSE_ENABLED`` also return an ``events_url``,
+        ``GET /api/archives_search/<search_run_id>/events``, which streams the
+        stages as server-sent events (``filename``, ``content``, ``coverage``,
+        then ``complete`` or ``failed``); each open stream holds a web worker.
+        These are ``GET`` endpoints and take no request body. Authorize them
+        with the run's ``access_token``, sent as the ``access_token`` query
+        parameter (the only option for browser ``EventSource`` clients) or the
+        ``X-Archive-Search-Token`` header. Without a token they accept HTTP
+        Basic credentials or an authenticated application session, and then
+        only serve the user who started the search.
+
     Notes:
         Full-corpus document-content searches can be substantially slower than
-        scoped or filename-only searches. Configure API-client, development
-        server, and production proxy timeouts accordingly.
+        scoped or filename-only searches. Use async mode, or configure
+        API-client, development server, and production proxy timeouts
+        accordingly.
     """
     if not flask.request.is_json:
         return _archive_search_api_error(415, "Content-Type must be application/json.")
@@ -2654,6 +2775,10 @@ def archives_search_api():
     if request_user is None:
         return _archive_search_api_error(401, "Unauthorized.")
 
+    async_mode = payload.get("async", False)
+    if not isinstance(async_mode, bool):
+        return _archive_search_api_error(400, "async must be a boolean.")
+
     try:
         query_max_length = int(
             flask.current_app.config.get("ARCHIVE_SEARCH_API_QUERY_MAX_LENGTH", 1000)
@@ -2686,6 +2811,9 @@ def archives_search_api():
         flask.current_app.logger.error("Invalid archive search API configuration", exc_info=True)
         return _archive_search_api_error(500, "Archive search API is misconfigured.")
 
+    if async_mode:
+        return _enqueue_archive_search(search_request, result_limit, request_user)
+
     try:
         search_run = archive_search_service.ArchiveSearchRun(
             search_request=search_request,
@@ -2707,6 +2835,164 @@ def archives_search_api():
         return _archive_search_api_error(500, "Unable to complete archive search.")
 
 
+def _enqueue_archive_search(search_request, result_limit: int, request_user):
+    """Create the incomplete run of an async API search and queue archiver_tasks.archive_search_task for it."""
+    from archives_application.archiver.archiver_tasks import archive_search_task
+
+    search_run = archive_search_service.ArchiveSearchRun(
+        search_request=search_request,
+        app=flask.current_app,
+        file_limit=result_limit,
+        user_id=request_user.id,
+        request_source="api",
+    )
+    search_run_id = search_run.create_queued_record()
+    if search_run_id is None:
+        return _archive_search_api_error(500, "Unable to queue archive search.")
+
+    try:
+        task_kwargs = {"search_run_id": search_run_id,
+                       "query_text": search_request.query_text,
+                       "search_mode": search_request.search_mode,
+                       "scope_type": search_request.requested_scope_type,
+                       "scope_value": search_request.requested_scope_value,
+                       "extensions": list(search_request.extensions),
+                       "file_limit": result_limit,
+                       "user_id": request_user.id}
+        utils.RQTaskUtils.enqueue_new_task(
+            db=db,
+            enqueued_function=archive_search_task,
+            task_kwargs=task_kwargs,
+            timeout=int(flask.current_app.config.get("ARCHIVE_SEARCH_ASYNC_TIMEOUT", 1800)),
+        )
+    except Exception:
+        flask.current_app.logger.error("Unable to queue archive search %s", search_run_id, exc_info=True)
+        utils.FlaskAppUtils.attempt_db_rollback(db)
+        record = db.session.get(ArchiveSearchRunModel, search_run_id)
+        if record is not None:
+            record.status = archive_search_service.ArchiveSearchRun.STATUS_FAILED
+            db.session.commit()
+        return _archive_search_api_error(500, "Unable to queue archive search.")
+
+    queued_response = {
+        "search_run_id": search_run_id,
+        "access_token": search_run.access_token,
+        "status": archive_search_service.ArchiveSearchRun.STATUS_INCOMPLETE,
+        "results_url": flask.url_for("archiver.archives_search_api_run", search_run_id=search_run_id),
+    }
+    if flask.current_app.config.get("ARCHIVE_SEARCH_SSE_ENABLED", False):
+        queued_response["events_url"] = flask.url_for("archiver.archives_search_api_events",
+                                                      search_run_id=search_run_id)
+    return flask.jsonify(queued_response), 202
+
+
+def _archive_search_api_run(search_run_id: int):
+    """
+    Authenticate a request for an async search run and load the run. The run's access token (``access_token`` query
+    parameter or ``X-Archive-Search-Token`` header) authorizes the request by itself; otherwise the caller must be
+    the user who started the search, authenticated with HTTP Basic credentials or the application session.
+    :return: tuple of (ArchiveSearchRunModel or None, error response or None)
+    """
+    access_token = flask.request.args.get("access_token") or flask.request.headers.get("X-Archive-Search-Token")
+    if access_token:
+        record = db.session.get(ArchiveSearchRunModel, search_run_id)
+        token_hash = archive_search_service.ArchiveSearchRun.hash_access_token(access_token)
+        if record is None or not record.access_token_hash \
+                or not hmac.compare_digest(record.access_token_hash, token_hash):
+            return None, _archive_search_api_error(401, "Unauthorized.")
+        return record, None
+
+    credentials = {}
+    if flask.request.authorization and flask.request.authorization.type == "basic":
+        credentials = {"user": flask.request.authorization.username or "",
+                       "password": flask.request.authorization.password or ""}
+    request_user = _archive_search_api_user(credentials)
+    if request_user is None:
+        return None, _archive_search_api_error(401, "Unauthorized.")
+    record = db.session.get(ArchiveSearchRunModel, search_run_id)
+    if record is None or record.user_id != request_user.id:
+        return None, _archive_search_api_error(404, "Archive search run not found.")
+    return record, None
+
+
+@archiver.route("/api/archives_search/<int:search_run_id>", methods=["GET"])
+def archives_search_api_run(search_run_id: int):
+    """
+    Status and latest staged results of an async archive search (see ``archives_search_api``). Returns the
+    ``archive_search_runs`` status, the name of the latest stage, and that stage's response object, which has the
+    same shape as a synchronous API response. ``response`` is null before the first stage and after the cached
+    stages expire.
+    """
+    record, error_response = _archive_search_api_run(search_run_id)
+    if error_response:
+        return error_response
+
+    stage_events = archive_search_service.ArchiveSearchStageCache(search_run_id=search_run_id).events()
+    result_events = [event for event in stage_events if "response" in event]
+    return flask.jsonify({
+        "search_run_id": search_run_id,
+        "status": record.status,
+        "duration_ms": record.duration_ms,
+        "stage": stage_events[-1]["stage"] if stage_events else None,
+        "response": result_events[-1]["response"] if result_events else None,
+    })
+
+
+@archiver.route("/api/archives_search/<int:search_run_id>/events", methods=["GET"])
+def archives_search_api_events(search_run_id: int):
+    """
+    Server-sent event stream of the stages of an async archive search (see ``archives_search_api``). Only served
+    when ``ARCHIVE_SEARCH_SSE_ENABLED`` is set, since the stream occupies a web worker while it is open; polling
+    ``/api/archives_search/<search_run_id>`` is the default. Every cached stage is sent as an event named after the
+    stage whose data is the JSON stage event; the stream ends after the ``complete`` or ``failed`` event, or with a
+    ``timeout`` event after ``ARCHIVE_SEARCH_SSE_TIMEOUT`` seconds (default 300). The stream reads only Redis: the
+    request's database session is closed before streaming starts.
+    """
+    if not flask.current_app.config.get("ARCHIVE_SEARCH_SSE_ENABLED", False):
+        return _archive_search_api_error(404, "Archive search event streams are not enabled; poll the results URL.")
+
+    record, error_response = _archive_search_api_run(search_run_id)
+    if error_response:
+        return error_response
+
+    stage_cache = archive_search_service.ArchiveSearchStageCache(search_run_id=search_run_id)
+    record_status = record.status
+    run_finished = record_status != archive_search_service.ArchiveSearchRun.STATUS_INCOMPLETE
+    # release the pooled connection (authentication and the run lookup left a transaction open) before streaming
+    db.session.close()
+    stream_timeout = float(flask.current_app.config.get("ARCHIVE_SEARCH_SSE_TIMEOUT", 300))
+    poll_seconds = float(flask.current_app.config.get("ARCHIVE_SEARCH_SSE_POLL_SECONDS", 0.5))
+
+    def sse_event(stage: str, event: dict) -> str:
+        return f"event: {stage}\ndata: {json.dumps(event)}\n\n"
+
+    def generate_events():
+        position = 0
+        deadline = time.monotonic() + stream_timeout
+        while True:
+            stage_events = stage_cache.events(position)
+            position += len(stage_events)
+            for event in stage_events:
+                yield sse_event(event["stage"], event)
+                if event["stage"] in archive_search_service.ArchiveSearchStageCache.TERMINAL_STAGES:
+                    return
+            if not position and run_finished:
+                # the run ended before this request and its stages have expired
+                yield sse_event(record_status, {"stage": record_status, "search_run_id": search_run_id,
+                                                "status": record_status})
+                return
+            if time.monotonic() >= deadline:
+                yield sse_event("timeout", {"stage": "timeout", "search_run_id": search_run_id})
+                return
+            if not stage_events:
+                yield ": waiting\n\n"
+            time.sleep(poll_seconds)
+
+    return flask.Response(generate_events(),
+                          mimetype="text/event-stream",
+                          headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @archiver.route("/file_search", methods=['GET', 'POST'])
 @archiver.route("/archives_search", methods=['GET', 'POST'])
 def archives_search():
@@ -0,0 +1,598 @@
+# archives_application/archiver/scrape_pipeline.py
+
+import contextlib
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import cycle
+from typing import Callable, Iterator, List, Tuple
+
+from sqlalchemy import bindparam, text
+
+from archives_application import db, utils
+from archives_application.archiver.directory_tree import adjust_for_locations
+from archives_application.archiver.location_reconciler import remove_orphaned_files
+from archives_application.archiver.project_membership import add_location_memberships, remove_location_memberships
+
+
+def default_hashing_workers() -> int:
+    """
+    Default number of hashing threads. Hashing over SMB is mostly waiting on network reads, so this
+    follows the ThreadPoolExecutor default of one thread per core plus a few extra for I/O waits.
+    """
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+@dataclass
+class KnownLocation:
+    """What the database already knows about a path, used to decide if a file needs to be re-hashed."""
+    location_id: int
+    file_hash: str
+    observed_size: int = None
+    observed_mtime_ns: int = None
+    hash_confirmed: datetime = None
+
+
+@dataclass
+class ScrapedFile:
+    """Result of the hashing stage for a single file found by the walker."""
+    filepath: str
+    root: str
+    size: int = 0
+    mtime_ns: int = None
+    file_hash: str = None
+    unchanged_location_ids: list = None
+    error: Exception = None
+    traceback: str = None
+
+    @property
+    def skipped(self) -> bool:
+        """Empty files are not recorded in the database."""
+        return self.error is None and self.size == 0
+
+    @property
+    def unchanged(self) -> bool:
+        """True when the stat signature matched the database and the file was not re-hashed."""
+        return bool(self.unchanged_location_ids)
+
+
+def known_locations_in_directory(file_server_directories: str) -> dict:
+    """
+    Query the locations recorded for a single directory along with their last observed stat signature.
+    :param file_server_directories: file_locations.file_server_directories value of the directory
+    :return: dictionary mapping filename to a list of KnownLocation objects
+    """
+    sql = """
+        SELECT fl.id, fl.filename, f.hash, fl.observed_size, fl.observed_mtime_ns, fl.hash_confirmed
+        FROM file_locations fl
+        JOIN files f ON f.id = fl.file_id
+        WHERE fl.file_server_directories = :file_server_directories
+    """
+    known = {}
+    for row in db.session.execute(text(sql), {"file_server_directories": file_server_directories}).mappings():
+        known.setdefault(row["filename"], []).append(KnownLocation(location_id=row["id"],
+                                                                   file_hash=row["hash"],
+                                                                   observed_size=row["observed_size"],
+                                                                   observed_mtime_ns=row["observed_mtime_ns"],
+                                                                   hash_confirmed=row["hash_confirmed"]))
+    return known
+
+
+class ScrapePipeline:
+    """
+    Producer/consumer pipeline used by the file scraper.
+
+    Three stages run concurrently:
+    1. A walker thread walks the file server with os.walk, starting at start_location and cycling through the
+       root directories of the share, and submits each non-excluded file to the hashing pool.
+    2. A bounded pool of hashing threads stats and hashes the files.
+    3. The consumer (the caller iterating over results()) receives ScrapedFile objects in walk order and
+       does the database writes. Database work stays on the caller's thread so the app context and session
+       are never shared between threads.
+
+    The queue between the walker and the consumer is bounded, so the walker never gets more than
+    max_in_flight files ahead of the database stage.
+
+    In incremental mode the walker loads the known locations of each directory (one query per directory) and a
+    file is only re-hashed if its size or mtime differ from what was last observed, or if its hash was last
+    confirmed before rehash_before. Otherwise confirming the file costs a single stat call.
+    """
+
+    def __init__(self, archives_location: str, start_location: str, exclusion_functions: List[Callable[[str], bool]],
+                 hashing_workers: int = None, max_in_flight: int = None, incremental: bool = False,
+                 rehash_before: datetime = None, file_server_root_index: int = None, app=None,
+                 hash_cache: utils.FileHashCache = None):
+        """
+        :param archives_location: The location of the archives file server.
+        :param start_location: The directory from which to start walking.
+        :param exclusion_functions: Functions that take a file path and return True if the file should be skipped.
+        :param hashing_workers: Number of threads hashing files concurrently.
+        :param max_in_flight: Maximum number of files walked but not yet consumed. Defaults to 4x hashing_workers.
+        :param incremental: If True, skip re-hashing files whose stat signature has not changed.
+        :param rehash_before: In incremental mode, files whose hash was confirmed before this are re-hashed anyway.
+        :param file_server_root_index: The index of the file server root in the file server path. Required for incremental mode.
+        :param app: Flask app used to give the walker thread its own app context (and database session) in incremental mode.
+        :param hash_cache: Optional shared cache of file digests consulted before reading a file.
+        """
+        if incremental and (file_server_root_index is None or app is None):
+            raise ValueError("Incremental scraping requires file_server_root_index and app.")
+
+        self.archives_location = archives_location
+        self.start_location = start_location
+        self.exclusion_functions = exclusion_functions
+        self.incremental = incremental
+        self.rehash_before = rehash_before
+        self.file_server_root_index = file_server_root_index
+        self.app = app
+        self.hash_cache = hash_cache
+        self.hashing_workers = max(1, int(hashing_workers or default_hashing_workers()))
+        self.max_in_flight = max(1, int(max_in_flight or self.hashing_workers * 4))
+        self.current_walk_root = start_location
+        self.walk_errors = []
+        self.expired = False
+        self._futures = queue.Queue(maxsize=self.max_in_flight)
+        self._stop_event = threading.Event()
+        self._walker = None
+        self._executor = None
+
+    @staticmethod
+    def hash_file(filepath: str, root: str, known_locations: List[KnownLocation] = None,
+                  rehash_before: datetime = None, hash_cache: utils.FileHashCache = None) -> ScrapedFile:
+        """
+        Hashing stage worker. Errors are captured on the result so they can be logged by the consumer.
+        :param filepath: path of the file to hash
+        :param root: directory the file was found in
+        :param known_locations: locations already recorded for this path. If given and every one of them has the same
+        stat signature as the file and a recent enough hash_confirmed, the file is not re-hashed.
+        :param rehash_before: hash confirmations older than this do not count as recent enough.
+        :param hash_cache: cache of file digests. It is bypassed (and refreshed) when a file is re-hashed only because
+        its last hash confirmation is older than rehash_before, so that the periodic re-read actually reads the file.
+        """
+        scraped = ScrapedFile(filepath=filepath, root=root)
+        try:
+            file_stat = os.stat(filepath)
+            scraped.size = file_stat.st_size
+            scraped.mtime_ns = file_stat.st_mtime_ns
+            stat_unchanged = bool(known_locations) and all(
+                known.observed_size == scraped.size
+                and known.observed_mtime_ns == scraped.mtime_ns
+                and known.hash_confirmed is not None
+                for known in known_locations
+            ) and len({known.file_hash for known in known_locations}) == 1
+            recently_confirmed = stat_unchanged and all(
+                rehash_before is None or known.hash_confirmed >= rehash_before for known in known_locations
+            )
+            if recently_confirmed:
+                scraped.file_hash = known_locations[0].file_hash
+                scraped.unchanged_location_ids = [known.location_id for known in known_locations]
+            elif scraped.size > 0:
+                scraped.file_hash = utils.FilesUtils.get_hash(filepath=filepath,
+                                                              cache=hash_cache,
+                                                              refresh_cache=stat_unchanged)
+        except Exception as e:
+            scraped.error = e
+            scraped.traceback = traceback.format_exc()
+        return scraped
+
+    def _put(self, item) -> bool:
+        """
+        Put an item on the bounded futures queue, giving up if the pipeline is stopped while waiting.
+        """
+        while not self._stop_event.is_set():
+            try:
+                self._futures.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _walk(self):
+        """
+        Walker stage. Runs in its own app context when an app is given so that incremental lookups use a
+        database session that is not shared with the consumer.
+        """
+        walk_context = self.app.app_context() if self.app is not None else contextlib.nullcontext()
+        with walk_context:
+            self._walk_file_server()
+
+    def _walk_file_server(self):
+        """
+        Mirrors the original scraper traversal: find the root directory containing the start location,
+        skip directories until the start location is reached, then keep cycling through the share roots until stopped.
+        """
+        try:
+            root_dirs_paths = [os.path.join(self.archives_location, d) for d in os.listdir(self.archives_location)
+                               if os.path.isdir(os.path.join(self.archives_location, d))]
+            if not root_dirs_paths:
+                return
+
+            start_location_found = False
+            start_location_root_found = False
+            for root_dir in cycle(root_dirs_paths):
+                if self._stop_event.is_set():
+                    return
+
+                if not start_location_root_found:
+                    if self.start_location.startswith(root_dir):
+                        start_location_root_found = True
+                    else:
+                        continue
+
+                for root, _, files in os.walk(root_dir):
+                    if self._stop_event.is_set():
+                        return
+
+                    if root == self.start_location:
+                        start_location_found = True
+
+                    if not start_location_found:
+                        continue
+
+                    self.current_walk_root = root
+                    known_locations = {}
+                    if self.incremental and files:
+                        known_locations = self._known_locations(root)
+
+                    for filename in files:
+                        filepath = os.path.join(root, filename)
+                        if any([fun(filepath) for fun in self.exclusion_functions]):
+                            continue
+
+                        future = self._executor.submit(self.hash_file, filepath, root,
+                                                       known_locations.get(filename), self.rehash_before,
+                                                       self.hash_cache)
+                        if not self._put((root, future)):
+                            future.cancel()
+                            return
+        except Exception as e:
+            self.walk_errors.append(e)
+        finally:
+            # sentinel signalling the consumer that the walk has ended
+            self._put(None)
+
+    def _known_locations(self, root: str) -> dict:
+        """
+        Load the known locations of a walked directory. A failed lookup means every file in the directory is hashed.
+        """
+        server_dirs_list = utils.FileServerUtils.split_path(root)[self.file_server_root_index:]
+        file_server_dirs = os.path.join(*server_dirs_list) if server_dirs_list else ""
+        try:
+            return known_locations_in_directory(file_server_dirs)
+        except Exception as e:
+            utils.FlaskAppUtils.attempt_db_rollback(db)
+            self.walk_errors.append(e)
+            return {}
+
+    def start(self):
+        """Start the walker thread and the hashing pool."""
+        self._executor = ThreadPoolExecutor(max_workers=self.hashing_workers, thread_name_prefix="scrape_hash")
+        self._walker = threading.Thread(target=self._walk, name="scrape_walker", daemon=True)
+        self._walker.start()
+        return self
+
+    def results(self, deadline: float = None) -> Iterator[ScrapedFile]:
+        """
+        Consumer stage. Yields hashed files in the order they were walked until the walk ends, stop() is called or
+        the deadline passes. If the deadline passes, self.expired is set.
+        :param deadline: time.time() value after which no more results are yielded.
+        """
+        while True:
+            if deadline is not None and time.time() >= deadline:
+                self.expired = True
+                return
+
+            try:
+                item = self._futures.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop_event.is_set() or not self._walker.is_alive():
+                    return
+                continue
+
+            if item is None:
+                return
+
+            _, future = item
+            yield future.result()
+
+    def next_unprocessed_root(self) -> str:
+        """
+        Directory of the oldest walked file that has not been consumed yet. This is where a subsequent scrape should
+        resume so that no walked-but-unwritten file is lost. Falls back to the directory the walker is currently in.
+        """
+        try:
+            pending = self._futures.queue[0]
+        except IndexError:
+            pending = None
+
+        if pending is not None:
+            pending_root, _ = pending
+            return pending_root
+        return self.current_walk_root
+
+    def stop(self):
+        """Stop walking and discard any files that are queued but not yet hashed."""
+        self._stop_event.set()
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._walker:
+            self._walker.join(timeout=5)
+
+
+def _values_sql(rows: list, param_prefix: str, params: dict) -> str:
+    """
+    Build a parameterized multi-row VALUES list, adding the bind values to params.
+    :param rows: list of tuples, each tuple being one row of values
+    :param param_prefix: prefix used to name the bind parameters
+    :param params: dictionary of bind parameters to add to
+    :return: SQL string like "(:p_0_0, :p_0_1), (:p_1_0, :p_1_1)"
+    """
+    values = []
+    for row_idx, row in enumerate(rows):
+        row_keys = []
+        for col_idx, value in enumerate(row):
+            key = f"{param_prefix}_{row_idx}_{col_idx}"
+            params[key] = value
+            row_keys.append(f":{key}")
+        values.append("(" + ", ".join(row_keys) + ")")
+    return ", ".join(values)
+
+
+@dataclass
+class PendingLocation:
+    """A scraped file waiting in the batch writer's buffer."""
+    filepath: str
+    file_server_directories: str
+    filename: str
+    file_hash: str
+    size: int
+    mtime_ns: int
+    extension: str
+
+
+class ScrapeBatchWriter:
+    """
+    Database stage of the scrape pipeline. Buffers scraped files and writes them in batches: new files with a
+    multi-row INSERT ... ON CONFLICT, known locations with one UPDATE ... FROM (VALUES ...) and new locations
+    with one multi-row INSERT. Files the pipeline found unchanged by stat only get their existence_confirmed
+    date updated. A batch is flushed every batch_size files or every flush_seconds, whichever
+    comes first. If a batch fails, it is rolled back and retried row by row so one bad row only loses itself.
+    Files whose locations were repointed to new contents are only removed by close(), once the walk is over,
+    because a later batch may still record the old contents at another path (e.g. a renamed copy).
+    """
+
+    def __init__(self, db, file_server_root_index: int, batch_size: int = 500, flush_seconds: float = 10.0):
+        """
+        :param db: SQLAlchemy database object (flask.current_app.extensions['sqlalchemy'])
+        :param file_server_root_index: The index of the file server root in the file server path.
+        :param batch_size: Number of buffered files that triggers a flush.
+        :param flush_seconds: Maximum number of seconds a file stays in the buffer.
+        """
+        self.db = db
+        self.file_server_root_index = file_server_root_index
+        self.batch_size = max(1, int(batch_size))
+        self.flush_seconds = float(flush_seconds)
+        self.counts = {"Files Added": 0,
+                       "File Locations Added": 0,
+                       "File Locations Updated": 0,
+                       "Files Confirmed": 0,
+                       "Files Confirmed By Stat": 0,
+                       "Files Removed": 0}
+        self.errors = []
+        self._replaced_file_ids = set()
+        self._pending = {}
+        self._unchanged = {}
+        self._last_flush = time.time()
+
+    def add(self, scraped_file: ScrapedFile):
+        """
+        Buffer a hashed file, flushing the buffer if it is full or old enough.
+        """
+        if scraped_file.unchanged:
+            self._unchanged[scraped_file.filepath] = scraped_file.unchanged_location_ids
+            self._flush_if_due()
+            return
+
+        path_list = utils.FileServerUtils.split_path(scraped_file.filepath)
+        # This is for if there is a file in the root directory of the share
+        # (eg R:\some_file.pdf or N:\PPDORecords\some_file.pdf)
+        file_server_dirs = ""
+        if path_list[self.file_server_root_index:-1] != []:
+            file_server_dirs = os.path.join(*path_list[self.file_server_root_index:-1])
+        filename = path_list[-1]
+        self._pending[(file_server_dirs, filename)] = PendingLocation(filepath=scraped_file.filepath,
+                                                                      file_server_directories=file_server_dirs,
+                                                                      filename=filename,
+                                                                      file_hash=scraped_file.file_hash,
+                                                                      size=scraped_file.size,
+                                                                      mtime_ns=scraped_file.mtime_ns,
+                                                                      extension=filename.split(".")[-1].lower())
+        self._flush_if_due()
+
+    def _flush_if_due(self):
+        """Flush if the buffer is full or the oldest buffered file has waited flush_seconds."""
+        buffered = len(self._pending) + len(self._unchanged)
+        if buffered >= self.batch_size or (time.time() - self._last_flush) >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered files to the database. Falls back to writing row by row if the batch fails.
+        """
+        rows = list(self._pending.values())
+        unchanged = dict(self._unchanged)
+        self._pending = {}
+        self._unchanged = {}
+        self._last_flush = time.time()
+        if not rows and not unchanged:
+            return
+
+        try:
+            self._commit(rows, unchanged)
+            return
+        except Exception:
+            utils.FlaskAppUtils.attempt_db_rollback(self.db)
+
+        for filepath, location_ids in unchanged.items():
+            try:
+                self._commit([], {filepath: location_ids})
+            except Exception as e:
+                utils.FlaskAppUtils.attempt_db_rollback(self.db)
+                self.errors.append({"Filepath": filepath,
+                                    "Exception": str(e),
+                                    "Traceback": traceback.format_exc()})
+
+        for row in rows:
+            try:
+                self._commit([row], {})
+            except Exception as e:
+                utils.FlaskAppUtils.attempt_db_rollback(self.db)
+                self.errors.append({"Filepath": row.filepath,
+                                    "Exception": str(e),
+                                    "Traceback": traceback.format_exc()})
+
+    def close(self):
+        """
+        Flush the buffer, then remove the files that lost their last location to a repointed location during the
+        walk. Call once the walk has finished.
+        """
+        self.flush()
+        if not self._replaced_file_ids:
+            return
+
+        try:
+            removed = remove_orphaned_files(db=self.db, file_ids=list(self._replaced_file_ids))
+            self.db.session.commit()
+            self.counts["Files Removed"] += removed
+        except Exception as e:
+            utils.FlaskAppUtils.attempt_db_rollback(self.db)
+            self.errors.append({"Filepath": None,
+                                "Exception": f"Error removing orphaned files: {e}",
+                                "Traceback": traceback.format_exc()})
+        self._replaced_file_ids = set()
+
+    def _commit(self, rows: List[PendingLocation], unchanged: dict):
+        """Write and commit one batch, then add its counts and replaced files to the running totals."""
+        batch_counts, replaced_file_ids = self._write(rows, unchanged)
+        self.db.session.commit()
+        for key, value in batch_counts.items():
+            self.counts[key] += value
+        self._replaced_file_ids.update(replaced_file_ids)
+
+    def _write(self, rows: List[PendingLocation], unchanged: dict) -> Tuple[dict, List[int]]:
+        """
+        Issue the set-based statements for one batch without committing.
+        :param rows: hashed files to record
+        :param unchanged: dictionary mapping filepaths found unchanged by stat to their location ids
+        :return: dictionary of counts for the scrape log, and the ids of the files repointed locations used to hold
+        """
+        now = datetime.now()
+        counts = {key: 0 for key in self.counts}
+        replaced_file_ids = []
+        session = self.db.session
+
+        if unchanged:
+            unchanged_ids = [location_id for location_ids in unchanged.values() for location_id in location_ids]
+            session.execute(
+                text("UPDATE file_locations SET existence_confirmed = :confirmed_dt WHERE id IN :location_ids")
+                .bindparams(bindparam("location_ids", expanding=True)),
+                {"confirmed_dt": now, "location_ids": unchanged_ids}
+            )
+            counts["Files Confirmed By Stat"] = len(unchanged)
+
+        if not rows:
+            return counts, replaced_file_ids
+
+        # insert files that are not in the database yet
+        file_rows = {row.file_hash: (row.file_hash, row.size, row.extension) for row in rows}
+        params = {}
+        files_values = _values_sql(list(file_rows.values()), "f", params)
+        inserted_files = session.execute(text(f"""
+            INSERT INTO files (hash, size, extension)
+            VALUES {files_values}
+            ON CONFLICT (hash) DO NOTHING
+            RETURNING id
+        """), params).fetchall()
+        counts["Files Added"] = len(inserted_files)
+
+        hash_id_rows = session.execute(
+            text("SELECT id, hash FROM files WHERE hash IN :file_hashes").bindparams(bindparam("file_hashes", expanding=True)),
+            {"file_hashes": list(file_rows)}
+        ).mappings().all()
+        file_ids = {row["hash"]: row["id"] for row in hash_id_rows}
+
+        # find which of the paths are already represented in the database
+        params = {}
+        paths_values = _values_sql([(row.file_server_directories, row.filename) for row in rows], "p", params)
+        existing_locations = session.execute(text(f"""
+            SELECT fl.id, fl.file_id, fl.file_server_directories, fl.filename
+            FROM file_locations fl
+            JOIN (VALUES {paths_values}) AS v(file_server_directories, filename)
+              ON fl.file_server_directories = v.file_server_directories
+             AND fl.filename = v.filename
+        """), params).mappings().all()
+        existing_by_path = {}
+        location_file_ids = {location["id"]: location["file_id"] for location in existing_locations}
+        for location in existing_locations:
+            existing_by_path.setdefault((location["file_server_directories"], location["filename"]), []).append(location)
+
+        # confirm existing locations, repointing any whose contents have changed to the new file
+        location_updates = []
+        new_locations = []
+        for row in rows:
+            file_id = file_ids[row.file_hash]
+            path_locations = existing_by_path.get((row.file_server_directories, row.filename))
+            if not path_locations:
+                new_locations.append((file_id, row.file_server_directories, row.filename, now, now,
+                                      row.size, row.mtime_ns))
+                continue
+
+            for location in path_locations:
+                location_updates.append((location["id"], file_id, row.size, row.mtime_ns))
+                if location["file_id"] == file_id:
+                    counts["Files Confirmed"] += 1
+                else:
+                    counts["File Locations Updated"] += 1
+
+        # locations pointed at a different file move their old file's size out of the directory rollups
+        repointed_ids = [location_id for location_id, file_id, _, _ in location_updates
+                         if file_id != location_file_ids[location_id]]
+        adjust_for_locations(db=self.db, location_ids=repointed_ids, sign=-1)
+        remove_location_memberships(db=self.db, location_ids=repointed_ids)
+
+        if location_updates:
+            params = {"confirmed_dt": now}
+            updates_values = _values_sql(location_updates, "u", params)
+            session.execute(text(f"""
+                UPDATE file_locations AS fl
+                SET file_id = v.file_id,
+                    existence_confirmed = :confirmed_dt,
+                    hash_confirmed = :confirmed_dt,
+                    observed_size = v.observed_size::bigint,
+                    observed_mtime_ns = v.observed_mtime_ns::bigint
+                FROM (VALUES {updates_values}) AS v(id, file_id, observed_size, observed_mtime_ns)
+                WHERE fl.id = v.id
+            """), params)
+            adjust_for_locations(db=self.db, location_ids=repointed_ids, sign=1)
+            add_location_memberships(db=self.db, location_ids=repointed_ids)
+            # the files the repointed locations used to hold may have no location left once the walk is over
+            replaced_file_ids = [location_file_ids[location_id] for location_id in repointed_ids]
+
+        if new_locations:
+            params = {}
+            locations_values = _values_sql(new_locations, "l", params)
+            inserted_location_ids = session.execute(text(f"""
+                INSERT INTO file_locations (file_id, file_server_directories, filename, existence_confirmed,
+                                            hash_confirmed, observed_size, observed_mtime_ns)
+                VALUES {locations_values}
+                RETURNING id
+            """), params).scalars().all()
+            adjust_for_locations(db=self.db, location_ids=inserted_location_ids, sign=1)
+            add_location_memberships(db=self.db, location_ids=inserted_location_ids)
+            counts["File Locations Added"] = len(new_locations)
+
+        return counts, replaced_file_ids
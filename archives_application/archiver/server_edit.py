@@ -6,11 +6,15 @@ import flask
 import flask_sqlalchemy
 import os
 import shutil
-from sqlalchemy import func
+from sqlalchemy import func, text
 from typing import List, Callable
 from archives_application import create_app, utils
 from archives_application.archiver import archiver_tasks
-from archives_application.models import ArchivedFileModel, FileLocationModel, FileModel, FileContentModel, FileContentFailureModel, FileDateMentionModel
+from archives_application.archiver.directory_tree import adjust_for_locations, directory_row, refresh_subtree
+from archives_application.archiver.location_reconciler import remove_locations, remove_orphaned_files
+from archives_application.archiver.project_membership import (add_location_memberships, refresh_file_memberships,
+                                                              refresh_subtree_memberships, remove_location_memberships)
+from archives_application.models import ArchivedFileModel, FileLocationModel, FileModel, FileContentModel, FileContentFailureModel, FileDateMentionModel, ProjectFileHashModel
 # Create the app context so that tasks can access app extensions even though
 # they are not running in the main thread.
 app = create_app()
@@ -18,15 +22,20 @@ app = create_app()
 
 def directory_contents_quantities(dir_path: str, server_location: str, db: flask_sqlalchemy.SQLAlchemy):
     """
-    Sends a query to the database to get the number of files and the amount of data that will be effected in
-    a given directory.
+    Gets the number of files and the amount of data that will be effected in a given directory from its row in
+    the directories table, falling back to aggregating the directory's locations when there is no row.
     :param dir_path: path to the directory
     :param server_location: root directory of the file server
     :param db: SQLAlchemy database object (flask.current_app.extensions['sqlalchemy'])
     """
     dir_query_str = dir_path.replace(server_location, '')[1:]
+    directory_entry = directory_row(db=db, directory=dir_query_str)
+    if directory_entry:
+        return directory_entry["recursive_file_count"], directory_entry["recursive_bytes"]
+
+    # no rollup row: the subtree holds no indexed files or the directories table has not been built yet
     file_location_entries = db.session.query(FileLocationModel) \
-        .filter(FileLocationModel.file_server_directories.like(func.concat(dir_query_str, '%'))) \
+        .filter(utils.FileServerUtils.db_subtree_filter(FileLocationModel.directory_path, dir_query_str)) \
         .join(FileModel, FileLocationModel.file_id == FileModel.id) \
         .with_entities(func.count(FileLocationModel.id).label('count'), func.sum(FileModel.size).label('total_size')) \
         .one()
@@ -159,8 +168,11 @@ class ServerEdit:
         db.session.query(FileContentFailureModel).filter(
             FileContentFailureModel.file_hash == file_hash
         ).delete(synchronize_session=False)
+        db.session.query(ProjectFileHashModel).filter(
+            ProjectFileHashModel.file_hash == file_hash
+        ).delete(synchronize_session=False)
 
-    def execute(self, files_limit = 500, effected_data_limit=500000000, timeout=900):
+    def execute(self, files_limit = 500, effected_data_limit=500000000, timeout=900, task_batch: list = None):
         """
         This function executes the server change that was specified during the creation of the ServerEdit object. The change can be of the following types:
 
@@ -177,6 +189,9 @@ class ServerEdit:
         :param effected_data_limit: Maximum amount of data that can be affected by the change (default is 50,000,000).
         :type effected_data_limit: int
         :param timeout: Maximum time in seconds that the function can run before it is terminated (default is 900).
+        :param task_batch: If given, the database reconciliation task is appended to this list, in the task format of
+        RQTaskUtils.enqueue_many, instead of being enqueued, so that callers executing many edits can enqueue all of
+        the tasks at once. The returned dictionary then has no task id.
         :return: Dictionary containing the results of the enqueuing task.
         :rtype: dict
         """
@@ -206,6 +221,9 @@ class ServerEdit:
             :rtype: dict
             """
             task_info = utils.serializable_dict(self.to_dict())
+            if task_batch is not None:
+                task_batch.append((task_func, {}, task_info, {'timeout': timeout}))
+                return {}
             return utils.RQTaskUtils.enqueue_new_task(db=flask.current_app.extensions['sqlalchemy'],
                                                       enqueued_function=task_func,
                                                       timeout=timeout,
@@ -395,6 +413,8 @@ class ServerEdit:
         
         if location_entry:
             file_id = location_entry.file_id
+            adjust_for_locations(db=db, location_ids=[location_entry.id], sign=-1)
+            remove_location_memberships(db=db, location_ids=[location_entry.id])
             db.session.delete(location_entry)
             location_entry_removed = True
 
@@ -428,6 +448,86 @@ class ServerEdit:
         return location_entry_removed, file_entry_removed
             
 
+    @staticmethod
+    def _rewrite_directory_prefix(db: flask_sqlalchemy.SQLAlchemy, old_server_path: str, new_server_path: str):
+        """
+        Set-based rewrite of the locations under old_server_path to sit under new_server_path. Locations that were
+        already recorded at one of the destination paths are removed first with location_reconciler.remove_locations
+        (which also removes files left without locations), then every location in the subtree is rewritten with a
+        single prefix-rewriting UPDATE. The directory rollups of both subtrees and the project memberships of the
+        moved files are refreshed afterwards. Does not commit.
+        :param db: SQLAlchemy database object
+        :param old_server_path: file_server_directories value of the directory before the change
+        :param new_server_path: file_server_directories value of the directory after the change
+        :return: tuple of (number of colliding locations removed, number of files removed with them, list of the
+        rewritten rows as mappings with id, file_server_directories and filename keys)
+        """
+        # prefixes are rewritten on the normalized directory_path so that rows stored with either separator move
+        old_directory_path = utils.FileServerUtils.db_directory_path(old_server_path)
+        params = {"old_path_len": len(old_directory_path),
+                  "new_path": utils.FileServerUtils.db_directory_path(new_server_path),
+                  "sep": os.sep}
+        subtree_clause = utils.FileServerUtils.db_subtree_sql("src.directory_path", old_server_path, params)
+
+        collisions_sql = text(f"""
+            SELECT dst.id
+            FROM file_locations src
+            JOIN file_locations dst
+              ON dst.filename = src.filename
+             AND dst.directory_path = :new_path || substr(src.directory_path, :old_path_len + 1)
+            WHERE {subtree_clause}
+            AND dst.id <> src.id
+        """)
+        collision_ids = db.session.execute(collisions_sql, params).scalars().all()
+        collisions_removed, collision_files_removed = remove_locations(db=db, location_ids=collision_ids)
+
+        rewrite_sql = text(f"""
+            UPDATE file_locations AS src
+            SET file_server_directories = replace(rtrim(:new_path || substr(src.directory_path, :old_path_len + 1), '/'),
+                                                  '/', :sep),
+                existence_confirmed = :confirmed_dt
+            WHERE {subtree_clause}
+            RETURNING src.id, src.file_server_directories, src.filename
+        """)
+        rewritten_rows = db.session.execute(rewrite_sql, {**params,
+                                                          "confirmed_dt": datetime.datetime.now()}).mappings().all()
+        refresh_subtree(db=db, directory=old_server_path)
+        refresh_subtree(db=db, directory=new_server_path)
+        refresh_subtree_memberships(db=db, directory=new_server_path)
+        return collisions_removed, collision_files_removed, rewritten_rows
+
+    @staticmethod
+    def _move_directory_locations(db: flask_sqlalchemy.SQLAlchemy, old_server_path: str, new_server_path: str,
+                                  present_files: dict):
+        """
+        Set-based database side of a directory move. The locations are rewritten with _rewrite_directory_prefix and
+        moved locations whose file is not on the file server are removed afterwards. Does not commit.
+        :param db: SQLAlchemy database object
+        :param old_server_path: file_server_directories value of the moved directory before the move
+        :param new_server_path: file_server_directories value of the moved directory after the move
+        :param present_files: dictionary of file_server_directories values to the set of filenames found on the file
+        server under the moved directory
+        :return: tuple of (number of location entries effected, number of file entries removed, dictionary of
+        file_server_directories to the set of filenames of the moved locations that exist)
+        """
+        collisions_removed, collision_files_removed, moved_rows = ServerEdit._rewrite_directory_prefix(
+            db=db,
+            old_server_path=old_server_path,
+            new_server_path=new_server_path
+        )
+
+        moved_locations = {}
+        missing_ids = []
+        for row in moved_rows:
+            if row["filename"] in present_files.get(row["file_server_directories"], ()):
+                moved_locations.setdefault(row["file_server_directories"], set()).add(row["filename"])
+            else:
+                missing_ids.append(row["id"])
+        _, missing_files_removed = remove_locations(db=db, location_ids=missing_ids)
+
+        locations_effected = collisions_removed + len(moved_rows)
+        return locations_effected, collision_files_removed + missing_files_removed, moved_locations
+
     def add_deletion_to_db_task(self, queue_id):
         """
         This function is used to reconcile the database with a file deletion operation.
@@ -448,54 +548,31 @@ class ServerEdit:
                 server_dirs = utils.FileServerUtils.split_path(self.old_path)[file_server_root_index:-1]
                 filename = utils.FileServerUtils.split_path(self.old_path)[-1]
                 server_path = self._safe_path_join(server_dirs)
-                file_location_entry = db.session.query(FileLocationModel)\
+                file_location_entry = db.session.query(FileLocationModel.id)\
                     .filter(FileLocationModel.file_server_directories == server_path,
                             FileLocationModel.filename == filename).first()
-
-                if file_location_entry:
-                    file_id = file_location_entry.file_id
-                    db.session.delete(file_location_entry)
-                    db.session.commit()
-                    deletion_log['location_entries_effected'] = 1
-                    
-                    # If this was the last entry for this file_id, delete the file_id entry
-                    other_locations = db.session.query(FileLocationModel).filter(FileLocationModel.file_id == file_id).all()
-                    if not other_locations:
-                        # update any associated archival events so file_id is NULL
-                        associated_archival_events = db.session.query(ArchivedFileModel).filter(ArchivedFileModel.file_id == file_id).all()
-                        for archival_event in associated_archival_events:
-                            archival_event.file_id = None
-
-                        file_entry = db.session.query(FileModel).filter(FileModel.id == file_id).first()
-                        if file_entry:
-                            self._delete_file_hash_dependents(db=db, file_hash=file_entry.hash)
-                            db.session.delete(file_entry)
-                            db.session.commit()
-                            deletion_log['files_entries_effected'] = 1
+                location_ids = [file_location_entry.id] if file_location_entry else []
+                locations_removed, files_removed = remove_locations(db=db, location_ids=location_ids)
 
             else:
+                # delete every location in the directory subtree, then the files left without any location
                 server_dirs = utils.FileServerUtils.split_path(self.old_path)[file_server_root_index:]
                 server_path = self._safe_path_join(server_dirs)
-                file_location_entries = db.session.query(FileLocationModel)\
-                    .filter(FileLocationModel.file_server_directories.like(func.concat(server_path, '%'))).all()
-                for file_location_entry in file_location_entries:
-                    file_id = file_location_entry.file_id
-                    db.session.delete(file_location_entry)
-                    db.session.commit()
-                    deletion_log['location_entries_effected'] += 1
-                    other_locations = db.session.query(FileLocationModel).filter(FileLocationModel.file_id == file_id).all()
-                    if not other_locations:
-                        # update any associated archival events so file_id is NULL
-                        associated_archival_events = db.session.query(ArchivedFileModel).filter(ArchivedFileModel.file_id == file_id).all()
-                        for archival_event in associated_archival_events:
-                            archival_event.file_id = None
-
-                        file_entry = db.session.query(FileModel).filter(FileModel.id == file_id).first()
-                        if file_entry:
-                            self._delete_file_hash_dependents(db=db, file_hash=file_entry.hash)
-                            db.session.delete(file_entry)
-                            db.session.commit()
-                            deletion_log['files_entries_effected'] += 1
+                subtree_params = {}
+                delete_sql = text(f"""
+                    DELETE FROM file_locations
+                    WHERE {utils.FileServerUtils.db_subtree_sql("directory_path", server_path, subtree_params)}
+                    RETURNING file_id
+                """)
+                removed_file_ids = db.session.execute(delete_sql, subtree_params).scalars().all()
+                locations_removed = len(removed_file_ids)
+                files_removed = remove_orphaned_files(db=db, file_ids=removed_file_ids)
+                refresh_subtree(db=db, directory=server_path)
+                refresh_file_memberships(db=db, file_ids=removed_file_ids)
+
+            db.session.commit()
+            deletion_log['location_entries_effected'] = locations_removed
+            deletion_log['files_entries_effected'] = files_removed
             
             utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=deletion_log)
             return deletion_log
@@ -550,32 +627,14 @@ class ServerEdit:
                 old_server_path = self._safe_path_join(old_server_dirs)
                 new_server_dirs = utils.FileServerUtils.split_path(self.new_path)[file_server_root_index:]
                 new_server_path = self._safe_path_join(new_server_dirs)
-                file_location_entries = db.session.query(FileLocationModel)\
-                    .filter(FileLocationModel.file_server_directories.like(func.concat(old_server_path, '%'))).all()
-                
-
-                for file_location_entry in file_location_entries:
-                    old_file_path = file_location_entry.file_server_directories
-                    old_path_list = utils.FileServerUtils.split_path(old_file_path)
-                    new_server_path = self._safe_path_join([*new_server_dirs, *old_path_list[len(new_server_dirs):]])
-                    
-                    #TODO what if a file with the same name already exists in the new location?
-                    existing_file_location_entry = db.session.query(FileLocationModel)\
-                        .filter(FileLocationModel.file_server_directories == new_server_path,
-                                FileLocationModel.filename == file_location_entry.filename).first()
-                    
-                    if existing_file_location_entry:
-                        existing_path = os.path.join(flask.current_app.config.get('ARCHIVES_LOCATION'), new_server_path)
-                        remove_file_entry, remove_location_entry = self.record_file_server_file_removal(db, file_server_root_index, file_path=existing_path)   
-                        if remove_file_entry:
-                            rename_log['files_entries_effected'] += 1
-                        if remove_location_entry:
-                            rename_log['location_entries_effected'] += 1
-                    
-                    file_location_entry.file_server_directories = new_server_path
-                    file_location_entry.existence_confirmed = datetime.datetime.now()
-                    db.session.commit()
-                    rename_log['location_entries_effected'] += 1
+                collisions_removed, files_removed, renamed_rows = self._rewrite_directory_prefix(
+                    db=db,
+                    old_server_path=old_server_path,
+                    new_server_path=new_server_path
+                )
+                db.session.commit()
+                rename_log['location_entries_effected'] += collisions_removed + len(renamed_rows)
+                rename_log['files_entries_effected'] += files_removed
             
             utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=rename_log)
             return rename_log
@@ -620,9 +679,14 @@ class ServerEdit:
                     .first()
                 
                 if location_entry:
+                    adjust_for_locations(db=db, location_ids=[location_entry.id], sign=-1)
+                    remove_location_memberships(db=db, location_ids=[location_entry.id])
                     location_entry.file_server_directories = new_server_path
                     if os.path.exists(self.new_path):
                         location_entry.existence_confirmed = datetime.datetime.now()
+                    db.session.flush()
+                    adjust_for_locations(db=db, location_ids=[location_entry.id])
+                    add_location_memberships(db=db, location_ids=[location_entry.id])
                     db.session.commit()
                     move_log['files_entries_effected'] += 1
 
@@ -640,7 +704,7 @@ class ServerEdit:
                         utils.RQTaskUtils.failed_task_subroutine(q_id=queue_id, sql_db=db, task_result=move_log)
                         return move_log
                     
-                    file_hash = utils.FilesUtils.get_hash(self.new_path)
+                    file_hash = utils.FilesUtils.get_hash(self.new_path, cache=utils.FileHashCache.from_app())
                     file_entry = None
                     while not file_entry:
                         
@@ -660,64 +724,49 @@ class ServerEdit:
                                                        existence_confirmed=datetime.datetime.now(),
                                                        hash_confirmed=datetime.datetime.now())
                     db.session.add(location_entry)
+                    db.session.flush()
+                    adjust_for_locations(db=db, location_ids=[location_entry.id])
+                    add_location_memberships(db=db, location_ids=[location_entry.id])
                     db.session.commit()
                     move_log['location_entries_effected'] += 1
                     return move_log
             
             # if we are moving a directory, we need to move all files within the directory
             else:
-                old_server_dirs_list = old_path_list[file_server_root_index:]
-                old_server_path = self._safe_path_join(old_server_dirs_list)
-                effected_location_entries = db.session.query(FileLocationModel)\
-                    .filter(FileLocationModel.file_server_directories.like(func.concat(old_server_path, '%'))).all()
-                
-                for location_entry in effected_location_entries:
-                    entry_dir_list = utils.FileServerUtils.split_path(location_entry.file_server_directories)
-                    new_location_list = new_path_list[file_server_root_index:] + entry_dir_list[len(old_server_dirs_list)-1:]
-                    new_location_server_dirs = self._safe_path_join(new_location_list)
-
-                    # remove any entries that are already in the new location
-                    existing_loc_path = os.path.join(flask.current_app.config.get('ARCHIVES_LOCATION'), new_location_server_dirs, location_entry.filename)
-                    remove_file_entry, remove_location_entry = self.record_file_server_file_removal(db, file_server_root_index, file_path=existing_loc_path)
-                    if remove_file_entry:
-                        move_log['files_entries_effected'] += 1
-                    if remove_location_entry:
-                        move_log['location_entries_effected'] += 1
-
-                    # check if the file exists in the new location. If it does, update the location entry.
-                    file_exists = os.path.exists(existing_loc_path)
-                    if file_exists:
-                        location_entry.file_server_directories = new_location_server_dirs
-                        location_entry.existence_confirmed = datetime.datetime.now()
-                        move_log['location_entries_effected'] += 1
-                    else:
-                        db.session.delete(location_entry)
-                        move_log['location_entries_effected'] += 1
-                    db.session.commit()
-
-                # check that all of the moved files are in the database by checking if they are in the effected_location_entries
-                # query results. If they are not, add them to the database.
+                old_server_path = self._safe_path_join(old_path_list[file_server_root_index:])
+                new_server_path = self._safe_path_join(new_path_list[file_server_root_index:] + [old_path_list[-1]])
                 move_result_path = os.path.join(*(new_path_list + [old_path_list[-1]]))
+
+                # one walk of the moved tree gives both the existence check for the moved locations and the
+                # files that still need to be added to the database
+                present_files = {}
+                present_roots = {}
                 for root, _, files in os.walk(move_result_path):
-                    for relocated_file in files:
-                        located_in_db = False
-                        root_server_dirs_list = utils.FileServerUtils.split_path(root)[file_server_root_index:]
-                        root_server_dirs = self._safe_path_join(root_server_dirs_list)
-                        for location_entry in effected_location_entries:
-                            if location_entry.filename == relocated_file and location_entry.file_server_directories == root_server_dirs:
-                                located_in_db = True
-                                break
+                    root_server_dirs = self._safe_path_join(utils.FileServerUtils.split_path(root)[file_server_root_index:])
+                    present_files[root_server_dirs] = set(files)
+                    present_roots[root_server_dirs] = root
+
+                locations_effected, files_removed, moved_locations = self._move_directory_locations(
+                    db=db,
+                    old_server_path=old_server_path,
+                    new_server_path=new_server_path,
+                    present_files=present_files
+                )
+                db.session.commit()
+                move_log['location_entries_effected'] += locations_effected
+                move_log['files_entries_effected'] += files_removed
+
+                # add the moved files that are not in the database with batched tasks
+                files_to_add = []
+                for root_server_dirs, files in present_files.items():
+                    for relocated_file in files - moved_locations.get(root_server_dirs, set()):
+                        full_path = os.path.join(present_roots[root_server_dirs], relocated_file)
                         
-                        if not located_in_db:
-                            # if the file is excluded by the exclusion functions, do not add it to the database
-                            full_path = os.path.join(root, relocated_file)
-                            if any([exclusion_func(full_path) for exclusion_func in self.exclusion_functions]):
-                                continue
-                            
-                            task_kwargs = {'filepath': os.path.join(root, relocated_file)}
-                            nk_results = utils.RQTaskUtils.enqueue_new_task(db= db,
-                                                                            enqueued_function=archiver_tasks.add_file_to_db_task,
-                                                                            task_kwargs=task_kwargs)
+                        # if the file is excluded by the exclusion functions, do not add it to the database
+                        if any([exclusion_func(full_path) for exclusion_func in self.exclusion_functions]):
+                            continue
+                        files_to_add.append(full_path)
+                archiver_tasks.enqueue_add_files_tasks(db=db, filepaths=files_to_add)
 
 
             utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=move_log)
@@ -8,10 +8,14 @@ import re
 import subprocess
 import threading
 import time
+import traceback
 from datetime import datetime, timedelta
 from typing import Dict
 from sqlalchemy.engine import make_url
 from archives_application import create_app, utils
+from archives_application.archiver.archive_search import refresh_coverage_summaries
+from archives_application.archiver.directory_tree import rebuild_directory_tree
+from archives_application.archiver.project_membership import rebuild_project_memberships
 from archives_application.models import WorkerTaskModel
 
 # Create the app context so that tasks can access app extensions even though
@@ -44,14 +48,10 @@ class AppCustodian:
         # return a dictionary of results
         # get all functions that end in '_task'
         task_functions = [f for f in dir(self) if f.endswith('_task')]
-        results = {}
-        for task_name in task_functions:
-            task_function = getattr(self, task_name)
-            enqueuement_results = utils.RQTaskUtils.enqueue_new_task(db=db,
-                                                                     enqueued_function=task_function)
-            results[task_name] = enqueuement_results
-        
-        return results
+        enqueuement_results = utils.RQTaskUtils.enqueue_many(db=db,
+                                                             tasks=[(getattr(self, task_name), {})
+                                                                    for task_name in task_functions])
+        return dict(zip(task_functions, enqueuement_results))
 
 
     def _temp_file_clean_up_task(self, queue_id: str):
@@ -137,6 +137,79 @@ class AppCustodian:
             utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
             return log
 
+
+    def _directory_tree_rebuild_task(self, queue_id: str):
+        """
+        This task will rebuild the directories rollup table from the file_locations table. Besides correcting any drift,
+        this refreshes the text coverage counts, which content extraction does not maintain incrementally.
+        :param queue_id: the id of the task in the RQ queue
+        """
+        with app.app_context():
+            db = flask.current_app.extensions['sqlalchemy']
+            utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db)
+            log = {"task_id": queue_id, "directories_written": 0, "errors": []}
+            try:
+                start_time = time.time()
+                log["directories_written"] = rebuild_directory_tree(db=db)
+                db.session.commit()
+                log["seconds"] = round(time.time() - start_time, 1)
+            except Exception as e:
+                utils.FlaskAppUtils.attempt_db_rollback(db)
+                log["errors"].append({"error": str(e), "stack_trace": traceback.format_exc()})
+                utils.RQTaskUtils.failed_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
+                return log
+
+            utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
+            return log
+
+    def _project_membership_rebuild_task(self, queue_id: str):
+        """
+        This task will rebuild the project_file_hashes membership table, used by project and CAAN scoped archive
+        searches, from the projects and file_locations tables, correcting any drift in its incremental maintenance.
+        :param queue_id: the id of the task in the RQ queue
+        """
+        with app.app_context():
+            db = flask.current_app.extensions['sqlalchemy']
+            utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db)
+            log = {"task_id": queue_id, "memberships_written": 0, "errors": []}
+            try:
+                start_time = time.time()
+                log["memberships_written"] = rebuild_project_memberships(db=db)
+                db.session.commit()
+                log["seconds"] = round(time.time() - start_time, 1)
+            except Exception as e:
+                utils.FlaskAppUtils.attempt_db_rollback(db)
+                log["errors"].append({"error": str(e), "stack_trace": traceback.format_exc()})
+                utils.RQTaskUtils.failed_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
+                return log
+
+            utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
+            return log
+
+    def _search_coverage_refresh_task(self, queue_id: str):
+        """
+        This task will recompute the precomputed archive search coverage of the archive root, the top directory
+        levels and every project root, replacing the stored summaries.
+        :param queue_id: the id of the task in the RQ queue
+        """
+        with app.app_context():
+            db = flask.current_app.extensions['sqlalchemy']
+            utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db)
+            log = {"task_id": queue_id, "summaries_written": 0, "errors": []}
+            try:
+                start_time = time.time()
+                log["summaries_written"] = refresh_coverage_summaries()
+                db.session.commit()
+                log["seconds"] = round(time.time() - start_time, 1)
+            except Exception as e:
+                utils.FlaskAppUtils.attempt_db_rollback(db)
+                log["errors"].append({"error": str(e), "stack_trace": traceback.format_exc()})
+                utils.RQTaskUtils.failed_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
+                return log
+
+            utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=log)
+            return log
+
 def restart_app_task(queue_id: str, delay: int = 0):
     """
     This task will restart the app using the supervisorctl command.
@@ -19,6 +19,7 @@ from archives_application import utils
 # This dictionary is used to determine how long to keep task records in the database measured in days.
 # The keys are the names of the tasks and the values are the number of days to keep the records.
 TASK_RECORD_LIFESPANS = {'add_file_to_db_task': 90,
+                         'add_files_to_db_task': 90,
                          'scrape_file_data_task': 365,
                          'confirm_file_locations_task': 365,
                          'add_deletion_to_db_task':180,
@@ -27,12 +28,16 @@ TASK_RECORD_LIFESPANS = {'add_file_to_db_task': 90,
                          'db_backup_clean_up_task': 90,
                          'task_records_clean_up_task': 90,
                          'temp_file_clean_up_task': 90,
+                         'directory_tree_rebuild_task': 90,
+                         'search_coverage_refresh_task': 90,
+                         'project_membership_rebuild_task': 90,
                          'db_backup_task': 180,
                          'confirm_project_locations_task': 365,
                          'consolidation_target_removal_task': 365,
                          'consolidate_dirs_edit_task': 365,
                          'batch_move_edits_task': 365,
-                         'batch_process_inbox_task': 365}
+                         'batch_process_inbox_task': 365,
+                         'archive_search_task': 30}
 
 # This is the default timeout for tasks that are enqueued via the RQ task queue. It is measured in seconds.
 TASK_DEFAULT_TIMEOUT_SECONDS = 5400
@@ -435,7 +440,36 @@ def test_rq_connection():
     except Exception as e:
         m = "Error connecting to the redis queue: "
         return utils.FlaskAppUtils.web_exception_subroutine(flash_message=m, thrown_exception=e, app_obj=flask.current_app)
-    
+
+
+@main.route("/admin/task_progress/<task_id>")
+@utils.FlaskAppUtils.roles_required(['ADMIN'])
+def task_progress(task_id):
+    """Shows the progress of a worker task: its worker_tasks record, which long running tasks only rewrite every
+    so often, along with the live progress counters they keep in Redis.
+
+    Returns:
+        Response: A JSON response containing the task record and its live progress counters.
+    """
+    task_record = db.session.query(WorkerTaskModel).filter(WorkerTaskModel.task_id == task_id).first()
+    try:
+        live_progress = utils.TaskProgressReporter.live_progress(q_id=task_id)
+    except Exception as e:
+        live_progress = {"Error": str(e)}
+
+    if not task_record and not live_progress:
+        return flask.jsonify({"task_id": task_id, "message": "No task found with this id."}), 404
+
+    info = {"task_id": task_id, "live_progress": live_progress}
+    if task_record:
+        info.update({"status": task_record.status,
+                     "function_name": task_record.function_name,
+                     "time_enqueued": str(task_record.time_enqueued),
+                     "time_completed": str(task_record.time_completed) if task_record.time_completed else None,
+                     "task_results": task_record.task_results})
+    return flask.jsonify(info)
+
+
 @main.route("/test/file_server_access")
 @utils.FlaskAppUtils.roles_required(['ADMIN'])
 def test_file_server_access():
@@ -4,8 +4,8 @@ from archives_application import db, login_manager
 from datetime import datetime
 from flask_login import UserMixin
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import func, CheckConstraint, UniqueConstraint, text
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import func, event, CheckConstraint, DDL, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 
 
 @login_manager.user_loader
@@ -115,15 +115,78 @@ class FileLocationModel(db.Model):
     filename = db.Column("filename", db.String)
     existence_confirmed = db.Column("existence_confirmed", db.DateTime)
     hash_confirmed = db.Column("hash_confirmed", db.DateTime)
+    # stat signature observed when the hash was last confirmed. Used by incremental scrapes to skip re-hashing.
+    observed_size = db.Column("observed_size", db.BigInteger)
+    observed_mtime_ns = db.Column("observed_mtime_ns", db.BigInteger)
+    # file_server_directories normalized to forward slashes with a trailing slash, maintained by postgres so that
+    # every writer agrees on it. Subtree queries use range comparisons on it (see FileServerUtils.db_subtree_bounds).
+    directory_path = db.Column(
+        "directory_path",
+        db.Text,
+        db.Computed(r"ltrim(regexp_replace(coalesce(file_server_directories, '') || '/', '[\\/]+', '/', 'g'), '/')",
+                    persisted=True),
+    )
+    # english text search vectors of the filename (dots split into words) and of the filename plus directories,
+    # maintained by postgres for the archive search filename and filename/path modes. Deferred so that ORM loads of
+    # locations do not carry them.
+    filename_tsv = db.deferred(db.Column(
+        "filename_tsv",
+        TSVECTOR,
+        db.Computed(r"to_tsvector('english', regexp_replace(coalesce(filename, ''), '\.', ' ', 'g'))",
+                    persisted=True),
+    ))
+    filepath_tsv = db.deferred(db.Column(
+        "filepath_tsv",
+        TSVECTOR,
+        db.Computed(r"to_tsvector('english', regexp_replace(coalesce(filename, ''), '\.', ' ', 'g'))"
+                    r" || to_tsvector('english', coalesce(file_server_directories, ''))",
+                    persisted=True),
+    ))
+
+    __table_args__ = (
+        db.Index('ix_file_locations_directory_path', 'directory_path',
+                 postgresql_ops={'directory_path': 'text_pattern_ops'}),
+        db.Index('ix_file_locations_filename_tsv', 'filename_tsv', postgresql_using='gin'),
+        db.Index('ix_file_locations_filepath_tsv', 'filepath_tsv', postgresql_using='gin'),
+        # substring and fuzzy filename search (requires the pg_trgm extension)
+        db.Index('ix_file_locations_filename_trgm', 'filename', postgresql_using='gin',
+                 postgresql_ops={'filename': 'gin_trgm_ops'}),
+    )
 
     def __repr__(self):
         return f"File Location: {self.id}, {self.file_id}, {self.file_server_directories}, {self.filename}, {self.existence_confirmed}, {self.hash_confirmed}"
     
+class DirectoryModel(db.Model):
+    """
+    Rolled-up file counts and sizes for every directory holding indexed files, maintained by
+    archiver.directory_tree. Paths follow the file_locations.directory_path convention ('' is the archive root).
+    """
+    __tablename__ = "directories"
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.Text, nullable=False, unique=True)
+    parent_path = db.Column(db.Text, index=True)
+    depth = db.Column(db.Integer, nullable=False)
+    direct_file_count = db.Column(db.BigInteger, nullable=False, server_default="0")
+    recursive_file_count = db.Column(db.BigInteger, nullable=False, server_default="0")
+    recursive_bytes = db.Column(db.BigInteger, nullable=False, server_default="0")
+    # files with stored extracted text, and files whose extraction failed
+    recursive_text_file_count = db.Column(db.BigInteger, nullable=False, server_default="0")
+    recursive_text_failure_count = db.Column(db.BigInteger, nullable=False, server_default="0")
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_directories_path_pattern', 'path', postgresql_ops={'path': 'text_pattern_ops'}),
+    )
+
+    def __repr__(self):
+        return f"Directory: {self.path}, {self.recursive_file_count}, {self.recursive_bytes}"
+
+
 class WorkerTaskModel(db.Model):
     __tablename__ = 'worker_tasks'
     
     id = db.Column(db.Integer, primary_key=True)
-    task_id = db.Column(db.String(255), nullable=False)
+    task_id = db.Column(db.String(255), nullable=False, unique=True)
     time_enqueued = db.Column(db.DateTime, nullable=False)
     time_completed = db.Column(db.DateTime)
     origin = db.Column(db.String(255), nullable=False)
@@ -174,6 +237,10 @@ class ArchiveSearchRunModel(db.Model):
     )
     returned_result_count = db.Column(db.Integer)
     coverage_summary = db.Column(JSONB)
+    # wall-clock milliseconds of each search stage, eg content_search, filename_search, coverage, metadata
+    stage_timings = db.Column(JSONB)
+    # sha256 hex digest of the access token returned to the API client that queued an async search
+    access_token_hash = db.Column(db.String(64))
     application_version = db.Column(db.String(50), nullable=False)
 
     user = db.relationship("UserModel")
@@ -188,7 +255,7 @@ class ArchiveSearchRunModel(db.Model):
             name="ck_archive_search_runs_result_count_nonnegative",
         ),
         CheckConstraint(
-            "search_mode IN ('combined', 'filename_only', 'filepath', 'content')",
+            "search_mode IN ('combined', 'filename_only', 'filepath', 'filename_fragment', 'content')",
             name="ck_archive_search_runs_search_mode",
         ),
         CheckConstraint(
@@ -207,6 +274,10 @@ class ArchiveSearchRunModel(db.Model):
             "coverage_summary IS NULL OR jsonb_typeof(coverage_summary) = 'object'",
             name="ck_archive_search_runs_coverage_summary_json",
         ),
+        CheckConstraint(
+            "stage_timings IS NULL OR jsonb_typeof(stage_timings) = 'object'",
+            name="ck_archive_search_runs_stage_timings_json",
+        ),
         db.Index(
             "ix_archive_search_runs_timestamp",
             search_timestamp.desc(),
@@ -230,6 +301,27 @@ class ArchiveSearchRunModel(db.Model):
         )
 
 
+class SearchCoverageSummaryModel(db.Model):
+    """Precomputed archive-search coverage counts for one scope root ('' for all archives)."""
+
+    __tablename__ = "search_coverage_summaries"
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope_prefix = db.Column(db.Text, nullable=False, unique=True)
+    coverage = db.Column(JSONB, nullable=False)
+    computed_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        CheckConstraint(
+            "jsonb_typeof(coverage) = 'object'",
+            name="ck_search_coverage_summaries_coverage_json",
+        ),
+    )
+
+    def __repr__(self):
+        return f"Search Coverage Summary: {self.scope_prefix}, {self.computed_at}"
+
+
 class ProjectCaanModel(db.Model):
     __tablename__ = 'project_caans'
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), primary_key=True)
@@ -255,6 +347,34 @@ class ProjectModel(db.Model):
 
     def __repr__(self):
         return f"project: {self.id}, {self.number}, {self.name}, {self.file_server_location}, {self.drawings}"
+
+
+class ProjectFileHashModel(db.Model):
+    """
+    Files with at least one location under a project's file_server_location, maintained by
+    archiver.project_membership so that project and CAAN scoped searches do not re-derive it from path prefixes.
+    """
+    __tablename__ = "project_file_hashes"
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete="CASCADE"), primary_key=True)
+    file_hash = db.Column(db.String, db.ForeignKey('files.hash', ondelete="CASCADE"), primary_key=True, index=True)
+
+    def __repr__(self):
+        return f"project file: {self.project_id}, {self.file_hash}"
+
+
+class ProjectMembershipRootModel(db.Model):
+    """
+    The normalized file_server_location root that each project's project_file_hashes rows were built from. Projects are
+    written by the external project sync, so a project with no row here, or whose current location no longer matches
+    its root, has no usable membership and is searched by path prefix until its membership is refreshed.
+    """
+    __tablename__ = "project_membership_roots"
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete="CASCADE"), primary_key=True)
+    root = db.Column(db.String, nullable=False)
+    refreshed_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"project membership root: {self.project_id}, {self.root}, {self.refreshed_at}"
     
 
 class CAANModel(db.Model):
@@ -323,6 +443,12 @@ class FileContentFtsChunkModel(db.Model):
             "length(chunk_text) > 0",
             name="ck_file_content_fts_chunks_nonempty",
         ),
+        db.Index(
+            "ix_file_content_fts_chunks_current_search_vector",
+            "search_vector",
+            postgresql_using="gin",
+            postgresql_where=text("is_current"),
+        ),
     )
 
     id = db.Column(db.BigInteger, primary_key=True)
@@ -334,10 +460,52 @@ class FileContentFtsChunkModel(db.Model):
     chunk_index = db.Column(db.Integer, nullable=False)
     chunk_text = db.Column(db.Text, nullable=False)
     chunked_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    search_vector = db.deferred(db.Column(
+        TSVECTOR,
+        db.Computed("to_tsvector('simple', coalesce(chunk_text, ''))", persisted=True),
+    ))
+    # True for the chunks of the latest chunk set (max chunked_at) of their file, maintained by the
+    # file_content_fts_chunks_mark_current triggers whichever process writes the chunks
+    is_current = db.Column(db.Boolean, nullable=False, server_default=text("true"))
 
     file_content = db.relationship("FileContentModel", back_populates="fts_chunks")
 
 
+# Statement-level triggers that recompute is_current for the files whose chunks were inserted or deleted, so that
+# writing a new chunk set retires the previous one and deleting the latest set brings the previous one back.
+_MARK_CURRENT_CHUNKS_FUNCTION = DDL("""
+    CREATE OR REPLACE FUNCTION file_content_fts_chunks_mark_current() RETURNS trigger AS $$
+    BEGIN
+        UPDATE file_content_fts_chunks c
+        SET is_current = (c.chunked_at = latest.chunked_at)
+        FROM (
+            SELECT c2.file_hash, max(c2.chunked_at) AS chunked_at
+            FROM file_content_fts_chunks c2
+            WHERE c2.file_hash IN (SELECT DISTINCT file_hash FROM changed_chunks)
+            GROUP BY c2.file_hash
+        ) latest
+        WHERE c.file_hash = latest.file_hash
+        AND c.is_current IS DISTINCT FROM (c.chunked_at = latest.chunked_at);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+""")
+_MARK_CURRENT_CHUNKS_INSERT_TRIGGER = DDL("""
+    CREATE TRIGGER file_content_fts_chunks_mark_current_insert
+    AFTER INSERT ON file_content_fts_chunks
+    REFERENCING NEW TABLE AS changed_chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION file_content_fts_chunks_mark_current()
+""")
+_MARK_CURRENT_CHUNKS_DELETE_TRIGGER = DDL("""
+    CREATE TRIGGER file_content_fts_chunks_mark_current_delete
+    AFTER DELETE ON file_content_fts_chunks
+    REFERENCING OLD TABLE AS changed_chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION file_content_fts_chunks_mark_current()
+""")
+for _ddl in (_MARK_CURRENT_CHUNKS_FUNCTION, _MARK_CURRENT_CHUNKS_INSERT_TRIGGER, _MARK_CURRENT_CHUNKS_DELETE_TRIGGER):
+    event.listen(FileContentFtsChunkModel.__table__, "after_create", _ddl.execute_if(dialect="postgresql"))
+
+
 class FileContentFailureModel(db.Model):
     __tablename__ = 'file_content_failures'
     __table_args__ = (
@@ -7,6 +7,7 @@ import os
 from typing import Optional
 
 from archives_application import create_app, utils
+from archives_application.archiver.project_membership import refresh_project_memberships
 from archives_application.models import ProjectModel
 
 # Create the app context so that tasks can access app extensions even though
@@ -28,7 +29,8 @@ def confirm_project_locations_task(queue_id: str, projects_list: Optional[list]
     with app.app_context():
         os.environ["no_proxy"] = "*"
         db: flask_sqlalchemy.SQLAlchemy = flask.current_app.extensions["sqlalchemy"]
-        utils.RQTaskUtils.initiate_task_subroutine(q_id=queue_id, sql_db=db)
+        progress = utils.TaskProgressReporter(q_id=queue_id, sql_db=db)
+        progress.initiate()
         archives_location = flask.current_app.config.get("ARCHIVES_LOCATION")
         task_log = {
             "projects checked": {"completed": False, "count": 0},
@@ -38,12 +40,9 @@ def confirm_project_locations_task(queue_id: str, projects_list: Optional[list]
             "projects not found": [],
             "errors": []
         }
-        progress_update = lambda log: utils.RQTaskUtils.update_task_subroutine(
-            q_id=queue_id,
-            sql_db=db,
-            task_results=log
-        )
-
+        # projects whose location changed since the last commit; their file memberships are recomputed before
+        # anything commits the session, including the periodic worker_tasks write of progress.update
+        relocated_project_ids = []
         try:
             # Limit the scan to requested project numbers when provided, and
             # report any requested numbers that do not exist in the database.
@@ -60,6 +59,11 @@ def confirm_project_locations_task(queue_id: str, projects_list: Optional[list]
 
             for project in projects:
                 task_log["projects checked"]["count"] += 1
+                if relocated_project_ids and progress.flush_due:
+                    refresh_project_memberships(db=db, project_ids=relocated_project_ids)
+                    relocated_project_ids = []
+                # live counters always go to redis; worker_tasks is only rewritten every few seconds
+                progress.update(task_log)
                 try:
                     project_location, _ = utils.FileServerUtils.path_to_project_dir(
                         project_number=project.number,
@@ -72,6 +76,7 @@ def confirm_project_locations_task(queue_id: str, projects_list: Optional[list]
                         if project.file_server_location:
                             old_file_server_location = project.file_server_location
                             project.file_server_location = None
+                            relocated_project_ids.append(project.id)
                             task_log["projects cleared"].append({
                                 "project": project.number,
                                 "old file_server_location": old_file_server_location,
@@ -96,17 +101,19 @@ def confirm_project_locations_task(queue_id: str, projects_list: Optional[list]
                             relative_project_location
                         )
                         project.file_server_location = relative_project_location
+                        relocated_project_ids.append(project.id)
                         task_log["projects updated"].append({
                             "project": project.number,
                             "old file_server_location": old_file_server_location,
                             "new file_server_location": project.file_server_location
                         })
 
-                    # Commit periodically so a large full-database scan can
-                    # report progress and avoid holding every change until the end.
+                    # Commit periodically so a large full-database scan
+                    # avoids holding every change until the end.
                     if task_log["projects checked"]["count"] % 200 == 0:
+                        refresh_project_memberships(db=db, project_ids=relocated_project_ids)
                         db.session.commit()
-                        progress_update(log=task_log)
+                        relocated_project_ids = []
 
                 except utils.ArchivesPathException:
                     # Path helper failures mean the expected project directory
@@ -119,9 +126,9 @@ def confirm_project_locations_task(queue_id: str, projects_list: Optional[list]
                         "exception": str(e)
                     })
 
+            refresh_project_memberships(db=db, project_ids=relocated_project_ids)
             db.session.commit()
             task_log["projects checked"]["completed"] = True
-            progress_update(log=task_log)
 
         except Exception as e:
             utils.FlaskAppUtils.attempt_db_rollback(db)
@@ -129,7 +136,6 @@ def confirm_project_locations_task(queue_id: str, projects_list: Optional[list]
                 "message": "Error confirming project locations:",
                 "exception": str(e)
             })
-            progress_update(log=task_log)
 
-        utils.RQTaskUtils.complete_task_subroutine(q_id=queue_id, sql_db=db, task_result=task_log)
+        progress.complete(task_log)
         return task_log
@@ -4,21 +4,27 @@ import fitz
 import flask
 import flask_sqlalchemy
 import hashlib
+import itertools
+import json
+import mmap
 import os
 import pandas as pd
 import psutil
 import random
 import re
 import redis
+import secrets
 import subprocess
 import sys
+import threading
+import time
 import traceback
 from datetime import datetime
 from flask_login import current_user
 from functools import wraps
 from pathlib import Path, PureWindowsPath
 from PIL import Image
-from sqlalchemy import select
+from sqlalchemy import and_, insert, select, true
 from sqlalchemy.sql.expression import func
 from typing import Union, List, Dict
 
@@ -491,6 +497,62 @@ class FileServerUtils:
         db_dir_norm = f"{db_dir}/" if db_dir else ''
         return db_dir, db_dir_norm
 
+    @staticmethod
+    def db_directory_path(file_server_directories) -> str:
+        """
+        Python equivalent of the generated file_locations.directory_path column: file_server_directories with
+        forward slashes, no leading slash, repeated separators collapsed and a single trailing slash (empty for the
+        archive root). Same convention as the db_dir_norm value returned by app_path_to_db_dir.
+        :param file_server_directories: archive-relative directory path using either separator
+        :return: normalized directory path
+        """
+        return re.sub(r"[\\/]+", "/", f"{file_server_directories or ''}/").lstrip("/")
+
+    @staticmethod
+    def db_subtree_bounds(file_server_directories):
+        """
+        Half-open range of file_locations.directory_path values that lie in a directory or any of its
+        subdirectories. Every such value starts with the normalized path, which ends in '/', and '0' is the
+        character after '/', so the range is [path, path[:-1] + '0'). Because the bounds are compared bytewise
+        with the text_pattern_ops operators, the text_pattern_ops index on directory_path answers this as a single
+        index range scan and no LIKE wildcard escaping is needed.
+        :param file_server_directories: archive-relative directory path using either separator
+        :return: tuple of (lower bound, upper bound), or None for the archive root (the whole table)
+        """
+        directory_path = FileServerUtils.db_directory_path(file_server_directories)
+        if not directory_path:
+            return None
+        return directory_path, directory_path[:-1] + "0"
+
+    @staticmethod
+    def db_subtree_filter(column, file_server_directories):
+        """
+        SQLAlchemy filter matching a directory_path column to a directory subtree (see db_subtree_bounds).
+        :param column: directory_path column, eg FileLocationModel.directory_path
+        :param file_server_directories: archive-relative directory path using either separator
+        :return: SQLAlchemy boolean expression
+        """
+        bounds = FileServerUtils.db_subtree_bounds(file_server_directories)
+        if bounds is None:
+            return true()
+        return and_(column.op("~>=~")(bounds[0]), column.op("~<~")(bounds[1]))
+
+    @staticmethod
+    def db_subtree_sql(column_expr: str, file_server_directories, params: dict, key: str = "subtree") -> str:
+        """
+        Raw SQL version of db_subtree_filter. The bound values are added to params under key-derived names.
+        :param column_expr: SQL expression of a directory_path column, eg "fl.directory_path"
+        :param file_server_directories: archive-relative directory path using either separator
+        :param params: query parameter dictionary to add the bounds to
+        :param key: prefix for the parameter names, to keep several subtree predicates in one query apart
+        :return: SQL predicate string
+        """
+        bounds = FileServerUtils.db_subtree_bounds(file_server_directories)
+        if bounds is None:
+            return "TRUE"
+        params[f"{key}_lower"], params[f"{key}_upper"] = bounds
+        return f"({column_expr} ~>=~ :{key}_lower AND {column_expr} ~<~ :{key}_upper)"
+
     @staticmethod
     def path_to_project_dir(project_number: Union[int, str], archives_location: str, create_new_project_dir: bool = False):
         """
@@ -1061,19 +1123,64 @@ class FilesUtils:
                 tiff.save(converted_path, output_file_type.upper())
         return converted_path
 
+    # Strategies understood by FilesUtils.get_hash. 'readinto' reads into one reused buffer, 'mmap' hashes a memory
+    # map of the file (best for local disks), 'file_digest' defers to hashlib.file_digest and 'read' is the
+    # original allocate-per-chunk loop, kept as a benchmark baseline.
+    HASH_STRATEGIES = ('readinto', 'mmap', 'file_digest', 'read')
+    HASH_MIN_BUFFER_SIZE = 64 * 1024
+    HASH_MAX_BUFFER_SIZE = 4 * 1024 * 1024
+
+    @staticmethod
+    def hash_buffer_size(file_size: int, max_buffer_size: int = None):
+        """
+        Picks a read buffer size for hashing a file of the given size. Small files are read in a single call; larger
+        files use a power-of-two buffer of roughly 1/16th of the file, bounded by HASH_MIN_BUFFER_SIZE and
+        max_buffer_size, so that a multi-hundred-MB plan set takes a few hundred reads rather than hundreds of
+        thousands.
+        :param file_size: size of the file in bytes
+        :param max_buffer_size: upper bound for the buffer. Defaults to FilesUtils.HASH_MAX_BUFFER_SIZE.
+        :return: buffer size in bytes
+        """
+        max_buffer_size = max_buffer_size or FilesUtils.HASH_MAX_BUFFER_SIZE
+        if file_size <= FilesUtils.HASH_MIN_BUFFER_SIZE:
+            return max(file_size, 1)
+        buffer_size = FilesUtils.HASH_MIN_BUFFER_SIZE
+        while buffer_size < max_buffer_size and buffer_size * 16 < file_size:
+            buffer_size *= 2
+        return min(buffer_size, max_buffer_size)
+
+    @staticmethod
+    def _hashing_config():
+        """
+        Returns the (strategy, max buffer size) hashing defaults, read from the HASH_STRATEGY and HASH_MAX_BUFFER_SIZE
+        app config values when called inside an app context.
+        """
+        strategy, max_buffer_size = FilesUtils.HASH_STRATEGIES[0], FilesUtils.HASH_MAX_BUFFER_SIZE
+        if flask.has_app_context():
+            strategy = flask.current_app.config.get('HASH_STRATEGY', strategy)
+            max_buffer_size = int(flask.current_app.config.get('HASH_MAX_BUFFER_SIZE', max_buffer_size))
+        return strategy, max_buffer_size
+
     @staticmethod
-    def get_hash(filepath, hash_algo=hashlib.sha1):
+    def get_hash(filepath, hash_algo=hashlib.sha1, strategy: str = None, buffer_size: int = None,
+                 cache: 'FileHashCache' = None, refresh_cache: bool = False):
         """
         Compute a cryptographic (or checksum) hash digest of a file's byte content.
 
-        The file is read incrementally in fixed-size chunks to avoid loading large files
-        entirely into memory. By default SHA-1 is used, but any hashlib-compatible constructor
-        (e.g., hashlib.md5, hashlib.sha256) can be supplied.
+        The file is streamed through the hash object so memory use stays bounded regardless of file size. By default
+        SHA-1 is used, but any hashlib-compatible constructor (e.g., hashlib.md5, hashlib.sha256) can be supplied.
 
         Args:
             filepath (str | os.PathLike): Path to the file whose contents will be hashed.
             hash_algo (Callable[[], 'hashlib._Hash']): A zero-argument callable returning a hash object
                 supporting .update(bytes) and .hexdigest(). Defaults to hashlib.sha1.
+            strategy (str, optional): One of FilesUtils.HASH_STRATEGIES. Defaults to the HASH_STRATEGY app config
+                value, or 'readinto'.
+            buffer_size (int, optional): Read buffer size in bytes. Defaults to a size chosen from the file size by
+                FilesUtils.hash_buffer_size, capped by the HASH_MAX_BUFFER_SIZE app config value.
+            cache (FileHashCache, optional): If given, a digest cached for the file's current stat identity is
+                returned without reading the file, and newly computed digests are stored in the cache.
+            refresh_cache (bool): Read the file even if the cache has a digest for it, and replace the cached value.
 
         Returns:
             str: The hexadecimal string digest of the file contents.
@@ -1082,6 +1189,7 @@ class FilesUtils:
             FileNotFoundError: If the file does not exist.
             PermissionError: If the file cannot be read due to OS permissions.
             OSError: For other I/O related errors encountered during reading.
+            ValueError: If the strategy is not recognized.
 
         Examples:
             >>> FilesUtils.get_hash("document.pdf")
@@ -1090,35 +1198,240 @@ class FilesUtils:
             '3b1f6a9b7b2d...'
 
         Performance Notes:
-            - Chunk size is currently 1024 bytes; adjust if profiling shows benefit for large files.
-            - The function streams the file; memory footprint remains small regardless of file size.
+            - 'readinto' reuses a single bytearray, so no per-chunk allocation happens in the read loop.
+            - 'mmap' avoids copying into user space altogether but is only worthwhile on local disks; on network
+              mounts page faults become round trips. It falls back to 'readinto' for empty files or when the file
+              cannot be mapped.
+            - Use benchmarks/hashing_benchmark.py to measure MB/s per strategy before changing the defaults.
 
         Security Notes:
             - SHA-1 is no longer recommended for collision resistance in security-sensitive contexts.
               Prefer hashlib.sha256 or stronger for integrity/security validation.
         """
-        def chunk_reader(fobj, chunk_size=1024):
-            """ Generator that reads a file in chunks of bytes """
-            while True:
-                chunk = fobj.read(chunk_size)
-                if not chunk:
-                    return
-                yield chunk
+        if cache is not None:
+            cache_key = FileHashCache.stat_key(os.stat(filepath), hash_algo)
+            file_hash = None if refresh_cache else cache.get(cache_key)
+            if file_hash is None:
+                file_hash = FilesUtils.get_hash(filepath, hash_algo=hash_algo, strategy=strategy, buffer_size=buffer_size)
+                # only cache the digest if the file did not change while it was being read
+                if FileHashCache.stat_key(os.stat(filepath), hash_algo) == cache_key:
+                    cache.set(cache_key, file_hash)
+            return file_hash
+
+        default_strategy, max_buffer_size = FilesUtils._hashing_config()
+        strategy = strategy or default_strategy
+        if strategy not in FilesUtils.HASH_STRATEGIES:
+            raise ValueError(f"Unknown hashing strategy '{strategy}'. Options are {FilesUtils.HASH_STRATEGIES}")
 
         hashobj = hash_algo()
-        with open(filepath, "rb") as f:
-            for chunk in chunk_reader(f):
-                hashobj.update(chunk)
+        with open(filepath, "rb", buffering=0) as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if not buffer_size:
+                buffer_size = FilesUtils.hash_buffer_size(file_size, max_buffer_size=max_buffer_size)
+
+            if strategy == 'mmap' and file_size > 0:
+                try:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        hashobj.update(mapped)
+                    return hashobj.hexdigest()
+                except (OSError, ValueError):
+                    # some filesystems (and special files) cannot be memory mapped
+                    f.seek(0)
+
+            if strategy == 'file_digest':
+                return hashlib.file_digest(f, hash_algo).hexdigest()
+
+            if strategy == 'read':
+                while chunk := f.read(buffer_size):
+                    hashobj.update(chunk)
+                return hashobj.hexdigest()
+
+            buffer = bytearray(buffer_size)
+            view = memoryview(buffer)
+            while bytes_read := f.readinto(buffer):
+                hashobj.update(view[:bytes_read])
 
         return hashobj.hexdigest()
 
 
+class FileHashCache:
+    """
+    Redis-backed cache of file digests keyed by stat identity (device, inode, size, mtime in ns) and hash algorithm,
+    shared by the web app and the workers so that a file hashed by an archiving event is not read again by a scrape
+    or a move later the same day. Least recently used entries are evicted once the cache holds more than
+    max_entries digests. Redis errors are logged and treated as cache misses; the cache never makes hashing fail.
+    An instance may be shared by hashing threads. Its hits and misses are also added to cache-wide totals in Redis,
+    sent with the instance's next pipeline rather than in a round trip of their own.
+
+    Note that device ids are only stable within one mount, so containers that mount the file server separately
+    will not share entries.
+    """
+
+    def __init__(self, redis_conn, max_entries: int = 1_000_000, key_prefix: str = "file_hash_cache"):
+        self.redis = redis_conn
+        self.max_entries = max_entries
+        self.digests_key = f"{key_prefix}:digests"
+        self.lru_key = f"{key_prefix}:lru"
+        self.hits_key = f"{key_prefix}:hits"
+        self.misses_key = f"{key_prefix}:misses"
+        self.hits = 0
+        self.misses = 0
+        self._unsent_hits = 0
+        self._unsent_misses = 0
+        self._counter_lock = threading.Lock()
+
+    @classmethod
+    def from_app(cls, app=None):
+        """
+        Builds a cache on the app's Redis connection from the HASH_CACHE_ENABLED (default True) and
+        HASH_CACHE_MAX_ENTRIES app config values.
+        :param app: flask app. Defaults to flask.current_app.
+        :return: FileHashCache, or None if the cache is disabled or Redis is not configured.
+        """
+        app = app or flask.current_app
+        if not app.config.get("HASH_CACHE_ENABLED", True) or not getattr(app, "q", None):
+            return None
+        return cls(redis_conn=app.q.connection,
+                   max_entries=int(app.config.get("HASH_CACHE_MAX_ENTRIES", 1_000_000)))
+
+    @staticmethod
+    def stat_key(stat_result: os.stat_result, hash_algo=hashlib.sha1):
+        """
+        :param stat_result: os.stat result for the file
+        :param hash_algo: hashlib constructor the digest is computed with
+        :return: cache key string
+        """
+        return f"{stat_result.st_dev}:{stat_result.st_ino}:{stat_result.st_size}:{stat_result.st_mtime_ns}:{hash_algo().name}"
+
+    def get(self, key: str):
+        """
+        :param key: key from FileHashCache.stat_key
+        :return: cached hex digest or None
+        """
+        unsent = (0, 0)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hget(self.digests_key, key)
+            pipe.zadd(self.lru_key, {key: time.time()}, xx=True)
+            unsent = self._queue_counters(pipe)
+            digest = pipe.execute()[0]
+        except redis.exceptions.RedisError as e:
+            self._log_error(e)
+            self._count(hits=unsent[0], misses=unsent[1], unsent_only=True)
+            self._count(misses=1)
+            return None
+        if digest is None:
+            self._count(misses=1)
+            return None
+        self._count(hits=1)
+        return digest.decode() if isinstance(digest, bytes) else digest
+
+    def set(self, key: str, digest: str):
+        """
+        Stores a digest and evicts the least recently used entries if the cache is over max_entries.
+        """
+        unsent = (0, 0)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(self.digests_key, key, digest)
+            pipe.zadd(self.lru_key, {key: time.time()})
+            unsent = self._queue_counters(pipe)
+            pipe.zcard(self.lru_key)
+            entries = pipe.execute()[-1]
+            unsent = (0, 0)
+            if entries > self.max_entries:
+                evicted = [member for member, _ in self.redis.zpopmin(self.lru_key, entries - self.max_entries)]
+                if evicted:
+                    self.redis.hdel(self.digests_key, *evicted)
+        except redis.exceptions.RedisError as e:
+            self._log_error(e)
+            self._count(hits=unsent[0], misses=unsent[1], unsent_only=True)
+
+    def stats(self):
+        """
+        :return: dict of this instance's hits and misses plus the cache-wide totals and size
+        """
+        with self._counter_lock:
+            stats = {"Hits": self.hits, "Misses": self.misses}
+        unsent = (0, 0)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            unsent = self._queue_counters(pipe)
+            pipe.get(self.hits_key)
+            pipe.get(self.misses_key)
+            pipe.hlen(self.digests_key)
+            total_hits, total_misses, entries = pipe.execute()[-3:]
+            stats.update({"Total Hits": int(total_hits or 0),
+                          "Total Misses": int(total_misses or 0),
+                          "Entries": entries})
+        except redis.exceptions.RedisError as e:
+            self._log_error(e)
+            self._count(hits=unsent[0], misses=unsent[1], unsent_only=True)
+        return stats
+
+    def _count(self, hits: int = 0, misses: int = 0, unsent_only: bool = False):
+        """
+        Records hits and misses of this instance, to be added to the cache-wide totals by its next pipeline.
+        :param unsent_only: restore counts that a failed pipeline did not send, without recounting them for this instance
+        """
+        with self._counter_lock:
+            if not unsent_only:
+                self.hits += hits
+                self.misses += misses
+            self._unsent_hits += hits
+            self._unsent_misses += misses
+
+    def _queue_counters(self, pipe):
+        """
+        Adds the hits and misses not yet sent to the cache-wide totals to a pipeline.
+        :return: tuple of the (hits, misses) queued, for _count to restore if the pipeline fails
+        """
+        with self._counter_lock:
+            hits, misses = self._unsent_hits, self._unsent_misses
+            self._unsent_hits = self._unsent_misses = 0
+        if hits:
+            pipe.incrby(self.hits_key, hits)
+        if misses:
+            pipe.incrby(self.misses_key, misses)
+        return hits, misses
+
+    @staticmethod
+    def _log_error(error: Exception):
+        if flask.has_app_context():
+            flask.current_app.logger.warning(f"File hash cache unavailable: {error}")
+
+
 class RQTaskUtils:
     """
     To provide additional context for utility functions, they are organized as static methods under classes.
     This class is for utility functions that are specific to using the rq task queue.
     """
 
+    # Job ids are unique without querying the database: a random token drawn once per process separates processes
+    # (and containers, where pids repeat) and a counter separates the ids generated by this process.
+    _job_id_process_token = secrets.token_hex(3)
+    _job_id_counter = itertools.count()
+
+    @staticmethod
+    def new_job_id(function_name: str):
+        """
+        Creates a unique job id of the form <function name>_<timestamp>_<process token><counter>. The timestamp keeps
+        ids readable and sortable by time; worker_tasks.task_id has a unique index as a backstop.
+        :param function_name: name of the enqueued function
+        :return: job id string
+        """
+        return f"{function_name}_{datetime.now().strftime(r'%Y%m%d%H%M%S')}_" \
+               f"{RQTaskUtils._job_id_process_token}{next(RQTaskUtils._job_id_counter):06x}"
+
+    @staticmethod
+    def _reset_job_id_token():
+        """
+        Draws a new process token in forked children (rq work horses are forked from the worker) so that they do not
+        generate the same ids as their siblings.
+        """
+        RQTaskUtils._job_id_process_token = secrets.token_hex(3)
+        RQTaskUtils._job_id_counter = itertools.count()
+
     @staticmethod
     def enqueue_new_task(db, enqueued_function: callable, task_kwargs: Union[dict, None] = None,
                          enqueue_call_kwargs: Union[dict, None] = None,
@@ -1138,21 +1451,7 @@ class RQTaskUtils:
         enqueue_call_kwargs = dict(enqueue_call_kwargs) if enqueue_call_kwargs is not None else {}
         task_info = dict(task_info) if task_info is not None else {}
 
-        def random_string(length=5):
-            """
-            sub-function to generate a random string of a given length.
-            Used for creating unique task ids here.
-            """
-            chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-            return ''.join(random.choice(chars) for _ in range(length))
-
-
-        job_id = f"{enqueued_function.__name__}_{datetime.now().strftime(r'%Y%m%d%H%M%S')}"
-        
-        # Check if job_id already exists in the database. If it does, add a random string to the end of it.
-        while db.session.query(WorkerTaskModel).filter(WorkerTaskModel.task_id == job_id).first():
-            job_id = f"{enqueued_function.__name__}_{datetime.now().strftime(r'%Y%m%d%H%M%S')}_{random_string()}"
-            
+        job_id = RQTaskUtils.new_job_id(enqueued_function.__name__)
         task_kwargs['queue_id'] = job_id
 
         # An explicitly supplied enqueue_call_kwargs timeout takes precedence,
@@ -1181,6 +1480,67 @@ class RQTaskUtils:
         results["task_id"] = job_id
         return results
     
+    @staticmethod
+    def enqueue_many(db, tasks: list, enqueue_call_kwargs: Union[dict, None] = None,
+                     task_info: Union[dict, None] = None,
+                     timeout: Union[int, None] = None):
+        """
+        Adds several functions to the rq task queue at once. The jobs are pushed to Redis in a single pipeline and
+        their worker_tasks records are written with one multi-row insert and one commit, so enqueuing thousands of
+        tasks costs a couple of round trips instead of several per task. As with enqueue_new_task, each function must
+        have a 'queue_id' parameter.
+        :param tasks: list of (function, kwargs) tuples. A tuple may also have a third element, a task_info dict for
+        that task, and a fourth, enqueue call kwargs for that task that take precedence over enqueue_call_kwargs.
+        :param enqueue_call_kwargs: rq enqueue kwargs shared by all of the tasks, eg result_ttl.
+        :param task_info: task_results stored in the worker_tasks record of tasks that do not have their own.
+        :param timeout: timeout for the functions. Measured in seconds.
+        :return: list of dictionaries containing information about each task, including the task id, in the order
+        of tasks.
+        """
+        shared_call_kwargs = dict(enqueue_call_kwargs) if enqueue_call_kwargs is not None else {}
+        if 'timeout' not in shared_call_kwargs:
+            shared_call_kwargs['timeout'] = timeout
+
+        queue = flask.current_app.q
+        job_datas = []
+        task_records = []
+        for task in tasks:
+            enqueued_function, task_kwargs = task[0], dict(task[1] or {})
+            this_task_info = dict(task[2]) if len(task) > 2 and task[2] is not None else dict(task_info or {})
+            call_kwargs = {**shared_call_kwargs, **(task[3] if len(task) > 3 and task[3] else {})}
+            job_id = RQTaskUtils.new_job_id(enqueued_function.__name__)
+            task_kwargs['queue_id'] = job_id
+            job_datas.append(queue.prepare_data(func=enqueued_function,
+                                                kwargs=task_kwargs,
+                                                job_id=job_id,
+                                                **call_kwargs))
+            task_records.append({"task_id": job_id,
+                                 "function_name": enqueued_function.__name__,
+                                 "status": "queued",
+                                 "task_results": this_task_info})
+        if not job_datas:
+            return []
+
+        try:
+            jobs = queue.enqueue_many(job_datas)
+
+        except redis.exceptions.ConnectionError:
+            raise ConnectionError("Failed to connect to the Redis instance. Please ensure that the Redis server is running and accessible.")
+
+        time_enqueued = datetime.now()
+        for record, job in zip(task_records, jobs):
+            record["time_enqueued"] = time_enqueued
+            record["origin"] = job.origin
+        db.session.execute(insert(WorkerTaskModel), task_records)
+        db.session.commit()
+
+        results = []
+        for job in jobs:
+            job_results = job.__dict__
+            job_results["task_id"] = job.id
+            results.append(job_results)
+        return results
+
     @staticmethod
     def update_task_subroutine(sql_db, q_id, new_status=None, task_results=None):
         """
@@ -1238,6 +1598,170 @@ class RQTaskUtils:
         sql_db.session.commit()
 
 
+class TaskProgressReporter:
+    """
+    Coalesces the progress updates of a long running rq task. Every update refreshes live counters in a Redis hash
+    (task_progress:<task id>), which is cheap, while the worker_tasks.task_results JSON is only rewritten at most every
+    flush_seconds and at completion. Lists in the task log, such as error lists, are capped to max_list_items in the
+    stored summary; the items beyond the cap are spilled to a Redis list (task_progress:<task id>:<key>) that expires
+    after spill_ttl seconds, and the summary records how many there were and where they went. This keeps the number
+    and the size of worker_tasks writes bounded no matter how long the task runs.
+
+    Example:
+        reporter = TaskProgressReporter(q_id=queue_id, sql_db=db)
+        reporter.initiate(task_log)
+        for item in items:
+            ...
+            reporter.update(task_log)
+        reporter.complete(task_log)
+    """
+
+    def __init__(self, q_id: str, sql_db, flush_seconds: float = None, max_list_items: int = None,
+                 spill_ttl: int = None, redis_conn=None):
+        """
+        :param q_id: the task id of the task being executed
+        :param sql_db: the database object
+        :param flush_seconds: minimum time between worker_tasks writes. Defaults to the TASK_PROGRESS_FLUSH_SECONDS app
+        config value (30).
+        :param max_list_items: number of items of each list kept in worker_tasks. Defaults to the
+        TASK_RESULTS_MAX_LIST_ITEMS app config value (100).
+        :param spill_ttl: lifetime in seconds of the Redis keys. Defaults to the TASK_PROGRESS_SPILL_TTL app config value
+        (7 days).
+        :param redis_conn: Redis connection. Defaults to the connection of the app's rq queue.
+        """
+        config = flask.current_app.config if flask.has_app_context() else {}
+        self.q_id = q_id
+        self.sql_db = sql_db
+        self.flush_seconds = float(flush_seconds if flush_seconds is not None else config.get("TASK_PROGRESS_FLUSH_SECONDS", 30))
+        self.max_list_items = int(max_list_items if max_list_items is not None else config.get("TASK_RESULTS_MAX_LIST_ITEMS", 100))
+        self.spill_ttl = int(spill_ttl if spill_ttl is not None else config.get("TASK_PROGRESS_SPILL_TTL", 7 * 24 * 3600))
+        if redis_conn is None and flask.has_app_context() and getattr(flask.current_app, "q", None):
+            redis_conn = flask.current_app.q.connection
+        self.redis = redis_conn
+        self.progress_key = f"task_progress:{q_id}"
+        self._spilled_counts = {}
+        self._last_flush = 0.0
+
+    @staticmethod
+    def live_progress(q_id: str, redis_conn=None):
+        """
+        Reads the live progress counters of a task.
+        :param q_id: the task id
+        :param redis_conn: Redis connection. Defaults to the connection of the app's rq queue.
+        :return: dictionary of counter names to values (as strings)
+        """
+        redis_conn = redis_conn or flask.current_app.q.connection
+        progress = redis_conn.hgetall(f"task_progress:{q_id}")
+        return {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+                for k, v in progress.items()}
+
+    def initiate(self, task_log: dict = None):
+        """Marks the task as started, storing the compact form of task_log."""
+        self._last_flush = time.time()
+        RQTaskUtils.initiate_task_subroutine(q_id=self.q_id, sql_db=self.sql_db,
+                                             task_result=self.summarize(task_log or {}))
+
+    @property
+    def flush_due(self):
+        """Whether the next update will write worker_tasks (and so commit the task's database session)."""
+        return (time.time() - self._last_flush) >= self.flush_seconds
+
+    def update(self, task_log: dict, force: bool = False):
+        """
+        Records progress. Live counters are always written to Redis; worker_tasks is only written if flush_seconds
+        have passed since the last write, or if force is True.
+        """
+        self._write_live_counters(task_log)
+        if force or self.flush_due:
+            self._last_flush = time.time()
+            RQTaskUtils.update_task_subroutine(sql_db=self.sql_db, q_id=self.q_id,
+                                               task_results=self.summarize(task_log))
+
+    def complete(self, task_log: dict):
+        """Marks the task as finished, storing the compact form of task_log."""
+        self._write_live_counters(task_log)
+        RQTaskUtils.complete_task_subroutine(q_id=self.q_id, sql_db=self.sql_db, task_result=self.summarize(task_log))
+
+    def failed(self, task_log: dict):
+        """Marks the task as failed, storing the compact form of task_log."""
+        self._write_live_counters(task_log)
+        RQTaskUtils.failed_task_subroutine(q_id=self.q_id, sql_db=self.sql_db, task_result=self.summarize(task_log))
+
+    def summarize(self, task_log: dict, _key_path: str = ""):
+        """
+        Returns a copy of task_log in which every list is capped to max_list_items. Items beyond the cap are spilled to
+        Redis (once each, across calls) and replaced by '<key> (total)' and '<key> (spilled to)' entries.
+        """
+        summary = {}
+        for key, value in task_log.items():
+            key_path = f"{_key_path}:{key}" if _key_path else str(key)
+            if isinstance(value, dict):
+                summary[key] = self.summarize(value, _key_path=key_path)
+            elif isinstance(value, (list, tuple)) and len(value) > self.max_list_items:
+                summary[key] = list(value[:self.max_list_items])
+                summary[f"{key} (total)"] = len(value)
+                spill_key = self._spill(key_path, value[self.max_list_items:])
+                if spill_key:
+                    summary[f"{key} (spilled to)"] = spill_key
+            else:
+                summary[key] = value
+        return summary
+
+    def _spill(self, key_path: str, overflow: list):
+        """
+        Appends the overflow items not spilled yet to a Redis list.
+        :return: the Redis key of the list, or None if Redis is not available
+        """
+        if self.redis is None:
+            return None
+        spill_key = f"{self.progress_key}:{key_path}"
+        already_spilled = self._spilled_counts.get(key_path, 0)
+        new_items = overflow[already_spilled:]
+        try:
+            if new_items:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.rpush(spill_key, *[json.dumps(item, default=str) for item in new_items])
+                pipe.expire(spill_key, self.spill_ttl)
+                pipe.execute()
+                self._spilled_counts[key_path] = already_spilled + len(new_items)
+            return spill_key
+        except redis.exceptions.RedisError:
+            return None
+
+    @staticmethod
+    def _counters(task_log: dict, _key_path: str = ""):
+        """Flattens task_log to its scalar values and list lengths, joining nested keys with ':'."""
+        counters = {}
+        for key, value in task_log.items():
+            key_path = f"{_key_path}:{key}" if _key_path else str(key)
+            if isinstance(value, dict):
+                counters.update(TaskProgressReporter._counters(value, _key_path=key_path))
+            elif isinstance(value, (list, tuple)):
+                counters[key_path] = len(value)
+            elif isinstance(value, (int, float, str, bool)):
+                counters[key_path] = str(value)
+        return counters
+
+    def _write_live_counters(self, task_log: dict):
+        """Writes the flattened counters of task_log to the task's Redis hash."""
+        if self.redis is None:
+            return
+        counters = self._counters(task_log)
+        if not counters:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(self.progress_key, mapping=counters)
+            pipe.expire(self.progress_key, self.spill_ttl)
+            pipe.execute()
+        except redis.exceptions.RedisError:
+            pass
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=RQTaskUtils._reset_job_id_token)
+
+
 class ArchivesPathException(Exception):
     """Exception raised for errors in the structure of the archives server."""
     def __init__(self, message):
@@ -0,0 +1,178 @@
+# benchmarks/content_search_benchmark.py
+"""
+Compares unscoped archive content search before and after two-phase retrieval: the single-phase query, which ranks
+the matching chunks of the latest chunk sets with ts_rank_cd and keeps the best :chunk_candidate_limit of them
+before grouping by file, against archive_search._content_search_sql, which finds the matching files from the GIN
+index first and ranks their chunks. The two-phase query runs uncapped, which is the exact ranking every top-50
+overlap is measured against, and with --candidate-file-limit. Runs on a synthetic corpus of --chunks chunks.
+
+Run from the repository root with the app config available (as with run.py):
+
+    python -m benchmarks.content_search_benchmark --chunks 700000
+
+The corpus is written to TEMP tables named files and file_content_fts_chunks, which shadow the real tables for the
+benchmark's own connection only, so both queries run unchanged and nothing is written to the real tables. Chunk
+words are drawn from a skewed vocabulary ('w0' is the most frequent word), so queries range from matching most
+chunks to matching a few.
+"""
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import text
+
+from archives_application import create_app
+from archives_application.archiver.archive_search import _content_search_sql
+
+SETUP_STATEMENTS = [
+    """
+    CREATE TEMP TABLE files (
+        id bigint PRIMARY KEY,
+        hash text UNIQUE NOT NULL,
+        extension text
+    ) ON COMMIT PRESERVE ROWS
+    """,
+    """
+    CREATE TEMP TABLE file_content_fts_chunks (
+        id bigint PRIMARY KEY,
+        file_hash text NOT NULL,
+        chunk_index integer NOT NULL,
+        chunk_text text NOT NULL,
+        search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', coalesce(chunk_text, ''))) STORED,
+        chunked_at timestamptz NOT NULL,
+        is_current boolean NOT NULL DEFAULT true,
+        UNIQUE (file_hash, chunk_index, chunked_at)
+    ) ON COMMIT PRESERVE ROWS
+    """,
+    """
+    INSERT INTO files (id, hash, extension)
+    SELECT g, 'h' || g::text, (ARRAY['pdf', 'docx', 'txt'])[g % 3 + 1]
+    FROM generate_series(0, :chunks / :chunks_per_file) AS g
+    """,
+    """
+    INSERT INTO file_content_fts_chunks (id, file_hash, chunk_index, chunk_text, chunked_at)
+    SELECT g,
+           'h' || (g / :chunks_per_file)::text,
+           g % :chunks_per_file,
+           (SELECT string_agg('w' || floor(:vocabulary * power(random(), 3))::int::text, ' ')
+            FROM generate_series(1, :words) WHERE g >= 0),
+           now()
+    FROM generate_series(0, :chunks - 1) AS g
+    """,
+    "CREATE INDEX ON file_content_fts_chunks USING gin (search_vector) WHERE is_current",
+    "CREATE INDEX ON file_content_fts_chunks USING gin (search_vector)",
+    "ANALYZE files",
+    "ANALYZE file_content_fts_chunks",
+]
+
+UNSCOPED_CTE = "scoped_file_hashes AS (SELECT f.hash AS file_hash FROM files f)"
+
+SINGLE_PHASE_SQL = f"""
+    WITH q AS (
+        SELECT websearch_to_tsquery('simple', :query_text) AS query
+    ),
+    {UNSCOPED_CTE},
+    latest_chunk_sets AS (
+        SELECT c.file_hash, max(c.chunked_at) AS chunked_at
+        FROM file_content_fts_chunks c
+        JOIN scoped_file_hashes sfh ON sfh.file_hash = c.file_hash
+        GROUP BY c.file_hash
+    ),
+    matching_chunks AS (
+        SELECT
+            c.file_hash,
+            c.id AS chunk_id,
+            c.chunk_index,
+            ts_rank_cd(c.search_vector, q.query) AS chunk_rank
+        FROM file_content_fts_chunks c
+        JOIN latest_chunk_sets lcs
+          ON lcs.file_hash = c.file_hash
+         AND lcs.chunked_at = c.chunked_at
+        JOIN scoped_file_hashes sfh ON sfh.file_hash = c.file_hash
+        JOIN files f ON f.hash = c.file_hash
+        CROSS JOIN q
+        WHERE c.search_vector @@ q.query
+        ORDER BY chunk_rank DESC
+        LIMIT :chunk_candidate_limit
+    ),
+    file_scores AS (
+        SELECT
+            file_hash,
+            max(chunk_rank) AS content_rank,
+            count(*) AS matching_chunks,
+            (array_agg(chunk_id ORDER BY chunk_rank DESC, chunk_index ASC))[1] AS best_chunk_id
+        FROM matching_chunks
+        GROUP BY file_hash
+    )
+    SELECT *
+    FROM file_scores
+    ORDER BY content_rank DESC, matching_chunks DESC, file_hash ASC
+    LIMIT :file_limit
+"""
+
+
+def timed(conn, sql, params, repeat):
+    conn.execute(text(sql), params).all()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(text(sql), params).all()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=700_000)
+    parser.add_argument("--chunks-per-file", type=int, default=10)
+    parser.add_argument("--words", type=int, default=60, help="words per chunk")
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--file-limit", type=int, default=500)
+    parser.add_argument("--candidate-file-limit", type=int, default=20000,
+                        help="as ARCHIVE_SEARCH_CANDIDATE_FILE_LIMIT")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    queries = ["w0", "w3", "w40", "w900", "w2 w9", "w12 -w0"]
+    two_phase_sql = _content_search_sql(UNSCOPED_CTE, "", "TRUE")
+
+    app = create_app()
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        with db.engine.connect() as conn:
+            setup_start = time.perf_counter()
+            for statement in SETUP_STATEMENTS:
+                conn.execute(text(statement), {"chunks": args.chunks, "chunks_per_file": args.chunks_per_file,
+                                               "words": args.words, "vocabulary": args.vocabulary})
+            print(f"{args.chunks} synthetic chunks built in {time.perf_counter() - setup_start:.0f}s")
+
+            params = {
+                "file_limit": args.file_limit,
+                "candidate_file_limit": max(args.file_limit, args.candidate_file_limit),
+                "chunk_candidate_limit": min(50000, max(1000, args.file_limit * 20)),
+            }
+            exact_params = dict(params, candidate_file_limit=2 ** 31 - 1)
+            print(f"{'query':<12}{'matching':>10}{'exact ms':>10}{'single ms':>11}{'top-50':>8}"
+                  f"{'two-phase ms':>14}{'top-50':>8}")
+            for query_text in queries:
+                params["query_text"] = exact_params["query_text"] = query_text
+                matching = conn.execute(text(
+                    "SELECT count(*) FROM file_content_fts_chunks "
+                    "WHERE is_current AND search_vector @@ websearch_to_tsquery('simple', :query_text)"
+                ), params).scalar()
+                exact_ms, exact_rows = timed(conn, two_phase_sql, exact_params, args.repeat)
+                single_ms, single_rows = timed(conn, SINGLE_PHASE_SQL, params, args.repeat)
+                two_phase_ms, two_phase_rows = timed(conn, two_phase_sql, params, args.repeat)
+                exact_top = {row.file_hash for row in exact_rows[:50]}
+
+                def overlap(rows):
+                    return f"{len(exact_top & {row.file_hash for row in rows[:50]})}/{len(exact_top)}"
+
+                print(f"{query_text:<12}{matching:>10}{exact_ms:>10.1f}{single_ms:>11.1f}{overlap(single_rows):>8}"
+                      f"{two_phase_ms:>14.1f}{overlap(two_phase_rows):>8}")
+            conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/enqueue_benchmark.py
+"""
+Measures RQTaskUtils.enqueue_new_task latency under a burst of enqueues, to check that it stays flat as the number
+of tasks enqueued in the same second grows.
+
+Run from the repository root with the app config available (as with run.py):
+
+    python -m benchmarks.enqueue_benchmark --tasks 5000
+
+Jobs go to a separate 'enqueue_benchmark' queue that no worker listens to. The queue is emptied and the
+worker_tasks rows created by the run are deleted afterwards.
+"""
+
+import argparse
+import statistics
+import time
+
+import rq
+
+from archives_application import create_app, utils
+from archives_application.models import WorkerTaskModel
+
+
+def enqueue_benchmark_noop(queue_id: str):
+    """Task that is enqueued by the benchmark but never run."""
+    return queue_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--window", type=int, default=250, help="number of enqueues per reported window")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        benchmark_queue = rq.Queue("enqueue_benchmark", connection=app.q.connection)
+        default_queue, app.q = app.q, benchmark_queue
+        latencies = []
+        try:
+            for _ in range(args.tasks):
+                start = time.perf_counter()
+                utils.RQTaskUtils.enqueue_new_task(db=db, enqueued_function=enqueue_benchmark_noop)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            app.q = default_queue
+            benchmark_queue.empty()
+            db.session.query(WorkerTaskModel)\
+                .filter(WorkerTaskModel.function_name == enqueue_benchmark_noop.__name__)\
+                .delete(synchronize_session=False)
+            db.session.commit()
+
+    print(f"{len(latencies)} enqueues, {sum(latencies):.2f}s total")
+    print(f"{'window':>12}{'median ms':>12}{'p99 ms':>12}")
+    for window_start in range(0, len(latencies), args.window):
+        window = sorted(latencies[window_start:window_start + args.window])
+        p99 = window[min(len(window) - 1, int(len(window) * 0.99))]
+        print(f"{window_start:>6}-{window_start + len(window):<5}{statistics.median(window) * 1000:>12.2f}{p99 * 1000:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/filename_search_benchmark.py
+"""
+Compares archive filename searches that compute to_tsvector on every file_locations row at query time with searches
+on the stored, GIN-indexed filename_tsv / filepath_tsv columns, using EXPLAIN ANALYZE on a synthetic table of
+--rows locations.
+
+Run from the repository root with the app config available (as with run.py):
+
+    python -m benchmarks.filename_search_benchmark --rows 1000000
+
+The synthetic table is a TEMP table with the same generated vectors and GIN indexes as file_locations, so nothing is
+written to the real tables.
+"""
+
+import argparse
+import json
+
+from sqlalchemy import text
+
+from archives_application import create_app
+
+SETUP_STATEMENTS = [
+    r"""
+    CREATE TEMP TABLE bench_file_locations (
+        id bigint PRIMARY KEY,
+        file_server_directories text,
+        filename text,
+        filename_tsv tsvector GENERATED ALWAYS AS
+            (to_tsvector('english', regexp_replace(coalesce(filename, ''), '\.', ' ', 'g'))) STORED,
+        filepath_tsv tsvector GENERATED ALWAYS AS
+            (to_tsvector('english', regexp_replace(coalesce(filename, ''), '\.', ' ', 'g'))
+             || to_tsvector('english', coalesce(file_server_directories, ''))) STORED
+    ) ON COMMIT PRESERVE ROWS
+    """,
+    """
+    INSERT INTO bench_file_locations (id, file_server_directories, filename)
+    SELECT g,
+           concat_ws('/', 'Projects', (g % :projects)::text || '-Project', 'F' || (g % 7)::text),
+           (ARRAY['Drawings', 'Geotechnical', 'Invoice', 'Submittal', 'Specs'])[g % 5 + 1]
+               || '_' || (g % 997)::text || '_' || g::text || '.pdf'
+    FROM generate_series(1, :rows) AS g
+    """,
+    "CREATE INDEX ON bench_file_locations USING gin (filename_tsv)",
+    "CREATE INDEX ON bench_file_locations USING gin (filepath_tsv)",
+    "ANALYZE bench_file_locations",
+]
+
+COMPUTED_FILENAME_VECTOR = r"to_tsvector('english', regexp_replace(coalesce(filename, ''), '\.', ' ', 'gi'))"
+COMPUTED_FILEPATH_VECTOR = COMPUTED_FILENAME_VECTOR \
+    + " || to_tsvector('english', coalesce(file_server_directories, ''))"
+
+
+def search_sql(vector: str) -> str:
+    return f"""
+        SELECT count(*), max(ts_rank_cd({vector}, q.query))
+        FROM bench_file_locations CROSS JOIN websearch_to_tsquery('english', :query_text) AS q(query)
+        WHERE {vector} @@ q.query
+    """
+
+
+def explain(conn, sql, params):
+    plan = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    plan = plan[0]
+    node = plan["Plan"]
+    while node.get("Plans") and node["Node Type"] in ("Aggregate", "Gather", "Finalize Aggregate",
+                                                       "Partial Aggregate", "Nested Loop", "Bitmap Heap Scan"):
+        node = node["Plans"][-1]
+    return {"scan": node["Node Type"], "rows": conn.execute(text(sql), params).first()[0], "ms": plan["Execution Time"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--projects", type=int, default=5000)
+    args = parser.parse_args()
+
+    queries = ["geotechnical", "invoice 42", "submittal -specs", "42-Project drawings"]
+
+    app = create_app()
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        with db.engine.connect() as conn:
+            for statement in SETUP_STATEMENTS:
+                conn.execute(text(statement), {"rows": args.rows, "projects": args.projects})
+
+            print(f"{args.rows} synthetic locations")
+            print(f"{'query':<24}{'mode':<10}{'vector':<10}{'scan':<22}{'rows':>9}{'ms':>10}")
+            for query_text in queries:
+                for mode, computed, stored in (("filename", COMPUTED_FILENAME_VECTOR, "filename_tsv"),
+                                               ("filepath", COMPUTED_FILEPATH_VECTOR, "filepath_tsv")):
+                    for label, vector in (("computed", computed), ("stored", stored)):
+                        result = explain(conn, search_sql(vector), {"query_text": query_text})
+                        print(f"{query_text:<24}{mode:<10}{label:<10}{result['scan']:<22}{result['rows']:>9}"
+                              f"{result['ms']:>10.2f}")
+            conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
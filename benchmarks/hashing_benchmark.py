@@ -0,0 +1,98 @@
+# benchmarks/hashing_benchmark.py
+"""
+Measures FilesUtils.get_hash throughput (MB/s) for each hashing strategy and a few buffer sizes so that the
+HASH_STRATEGY and HASH_MAX_BUFFER_SIZE defaults can be chosen from measurements on the actual file server.
+
+Run from the repository root (the app config json needs to be discoverable, as with run.py):
+
+    python -m benchmarks.hashing_benchmark                       # synthetic files in a temp directory
+    python -m benchmarks.hashing_benchmark /mnt/archives/some/dir  # real files, e.g. on the CIFS mount
+
+When a directory is given, the largest files in it (up to --max-files) are hashed. Each file is read once
+before timing so that every strategy sees the same cache state; pass --cold to skip that warm-up on mounts
+where the OS cache can be dropped between runs.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from archives_application.utils import FilesUtils
+
+MB = 1024 * 1024
+SYNTHETIC_SIZES = [64 * 1024, 4 * MB, 64 * MB, 256 * MB]
+BUFFER_SIZES = [1024, 64 * 1024, 1 * MB, 4 * MB, None]
+
+
+def synthetic_files(directory):
+    paths = []
+    for size in SYNTHETIC_SIZES:
+        path = os.path.join(directory, f"synthetic_{size}.bin")
+        with open(path, "wb") as f:
+            remaining = size
+            while remaining:
+                chunk = min(remaining, 8 * MB)
+                f.write(os.urandom(chunk))
+                remaining -= chunk
+        paths.append(path)
+    return paths
+
+
+def largest_files(directory, max_files):
+    candidates = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                candidates.append((os.path.getsize(path), path))
+            except OSError:
+                continue
+    candidates.sort(reverse=True)
+    return [path for _, path in candidates[:max_files]]
+
+
+def run(paths, repeats, warm):
+    total_bytes = sum(os.path.getsize(p) for p in paths)
+    if warm:
+        for path in paths:
+            FilesUtils.get_hash(path, strategy='readinto')
+
+    results = []
+    for strategy in FilesUtils.HASH_STRATEGIES:
+        buffer_sizes = [None] if strategy in ('mmap', 'file_digest') else BUFFER_SIZES
+        for buffer_size in buffer_sizes:
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                for path in paths:
+                    FilesUtils.get_hash(path, strategy=strategy, buffer_size=buffer_size)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            label = "adaptive" if buffer_size is None else f"{buffer_size // 1024} KiB"
+            results.append((strategy, label, total_bytes / MB / best if best else float('inf')))
+    return total_bytes, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", help="directory of real files to hash")
+    parser.add_argument("--max-files", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--cold", action="store_true", help="skip the warm-up read")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = largest_files(args.directory, args.max_files) if args.directory else synthetic_files(temp_dir)
+        if not paths:
+            parser.error(f"No readable files found in {args.directory}")
+        total_bytes, results = run(paths, repeats=args.repeats, warm=not args.cold)
+
+    print(f"{len(paths)} files, {total_bytes / MB:.1f} MB, best of {args.repeats}")
+    print(f"{'strategy':<12}{'buffer':>12}{'MB/s':>12}")
+    for strategy, label, mb_per_s in sorted(results, key=lambda r: r[2], reverse=True):
+        print(f"{strategy:<12}{label:>12}{mb_per_s:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/path_prefix_benchmark.py
+"""
+Compares subtree queries on file_locations written as `file_server_directories LIKE 'prefix%'` with the range
+comparisons on the normalized directory_path column (FileServerUtils.db_subtree_sql), using EXPLAIN ANALYZE on a
+synthetic table of --rows locations.
+
+Run from the repository root with the app config available (as with run.py):
+
+    python -m benchmarks.path_prefix_benchmark --rows 1000000
+
+The synthetic table is a TEMP table with the same directory_path expression and text_pattern_ops index as
+file_locations, so nothing is written to the real tables. About a tenth of the rows use backslash separators, like
+the legacy rows in file_locations.
+"""
+
+import argparse
+import json
+
+from sqlalchemy import text
+
+from archives_application import create_app, utils
+
+SETUP_STATEMENTS = [
+    """
+    CREATE TEMP TABLE bench_file_locations (
+        id bigint PRIMARY KEY,
+        file_server_directories text,
+        filename text,
+        directory_path text GENERATED ALWAYS AS
+            (ltrim(regexp_replace(coalesce(file_server_directories, '') || '/', '[\\\\/]+', '/', 'g'), '/')) STORED
+    ) ON COMMIT PRESERVE ROWS
+    """,
+    """
+    INSERT INTO bench_file_locations (id, file_server_directories, filename)
+    SELECT g,
+           concat_ws(CASE WHEN g % 10 = 0 THEN '\\' ELSE '/' END,
+                     'Projects', (g % :projects)::text || '-Project', 'F' || (g % 7)::text,
+                     CASE WHEN g % 3 = 0 THEN 'Sub' || (g % 11)::text END),
+           'file_' || g::text || '.pdf'
+    FROM generate_series(1, :rows) AS g
+    """,
+    "CREATE INDEX ON bench_file_locations (file_server_directories text_pattern_ops)",
+    "CREATE INDEX ON bench_file_locations (directory_path text_pattern_ops)",
+    "ANALYZE bench_file_locations",
+]
+
+
+def explain(conn, sql, params):
+    plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    plan = plan[0]
+    node = plan["Plan"]
+    while node.get("Plans") and node["Node Type"] in ("Aggregate", "Gather", "Finalize Aggregate",
+                                                       "Partial Aggregate", "Bitmap Heap Scan"):
+        node = node["Plans"][0]
+    return {"scan": node["Node Type"],
+            "rows": conn.execute(text(sql), params).scalar(),
+            "ms": plan["Execution Time"],
+            "buffers": plan["Plan"].get("Shared Hit Blocks", 0) + plan["Plan"].get("Shared Read Blocks", 0)
+                       + plan["Plan"].get("Local Hit Blocks", 0) + plan["Plan"].get("Local Read Blocks", 0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--projects", type=int, default=5000)
+    args = parser.parse_args()
+
+    prefixes = ["Projects/42-Project", "Projects/42-Project/F3", "Projects/1_-Project", "Projects"]
+
+    app = create_app()
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        with db.engine.connect() as conn:
+            for statement in SETUP_STATEMENTS:
+                conn.execute(text(statement), {"rows": args.rows, "projects": args.projects})
+
+            print(f"{args.rows} synthetic locations")
+            print(f"{'prefix':<26}{'query':<8}{'scan':<18}{'rows':>9}{'ms':>10}{'buffers':>10}")
+            for prefix in prefixes:
+                like_sql = "SELECT count(*) FROM bench_file_locations WHERE file_server_directories LIKE :pattern"
+                range_params = {}
+                range_sql = "SELECT count(*) FROM bench_file_locations WHERE " \
+                            + utils.FileServerUtils.db_subtree_sql("directory_path", prefix, range_params)
+                for label, sql, params in (("like", like_sql, {"pattern": f"{prefix}%"}),
+                                           ("range", range_sql, range_params)):
+                    result = explain(conn, sql, params)
+                    print(f"{prefix:<26}{label:<8}{result['scan']:<18}{result['rows']:>9}"
+                          f"{result['ms']:>10.2f}{result['buffers']:>10}")
+            conn.rollback()
+
+
+if __name__ == "__main__":
+    main()